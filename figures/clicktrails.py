@@ -9,6 +9,7 @@ import mongoengine
 
 import xtools
 from xtools.mongo.data import XData
+from xtools.munge import time as xmt
 from xtools.figures import formats as xff
 from xtools.figures import course_structure as CS
 
@@ -31,8 +32,8 @@ class ClickTrails(object):
             os.makedirs(self.figpath)
 
         ### Parse first and last times
-        self.person.start_time = self.person[self.person.start_time.notnull()==True].start_time.apply(lambda x: np.datetime64(x))
-        self.person['last_event'] = self.person[self.person.last_event.notnull()==True]['last_event'].apply(lambda x: np.datetime64(x) if x[-1]!='d' else np.datetime64(x[:-1]))
+        self.person.start_time = xmt.to_datetimes(self.person.start_time)
+        self.person['last_event'] = xmt.to_datetimes(self.person.last_event)
 
         ### Course Axis
         ### Initiate Course Axis
@@ -82,11 +83,14 @@ class ClickTrails(object):
         -------
         None
         """
-        grouped = self.potime.groupby('username')
+        ### Parse all times at once
+        potime = self.potime.loc[:,['username','time']]
+        potime['time'] = xmt.to_datetimes(potime.time)
+        grouped = potime.groupby('username')
         
         time_spent = pd.Series()
         for n,g in grouped:
-            ut = g.sort('time').time.apply(np.datetime64)
+            ut = g.sort('time').time
             if len(g) > 1:
                 ### Time Spent
                 ut = (ut.diff()/np.timedelta64(1, 's')).shift(-1)
@@ -10,6 +10,7 @@ import mongoengine
 
 import xtools
 from xtools.figures import formats as xff
+from xtools.munge import time as xmt
 
 class DiscussionMetrics(object):
     '''
@@ -45,9 +46,9 @@ class DiscussionMetrics(object):
         ### Load Forum Data
         self.forum = xdata.get('forum_data',mongo_id=True)
 
-        self.forum['created_at'] = self.forum['created_at'].apply(lambda x: pd.to_datetime(x) if pd.notnull(x) else None)
+        self.forum['created_at'] = xmt.to_datetimes(self.forum['created_at'])
         # forum['last_activity_at'] = forum['last_activity_at'].apply(lambda x: np.datetime64(munge_time(x)) if pd.notnull(x) else None)
-        self.forum['updated_at'] = self.forum['updated_at'].apply(lambda x: pd.to_datetime(x) if pd.notnull(x) else None)
+        self.forum['updated_at'] = xmt.to_datetimes(self.forum['updated_at'])
 
         self.forum['up_count'] = self.forum.votes.apply(lambda x: x['up_count'] if 'up_count' in x else None) 
         self.forum['up_user_id'] = self.forum.votes.apply(lambda x: x['up'] if 'up' in x else None) 
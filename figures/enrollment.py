@@ -10,6 +10,7 @@ import json
 import mongoengine
 
 from xtools.mongo.data import XData
+from xtools.munge import time as xmt
 from xtools.figures import formats as xff
 class Enrollment(object):
     '''
@@ -45,12 +46,12 @@ class Enrollment(object):
         #------------------------------------------------------------
         ### Enrollment Data
         if 'start_time' in self.person:
-            self.person.start_time = self.person[self.person.start_time.notnull()==True].start_time.apply(lambda x: np.datetime64(x))
+            self.person.start_time = xmt.to_datetimes(self.person.start_time)
         elif 'start_time_DI' in self.person:
             self.person.start_time = self.person.start_time_DI
 
         if 'last_event' in self.person:
-            self.person['last_event'] = self.person[self.person.last_event.notnull()==True]['last_event'].apply(lambda x: np.datetime64(x) if x[-1]!='d' else np.datetime64(x[:-1]))
+            self.person['last_event'] = xmt.to_datetimes(self.person.last_event)
         elif 'last_event_DI' in self.person:
             self.person.last_event = self.person.last_event_DI#.apply(date_transform)
 
@@ -9,6 +9,7 @@ import mongoengine
 
 from xtools.figures import formats as xff
 from xtools.mongo.data import XData
+from xtools.munge import time as xmt
 
 class Outcomes(object):
     '''
@@ -29,8 +30,8 @@ class Outcomes(object):
             os.makedirs(self.figpath)
 
         ### Parse first and last times
-        self.person.start_time = self.person[self.person.start_time.notnull()==True].start_time.apply(lambda x: np.datetime64(x))
-        self.person['last_event'] = self.person[self.person.last_event.notnull()==True]['last_event'].apply(lambda x: np.datetime64(x) if x[-1]!='d' else np.datetime64(x[:-1]))
+        self.person.start_time = xmt.to_datetimes(self.person.start_time)
+        self.person['last_event'] = xmt.to_datetimes(self.person.last_event)
 
 
         ### Course Info
@@ -1,5 +1,6 @@
 from data import XData
 from collection import Collection
+from query import Query
 
 import parsers
 import catalogs
\ No newline at end of file
@@ -0,0 +1,327 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import cPickle as pickle
+from collections import OrderedDict
+
+import numpy as np
+from pandas import DataFrame
+from bson import json_util
+
+from ..munge.names import to_filename
+from ..munge.memory import estimate_nbytes
+
+class ResultCache(object):
+    '''
+    In memory cache of query results shared by everything using an XData
+    instance. Results are keyed by the database they were read from, their
+    Query and whether they include the mongo "_id". The least recently used
+    results are evicted once the cache grows beyond its byte budget.
+
+    Besides exact matches, a query can be answered from a cached result of a
+    broader query, e.g. one with fewer conditions or more fields, by applying
+    the remaining conditions, fields, sort and limit in memory.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Budget for the estimated size of all cached DataFrames. Results bigger
+        than the budget aren't cached.
+    '''
+    def __init__(self, max_bytes = 2**30):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # {(db, query, mongo_id) -> (df, nbytes)}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, db, query, mongo_id = False):
+        '''
+        Looks for the results of a query read from db
+
+        Parameters
+        ----------
+        db : str
+            Name of the database
+        query : Query
+        mongo_id : boolean
+            Whether the results include the mongo "_id"
+
+        Returns
+        -------
+        df : DataFrame
+            A copy of the results, which is safe to modify, or None if the
+            query can't be answered from the cache
+        '''
+        key = (db, query, mongo_id)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[0].copy()
+
+            # Newest entries are the most likely to be relevant
+            for (cached_db, cached, cached_id), entry in \
+                    reversed(self._entries.items()):
+                if (cached_db != db) or (cached_id != mongo_id):
+                    continue
+                if not cached.covers(query):
+                    continue
+                df = cached.residual(query).apply(entry[0])
+                if df is not None:
+                    # Refreshes the superset's position in the LRU order
+                    key = (cached_db, cached, cached_id)
+                    self._entries[key] = self._entries.pop(key)
+                    self.hits += 1
+                    return df
+
+            self.misses += 1
+            return None
+
+    def put(self, db, query, data, mongo_id = False):
+        '''
+        Caches the results of a query read from db
+
+        Parameters
+        ----------
+        db : str
+            Name of the database
+        query : Query
+        data : DataFrame
+            Results of the query. The DataFrame shouldn't be modified after it
+            is cached.
+        mongo_id : boolean
+            Whether the results include the mongo "_id"
+
+        Returns
+        -------
+        cached : boolean
+            False if the data is too big for the cache
+        '''
+        nbytes = estimate_nbytes(data)
+        if nbytes > self.max_bytes:
+            return False
+
+        key = (db, query, mongo_id)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (data, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+        return True
+
+    def invalidate(self, collection_name = None, course_id = None):
+        '''
+        Removes cached results for a collection and/or a course. By default
+        everything is removed.
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the data collection.
+        course_id : str
+            The course_id condition of the cached queries
+        '''
+        with self._lock:
+            for key in self._entries.keys():
+                query = key[1]
+                if collection_name and query.collection_name != collection_name:
+                    continue
+                if course_id and \
+                        query.conditions.get('course_id') != course_id:
+                    continue
+                self._discard(key)
+
+    def clear(self):
+        '''
+        Removes all cached results
+        '''
+        self.invalidate()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+class DiskCache(object):
+    '''
+    Local columnar cache of query results stored like MatrixStore stores 
+    matrices, so repeated sessions read from disk with memory mapping 
+    instead of pulling from mongo. Each query's results are a directory 
+    organized by course and collection and named by the query, with a .npy
+    file per numeric, boolean or datetime column and a pickle with the other
+    columns, e.g. strings and dicts. A meta.json file has the fingerprint of
+    the source collection at the time the results were written, which is 
+    compared to the current fingerprint before they are used.
+
+    Parameters
+    ----------
+    directory : str
+        Directory for the cache files
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, course_id, query, mongo_id = False):
+        '''
+        Directory of the cached results of a query. The name is a hash of 
+        the query serialized like mongo extended JSON with sorted keys, which
+        is the same in every session, also for conditions with regular 
+        expressions or ObjectIds.
+        '''
+        canonical = json_util.dumps({'collection_name': query.collection_name,
+                'conditions': query.conditions,
+                'fields': query.fields,
+                'limit': query.limit,
+                'sort': query.sort,
+                'mongo_id': mongo_id},
+            sort_keys = True)
+        name = hashlib.md5(canonical).hexdigest()
+        return os.path.join(self.directory,
+            to_filename(course_id),
+            query.collection_name,
+            name)
+
+    def get(self, db, course_id, query, fingerprint, mongo_id = False):
+        '''
+        Reads the cached results of a query read from db if they are fresh.
+        The columns stored as arrays are copy on write memory maps.
+
+        Parameters
+        ----------
+        db : str
+            Name of the database the results came from
+        course_id : str
+            The course_id as specified by edX for the course
+        query : Query
+        fingerprint : dict
+            Current fingerprint of the course's documents in the collection
+        mongo_id : boolean
+            Whether the results include the mongo "_id"
+
+        Returns
+        -------
+        df : DataFrame
+            The cached results or None if there aren't any fresh ones
+        '''
+        path = self.path(course_id, query, mongo_id)
+        meta = self.meta(course_id, query, mongo_id)
+        if (meta is None) or (meta['db'] != db):
+            return None
+        if meta['fingerprint'] != fingerprint:
+            return None
+        try:
+            with open(os.path.join(path, 'objects.pickle'), 'rb') as f:
+                objects = pickle.load(f)
+            names = [str(column) for column in meta['columns']]
+            columns = OrderedDict()
+            for i, column in enumerate(names):
+                if column in objects:
+                    columns[column] = objects[column]
+                else:
+                    columns[column] = np.load(os.path.join(path,
+                        '{0}.npy'.format(i)), mmap_mode = 'c')
+        except (IOError, OSError, ValueError, EOFError, 
+                pickle.UnpicklingError):
+            # The directory was replaced or removed while reading it
+            return None
+        return DataFrame(columns, columns = names,
+            index = np.arange(meta['length']))
+
+    def meta(self, course_id, query, mongo_id = False):
+        '''
+        Reads the meta.json file of a cached query, which has the database
+        and fingerprint of the source collection
+
+        Returns
+        -------
+        meta : dict
+            None if the query isn't cached
+        '''
+        path = self.path(course_id, query, mongo_id)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def put(self, db, course_id, query, data, fingerprint, mongo_id = False):
+        '''
+        Writes the results of a query read from db to disk
+
+        Parameters
+        ----------
+        db : str
+            Name of the database the results came from
+        course_id : str
+            The course_id as specified by edX for the course
+        query : Query
+        data : DataFrame
+            Results of the query
+        fingerprint : dict
+            Fingerprint of the course's documents in the collection
+        mongo_id : boolean
+            Whether the results include the mongo "_id"
+
+        Returns
+        -------
+        cached : boolean
+            False if the data can't be stored, e.g. columns with objects that
+            can't be pickled
+        '''
+        path = self.path(course_id, query, mongo_id)
+        parent = os.path.dirname(path)
+        if not os.path.exists(parent):
+            os.makedirs(parent)
+
+        # The results are written to a temporary directory that replaces the
+        #   old one, so readers never see partial results
+        tmp = tempfile.mkdtemp(dir = parent)
+        try:
+            columns = [str(column) for column in data.columns]
+            objects = {}
+            for i, column in enumerate(columns):
+                values = data.iloc[:, i].values
+                if values.dtype.kind in 'biufcM':
+                    np.save(os.path.join(tmp, '{0}.npy'.format(i)), values)
+                else:
+                    objects[column] = values
+            with open(os.path.join(tmp, 'objects.pickle'), 'wb') as f:
+                pickle.dump(objects, f, pickle.HIGHEST_PROTOCOL)
+            meta = {'db': db,
+                'course_id': course_id,
+                'query': repr(query),
+                'fingerprint': fingerprint,
+                'columns': columns,
+                'length': len(data)}
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors = True)
+            return False
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors = True)
+        os.rename(tmp, path)
+        return True
+
+    def invalidate(self, course_id, collection_name):
+        '''
+        Removes the cached results of a course's collection
+        '''
+        directory = os.path.join(self.directory,
+            to_filename(course_id),
+            collection_name)
+        if os.path.exists(directory):
+            shutil.rmtree(directory, ignore_errors = True)
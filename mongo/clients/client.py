@@ -34,7 +34,8 @@ class Client(object):
         pass
 
     @abc.abstractmethod
-    def create(self, data, collection_name):
+    def create(self, data, collection_name, batch_size = None,
+            write_concern = None):
         '''
         Puts data into the collection specified by collection_name
 
@@ -44,13 +45,22 @@ class Client(object):
 
         collection_name : str
             Name of the collection
+        batch_size : int
+            Number of documents written to the database at a time
+        write_concern : dict
+            Acknowledgement required from the database for the writes
 
+        Returns
+        -------
+        stats : dict
+            Number of rows written ('rows'), seconds taken ('seconds') and 
+            throughput ('rows_per_second')
         '''
         pass
 
     @abc.abstractmethod
     def read(self, collection_name, conditions={}, fields=[], limit = 0,
-            parser = None):
+            parser = None, chunksize = None, sort = None):
         '''
         Reads data from the collection in the database
 
@@ -69,15 +79,21 @@ class Client(object):
         parser : XParser
             Defines additional munging for raw records. If none, no extra
             parsing will be done.
+        chunksize : int
+            If specified, an iterator of DataFrames with at most chunksize
+            records each is returned instead of a single DataFrame.
+        sort : str Array or array-like object
+            Fields to sort the results by in the database. Fields can be given
+            as names, for ascending order, or (name, direction) tuples.
 
         Returns
         -------
-        df : DataFrame
+        df : DataFrame or iterator of DataFrames
         '''
         pass
 
     @abc.abstractmethod
-    def update(self, data, collection_name, conditions={}):
+    def update(self, data, collection_name, conditions={}, keys = None):
         '''
         Replaces documents matching the conditions with the data specified
 
@@ -90,6 +106,9 @@ class Client(object):
         conditions : dict
             A set of constraints for the results from the collection. The
             default is no constraints
+        keys : str Array or array-like object
+            Fields which uniquely identify a document. If given, only new or
+            changed documents are rewritten.
         '''
         pass
 
@@ -109,6 +128,62 @@ class Client(object):
         pass
 
 
+    @abc.abstractmethod
+    def exists(self, collection_name, conditions={}):
+        '''
+        Checks whether any document in the collection matches the conditions
+        without reading the data
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+        conditions : dict
+            A set of constraints for the documents. The default is no 
+            constraints
+
+        Returns
+        -------
+        exists : boolean
+        '''
+        pass
+
+    @abc.abstractmethod
+    def fingerprint(self, collection_name, conditions={}):
+        '''
+        Summarizes the documents matching the conditions cheaply, so cached
+        copies of the data can be checked for freshness
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+        conditions : dict
+            A set of constraints for the documents. The default is no 
+            constraints
+
+        Returns
+        -------
+        fingerprint : dict
+            Changes whenever documents are added or removed
+        '''
+        pass
+
+    @abc.abstractmethod
+    def ensure_indexes(self, collection_name, indexes):
+        '''
+        Makes sure the indexes exist on the collection, creating any that are
+        missing
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+        indexes : list
+            Indexes as lists of (field, direction) tuples
+        '''
+        pass
+
     @abc.abstractmethod
     def connect(self, db):
         '''
@@ -1,20 +1,66 @@
 import pandas as pd
 import pymongo
-import json
 import getpass
+import time
+import os
+import threading
 
 from .client import Client
 
 class MongoClient(Client):
     """MongoClient is subclass of Client for interacting with mongodb"""
 
-    def __init__(self):
+    # pymongo.MongoClient maintains its own connection pool, so a single one is
+    #   shared by every MongoClient in a process along with the database 
+    #   handles created from it. A new one is created after a fork.
+    _connection = None
+    _connection_pid = None
+    _databases = {}
+    _lock = threading.Lock()
+
+    # Collection with a version per collection, which every write increments
+    #   so fingerprints change even when documents are replaced in place
+    version_collection = 'xdata_versions'
+
+    def __init__(self, pull_size = 10000, batch_size = 1000,
+            write_concern = None):
         '''
         Grabs the current user's username and connects to their personal
         database
+
+        Parameters
+        ----------
+        pull_size : int
+            Number of documents pulled from mongo and turned into a DataFrame
+            at a time when reading
+        batch_size : int
+            Number of documents sent to mongo in each bulk insert
+        write_concern : dict
+            Default write concern for bulk writes, e.g. {'w': 1}
+        '''
+        self.pull_size = pull_size
+        self.batch_size = batch_size
+        self.write_concern = write_concern
+
+        # The database connected to is kept per thread, so a client can be
+        #   shared by threads working with different databases
+        self._local = threading.local()
+        self._default_db = getpass.getuser()
+        self.connect(self._default_db)
+
+    @property
+    def db(self):
         '''
-        db = getpass.getuser()
-        self.connect(db)
+        Name of the database the current thread is connected to
+        '''
+        return getattr(self._local, 'db', self._default_db)
+
+    @property
+    def _mdb(self):
+        '''
+        pymongo Database the current thread is connected to
+        '''
+        return self._database(self.db)
 
     def collections(self, include_system_collections=False):
         '''
@@ -53,10 +99,13 @@ class MongoClient(Client):
 
 
 
-    def create(self, data, collection_name):
+    def create(self, data, collection_name, batch_size = None,
+            write_concern = None):
         '''
         Puts data into the collection specified by collection_name. Note that
-        the data's index will not be saved in the database.
+        the data's index will not be saved in the database. Documents are built
+        directly from the columns of the data and sent to mongo as unordered
+        bulk inserts.
 
         Parameters
         ----------
@@ -64,39 +113,38 @@ class MongoClient(Client):
 
         collection_name : str
             Name of the collection
+        batch_size : int
+            Number of documents sent to mongo in each bulk insert. The default
+            is the client's batch_size.
+        write_concern : dict
+            Write concern for the bulk inserts, e.g. {'w': 0} for
+            unacknowledged writes. The default is the client's write_concern.
+
+        Returns
+        -------
+        stats : dict
+            Number of rows written, seconds taken and rows per second
         '''
-        # generator version
-        def df_chunks(df,n):
-            '''
-            Yield successive n-sized chunks from a dataframe.
-            
-            ### If you want a rough memory estimate of an object (dataframe slice):
-            
-            import sys
-            sys.getsizeof(obj)
-            '''
-            
-            #Check that data is larger than chunk size
-            if n <= len(df):
-                ti = 0  #TOTAL INSERTED DOCS
-                while ti+n<=len(df):
-                    yield json.loads(df.iloc[ti:ti+n,:].to_json(orient='records'))
-                    ti += n
-                    #print ti,ti+n
-                
-                #Catch Remainder
-                yield json.loads(df.iloc[ti:len(df),:].to_json(orient='records'))
-                #print ti,len(df)
-          
-            else:
-                yield json.loads(df.to_json(orient='records')) 
-        
+        batch_size = batch_size if batch_size else self.batch_size
+        write_concern = write_concern if write_concern else self.write_concern
+
+        start = time.time()
         collection = getattr(self._mdb, collection_name)
-        for records in df_chunks(data,1000):
-            collection.insert(records)
+        for records in self._documents(data, batch_size):
+            bulk = collection.initialize_unordered_bulk_op()
+            for record in records:
+                bulk.insert(record)
+            bulk.execute(write_concern)
+        self._bump(collection_name)
+
+        seconds = time.time() - start
+        rows = len(data)
+        return {'rows': rows,
+            'seconds': seconds,
+            'rows_per_second': rows / seconds if seconds > 0 else float(rows)}
 
     def read(self, collection_name, conditions={}, fields=[], limit = 0,
-            parser = None, mongo_id = False):
+            parser = None, mongo_id = False, chunksize = None, sort = None):
         '''
         Reads data from the collection in the database
 
@@ -117,26 +165,51 @@ class MongoClient(Client):
             parsing will be done.
         mongo_id : boolean
             Determines whether or not to include Mongo Object id "_id"
+        chunksize : int
+            If specified, an iterator of DataFrames with at most chunksize
+            records each is returned instead of a single DataFrame. This keeps
+            memory bounded for very large collections.
+        sort : str Array or array-like object
+            Fields to sort the results by on the server. Fields can be given as
+            names, for ascending order, or (name, direction) tuples, e.g.
+            ['username', ('time', pymongo.DESCENDING)]
 
         Returns
         -------
-        df : DataFrame
+        df : DataFrame or iterator of DataFrames
         '''
-        data = self._pull(collection_name,
+        chunks = self._read_chunks(collection_name,
             conditions = conditions,
             fields = fields,
             limit = limit,
-            parser = parser)
-    
-        df = pd.DataFrame.from_records(data)
+            parser = parser,
+            mongo_id = mongo_id,
+            chunksize = chunksize if chunksize else self.pull_size,
+            sort = sort)
 
-        if (not df.empty) & ('_id' in df) & (not mongo_id):
-            del df['_id']
-        return df
+        if chunksize:
+            return chunks
 
-    def update(self, data, collection_name, conditions={}):
+        # Building the DataFrame a chunk at a time means only one chunk of raw
+        #   documents is held in memory alongside the frames already built
+        frames = list(chunks)
+        if len(frames) == 0:
+            return pd.DataFrame()
+        elif len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index = True)
+
+    def update(self, data, collection_name, conditions={}, keys = None,
+            batch_size = None, write_concern = None):
         '''
-        Replaces documents matching the conditions with the data specified
+        Replaces documents matching the conditions with the data specified. If
+        keys are given, documents are matched to rows of data by those fields
+        and only new or changed documents are upserted, along with the 
+        equality conditions, e.g. the course_id. Only the documents sharing
+        the first key with rows of data are read, so the cost is proportional
+        to the change. Documents matching the conditions without a row in the
+        data are removed. Otherwise, all documents matching the conditions 
+        are deleted before inserting the data.
 
         Parameters
         ----------
@@ -147,16 +220,109 @@ class MongoClient(Client):
         conditions : dict
             A set of constraints for the results from the collection. The
             default is no constraints
+        keys : str Array or array-like object
+            Fields which uniquely identify a document, e.g. 
+            ['username', 'date']
+        batch_size : int
+            Number of operations sent to mongo in each bulk write. The default
+            is the client's batch_size.
+        write_concern : dict
+            Write concern for the bulk writes. The default is the client's
+            write_concern.
+
+        Returns
+        -------
+        stats : dict
+            Number of documents upserted, removed and left unchanged. The 
+            number removed is None for unacknowledged writes.
         '''
-        # Delete old values 
-        self.delete(collection_name, conditions = conditions)
+        if not keys:
+            # Delete old values 
+            removed = self.delete(collection_name, conditions = conditions)
+
+            # insert new data
+            stats = self.create(data, collection_name,
+                batch_size = batch_size,
+                write_concern = write_concern)
+            return {'upserted': stats['rows'], 'removed': removed, 
+                'unchanged': 0}
+
+        batch_size = batch_size if batch_size else self.batch_size
+        write_concern = write_concern if write_concern else self.write_concern
+        collection = getattr(self._mdb, collection_name)
 
-        # insert new data
-        self.create(data, collection_name)
+        # Equality conditions, e.g. the course_id, are kept in upserted 
+        #   documents, since mongo only inserts the replacement document
+        fixed = dict((field, value) for field, value in conditions.items()
+            if not (field.startswith('$') or isinstance(value, dict)))
+        documents = {}
+        for records in self._documents(data, batch_size):
+            for record in records:
+                document = dict(fixed)
+                document.update(record)
+                documents[tuple(document.get(k) for k in keys)] = document
+
+        def scoped(extra):
+            '''
+            Conditions restricted further by extra
+            '''
+            return {'$and': [conditions, extra]} if conditions else extra
+
+        def spec(key):
+            '''
+            Query for the document with the given key values
+            '''
+            query = dict(conditions)
+            query.update(zip(keys, key))
+            return query
+
+        # Only the current documents sharing the first key with the data are
+        #   read, e.g. the users being updated, in batches of $in conditions
+        first = list(set(key[0] for key in documents))
+        existing = {}
+        for start in xrange(0, len(first), batch_size):
+            batch = scoped({keys[0]: {'$in': first[start:start+batch_size]}})
+            for doc in collection.find(batch, fields = {'_id': False}):
+                existing[tuple(doc.get(key) for key in keys)] = doc
+
+        stats = {'upserted': 0, 'removed': 0, 'unchanged': 0}
+        items = documents.items()
+        for start in xrange(0, len(items), batch_size):
+            bulk = collection.initialize_unordered_bulk_op()
+            operations = 0
+            for key, document in items[start:start+batch_size]:
+                if existing.pop(key, None) == document:
+                    stats['unchanged'] += 1
+                    continue
+                bulk.find(spec(key)).upsert().replace_one(document)
+                operations += 1
+            if operations:
+                bulk.execute(write_concern)
+                stats['upserted'] += operations
+
+        # Whatever is left in existing no longer has a row in the data
+        stale = existing.keys()
+        for start in xrange(0, len(stale), batch_size):
+            bulk = collection.initialize_unordered_bulk_op()
+            for key in stale[start:start+batch_size]:
+                bulk.find(spec(key)).remove()
+            result = bulk.execute(write_concern)
+            stats['removed'] = self._count(stats['removed'], result,
+                'nRemoved')
+
+        # So are the documents without a first key in the data, which are 
+        #   removed with a single command
+        result = collection.remove(scoped({keys[0]: {'$nin': first}}),
+            multi = True)
+        stats['removed'] = self._count(stats['removed'], result, 'n')
+        self._bump(collection_name)
+
+        return stats
 
     def delete(self, collection_name, conditions={}):
         '''
-        Removes data in the collection matching the conditions dictionary
+        Removes data in the collection matching the conditions dictionary with
+        a single command to the server
 
         Parameters
         ----------
@@ -165,47 +331,269 @@ class MongoClient(Client):
         conditions : dict
             A set of constraints for the results from the collection. The
             default is no constraints
+
+        Returns
+        -------
+        removed : int
+            Number of documents removed or None for unacknowledged writes
         '''
-        # Get collection data
         collection_connection = getattr(self._mdb,collection_name)
-        query_cursor = collection_connection.find(conditions, fields = '_id')
-            
-        # Remove records specified by query
-        for doc in query_cursor:
-            collection_connection.remove(doc)
+        result = collection_connection.remove(conditions, multi = True)
+        self._bump(collection_name)
+        return self._count(0, result, 'n')
+
+    def exists(self, collection_name, conditions={}):
+        '''
+        Checks whether any document in the collection matches the conditions
+        with a find_one that only returns the "_id"
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+        conditions : dict
+            A set of constraints for the documents. The default is no 
+            constraints
+
+        Returns
+        -------
+        exists : boolean
+        '''
+        collection = getattr(self._mdb, collection_name)
+        return collection.find_one(conditions, fields = {'_id': True}) is not None
+
+    def fingerprint(self, collection_name, conditions={}):
+        '''
+        Summarizes the documents matching the conditions with their count, 
+        the largest "_id" and the collection's version. The count and "_id" 
+        change when documents are added or removed and the version changes 
+        with every write through a MongoClient, including documents replaced
+        by update.
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+        conditions : dict
+            A set of constraints for the documents. The default is no 
+            constraints
+
+        Returns
+        -------
+        fingerprint : dict
+            'count' and 'max_id' of the matching documents and 'version' of 
+            the collection
+        '''
+        collection = getattr(self._mdb, collection_name)
+        count = collection.find(conditions).count()
+        last = collection.find_one(conditions,
+            fields = {'_id': True},
+            sort = [('_id', pymongo.DESCENDING)])
+        return {'count': count,
+            'max_id': str(last['_id']) if last is not None else None,
+            'version': self.version(collection_name)}
+
+    def version(self, collection_name):
+        '''
+        Number of writes through a MongoClient to the collection, see 
+        fingerprint
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+
+        Returns
+        -------
+        version : int
+            0 if the collection hasn't been written to
+        '''
+        versions = getattr(self._mdb, self.version_collection)
+        found = versions.find_one({'_id': collection_name})
+        return found['version'] if found is not None else 0
+
+    def ensure_indexes(self, collection_name, indexes):
+        '''
+        Makes sure the indexes exist on the collection. Missing indexes are 
+        built in the background, so reads aren't blocked.
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+        indexes : list
+            Indexes as lists of (field, direction) tuples
+        '''
+        collection = getattr(self._mdb, collection_name)
+        for index in indexes:
+            collection.ensure_index(list(index), background = True)
+
+    def _read_chunks(self, collection_name, conditions={}, fields=[],
+            limit = None, parser = None, mongo_id = False, chunksize = None,
+            sort = None):
+        '''
+        Generator of DataFrames built from successive chunksize-sized groups of
+        documents pulled from the collection. Each group is parsed at once 
+        with the parser's parse_batch, so parsed frames can be smaller.
+        '''
+        for data in self._pull(collection_name,
+                conditions = conditions,
+                fields = fields,
+                limit = limit,
+                chunksize = chunksize,
+                mongo_id = mongo_id,
+                sort = sort):
+            df = pd.DataFrame.from_records(data)
+            if parser:
+                df = parser.parse_batch(df)
+            if (not df.empty) & ('_id' in df) & (not mongo_id):
+                del df['_id']
+            if not df.empty:
+                yield df
 
     def _pull(self, collection_name, conditions={}, fields=[], limit = None,
-            parser = None):
+            chunksize = None, mongo_id = False, sort = None):
+        '''
+        Generator of lists of documents from the collection. Each list holds
+        at most chunksize documents. Parsing is left to _read_chunks.
+        '''
+        chunksize = chunksize if chunksize else self.pull_size
+
         # Get collection object
         collection_connection = getattr(self._mdb,collection_name)
         
-        # Create query
-        params = {} if len(fields) == 0 else {'fields': fields}
+        # Create query. The projection and sort are pushed down to mongo, so
+        #   "_id" is never transferred unless asked for and sorts can use indexes
+        params = {}
+        projection = self._projection(fields, mongo_id)
+        if projection:
+            params['fields'] = projection
         if limit:
             params['limit'] = limit
+        if sort:
+            params['sort'] = self._sort_spec(sort)
         query_cursor = collection_connection.find(conditions, **params)
+        query_cursor.batch_size(chunksize)
             
-        # Get all records/documents
+        # Get records/documents a chunk at a time
         data=[]
         for doc in query_cursor:
             # Each doc is a dict, meaning docs is a list of docs
-            if parser:
-                doc = parser.parse(doc)
             if doc:
                 data.append(doc)
+            if len(data) >= chunksize:
+                yield data
+                data = []
 
-        return data
+        if data:
+            yield data
+
+    def _projection(self, fields, mongo_id = False):
+        '''
+        Builds a mongo projection for the fields that always excludes "_id"
+        unless mongo_id is True
+        '''
+        projection = dict((field, True) for field in fields)
+        if not mongo_id:
+            projection['_id'] = False
+        return projection
+
+    def _sort_spec(self, sort):
+        '''
+        Turns a sort specification of field names and/or (field, direction) 
+        tuples into a list of (field, direction) tuples for pymongo
+        '''
+        if isinstance(sort, basestring):
+            sort = [sort]
+        spec = []
+        for key in sort:
+            if isinstance(key, basestring):
+                spec.append((key, pymongo.ASCENDING))
+            else:
+                spec.append(tuple(key))
+        return spec
+
+    def _bump(self, collection_name):
+        '''
+        Increments the version of a collection after a write
+        '''
+        if collection_name == self.version_collection:
+            return
+        versions = getattr(self._mdb, self.version_collection)
+        versions.update({'_id': collection_name},
+            {'$inc': {'version': 1}},
+            upsert = True)
+
+    def _count(self, total, result, field):
+        '''
+        Adds the count in the result of a write to total. Unacknowledged 
+        writes have no result, so the total becomes None.
+        '''
+        if (total is None) or (not result) or (field not in result):
+            return None
+        return total + result[field]
+
+    def _documents(self, data, n):
+        '''
+        Yield successive lists of n documents from a dataframe. The documents 
+        are built from the column arrays, so numpy scalars are turned into
+        python types bson can encode and NaNs are turned into None. Datetime
+        columns are stored as epoch milliseconds, like the records of 
+        DataFrame.to_json that collections have always been written with.
+        '''
+        columns = [str(column) for column in data.columns]
+        for start in xrange(0, len(data), n):
+            chunk = data.iloc[start:min(start + n, len(data))]
+            values = []
+            for column in chunk.columns:
+                series = chunk[column]
+                if series.dtype.kind == 'M':
+                    milliseconds = series.values.view('i8') // 10**6
+                    series = pd.Series(milliseconds.astype(object),
+                        index = series.index).where(series.notnull(), None)
+                elif series.dtype.kind in 'fO':
+                    notnull = pd.notnull(series)
+                    if not notnull.all():
+                        series = series.astype(object).where(notnull, None)
+                values.append(series.tolist())
+            yield [dict(zip(columns, row)) for row in zip(*values)]
 
     def connect(self, db):
         '''
-        Connects to the database specified by db
+        Connects to the database specified by db for the current thread. The 
+        process wide connection pool and database handles are reused, so 
+        switching databases is cheap.
 
         Parameters
         ----------
         db : str
             Name of the database
         '''
-        self.db = db
-        self._connection = pymongo.MongoClient()
-        self._mdb = getattr(self._connection, self.db) # pymongo Database
-        
+        self._database(db)
+        self._local.db = db
+
+    @classmethod
+    def _pool(cls):
+        '''
+        Returns the pymongo connection pool for the current process
+        '''
+        pid = os.getpid()
+        if cls._connection is None or cls._connection_pid != pid:
+            with cls._lock:
+                if cls._connection is None or cls._connection_pid != pid:
+                    cls._databases = {}
+                    cls._connection = pymongo.MongoClient()
+                    cls._connection_pid = pid
+        return cls._connection
+
+    @classmethod
+    def _database(cls, db):
+        '''
+        Returns the cached pymongo Database handle for db
+        '''
+        connection = cls._pool()
+        database = cls._databases.get(db)
+        if database is None:
+            database = getattr(connection, db)
+            cls._databases[db] = database
+        return database
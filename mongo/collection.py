@@ -1,6 +1,8 @@
 from pandas import Series, DataFrame
 
 from .exceptions import MissingDataError
+from .query import Query
+from ..munge.sparse import SparseFrame
 
 class Collection(object):
     '''
@@ -22,6 +24,12 @@ class Collection(object):
     limit : int
         Number of results to return. This can have a considerable effect on 
         the speed of the query. The default is all results.         
+    sort : str Array or array-like object
+        Fields to sort the results by in mongo, either as names for ascending
+        order or (name, direction) tuples. The default is no sorting.
+    query : Query
+        Query for the collection. If given, the conditions, limit, fields and
+        sort are ignored.
 
     Examples
     --------
@@ -31,13 +39,14 @@ class Collection(object):
     >>> logs.head() # This fires a query to mongo
     '''
     def __init__(self, xdata, collection_name,
-            conditions = {}, limit = 0, fields = []):
+            conditions = None, limit = 0, fields = None, sort = None,
+            query = None):
         self._xd = xdata
         self.name = collection_name
         self._cached = DataFrame()
-        self._conditions = conditions
-        self._limit = limit
-        self._fields = fields
+        if query is None:
+            query = Query(collection_name, conditions, fields, limit, sort)
+        self._query = query
 
     def __repr__(self):
         '''
@@ -89,20 +98,27 @@ class Collection(object):
     def __setslice__(self, i, j, sequence):
         self.dataframe[i:j] = sequence
 
+    @property
+    def query(self):
+        '''
+        The immutable Query for this collection
+        '''
+        return self._query
+
     def delete_from(self, databases):
-        self._xd.delete(self.name, databases, conditions = self._conditions)
+        self._xd.delete(self.name, databases,
+            conditions = self._query.conditions)
 
     def reset(self, inplace = False):
         if inplace:
-            self._conditions = {}
-            self._limit = 0
-            self._fields = []
+            self._query = Query(self.name)
             self._cached = DataFrame()
             return self
         else:
             return Collection(self._xd, self.name)
 
-    def find(self, conditions = {}, fields = None, limit = None):
+    def find(self, conditions = None, fields = None, limit = None,
+            sort = None):
         '''
         Updates the query for mongo
 
@@ -116,19 +132,19 @@ class Collection(object):
         limit : int
             Number of results to return. This can have a considerable effect on 
             the speed of the query. The default is all results.
+        sort : str Array or array-like object
+            Fields to sort the results by in mongo, either as names for 
+            ascending order or (name, direction) tuples. The default is the
+            sort of the current instance.
 
         Returns
         -------
         collection : Collection
             Updated collection with the given parameters
         '''
-        new_conditions = self._conditions.copy()
-        new_conditions.update(conditions)
         return Collection(self._xd,
             self.name,
-            conditions = new_conditions,
-            limit = limit if limit else self._limit,
-            fields = fields if fields else self._fields[:])
+            query = self._query.find(conditions, fields, limit, sort))
 
     def limit(self, n):
         '''
@@ -143,22 +159,46 @@ class Collection(object):
         '''
         return Collection(self._xd,
             self.name,
-            conditions = self._conditions.copy(),
-            limit = n,
-            fields = self._fields[:])
+            query = self._query.find(limit = n))
+
+    def chunks(self, chunksize):
+        '''
+        Iterates over the results of the query in DataFrames of a fixed size
+        without caching them, so memory stays bounded for large collections
+
+        Parameters
+        ----------
+        chunksize : int
+            Maximum number of records in each DataFrame
+
+        Returns
+        -------
+        chunks : iterator of DataFrames
+        '''
+        if not self._cached.empty:
+            return (self._cached[i:i+chunksize] 
+                for i in xrange(0, len(self._cached), chunksize))
+        if self.exists | (self.name in self._xd.strategies):
+            return self._xd.get(self._query, chunksize = chunksize)
+        raise MissingDataError(self._xd.course_id, None, self.name,
+            self._query.conditions)
 
     @property
     def dataframe(self):
         if self._cached.empty:
             if self.exists | (self.name in self._xd.strategies):
-                self._cached = self._xd.get(self.name,
-                    conditions = self._conditions,
-                    limit = self._limit,
-                    fields = self._fields)
+                data = self._xd.get(self._query)
+                if isinstance(data, SparseFrame):
+                    # Matrices stored sparse are only densified here, since
+                    #   Collection is used like a DataFrame
+                    data = data.to_frame()
+                    data['course_id'] = self._xd.course_id
+                self._cached = data
             else:
-                raise MissingDataError(self._xd.course_id, self.name)
+                raise MissingDataError(self._xd.course_id, None, self.name,
+                    self._query.conditions)
         return self._cached
 
     @property
     def exists(self):
-        return not self._xd.fetch(self.name, limit = 1).empty
+        return self._xd.exists(self.name)
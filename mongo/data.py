@@ -1,6 +1,11 @@
 import sys
 import datetime
 import math
+import itertools
+import threading
+import contextlib
+import Queue
+from multiprocessing.pool import ThreadPool
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy as sp
@@ -9,9 +14,18 @@ from pandas import Series, DataFrame
 
 from .exceptions import MissingDataError
 from .exceptions import MissingStrategyError
+from .exceptions import CyclicDependencyError
+from .exceptions import WriteBehindError
 
 from .collection import Collection
+from .query import Query, matches
+from .cache import ResultCache, DiskCache
+from .matrices import MatrixStore
+from .writer import WriteBehindQueue
+from .indexes import IndexRegistry
 from ..munge.logger import Logger
+from ..munge.sparse import SparseFrame
+from ..munge.vocabulary import Vocabulary
 from .clients.client import Client
 from .catalogs.collections_catalog import CollectionsCatalog
 
@@ -25,8 +39,13 @@ class XData:
     provide flexibility and extensibility in fetching and creating data in the 
     MITx and HarvardX mongodb instance
     """
+    # Collection with the watermarks of incremental refreshes
+    watermark_collection = 'xdata_watermarks'
+
     def __init__(self, course_id, read_from, write_to = [], logger = None,
-            catalog = None, client = None):
+            catalog = None, client = None, indexes = None,
+            parallel_probe = False, cache_bytes = 0, cache_dir = None,
+            matrix_dir = None, write_behind = False, interned = None):
         '''
         Data Structure charged with getting the data requested from the catalog
         by any means necessary. If the requested data can't be found in any of 
@@ -52,6 +71,43 @@ class XData:
         client : Client
             Responsible for storing and fetching collections from the databases.
             The default is a MongoClient.
+        indexes : IndexRegistry
+            Indexes collections should have. The default has indexes for the 
+            raw edX collections. The indexes declared by the strategies in the
+            catalog are always added.
+        parallel_probe : boolean
+            If True, all of the read_from databases are checked for a
+            collection at once with lightweight existence checks, and the
+            database holding the collection is remembered, so fetches go
+            straight to it. The default is to read from each database in turn.
+        cache_bytes : int
+            Memory budget for caching the results of queries. Cached results
+            also answer narrower queries, e.g. with additional conditions. The
+            least recently used results are evicted first. The default, 0, 
+            disables caching.
+        cache_dir : str
+            Directory for caching the results of queries on disk as memory
+            mapped NumPy arrays, which are checked for freshness against the
+            source collection before being used. The default is no disk 
+            cache.
+        matrix_dir : str
+            Directory for storing matrix-shaped collections, e.g. 
+            derived_time_matrix, as memory mapped NumPy arrays instead of in 
+            the write_to databases. Stored matrices are read before the 
+            databases. The default is storing every collection in the 
+            databases.
+        write_behind : boolean
+            If True, store returns immediately and collections are written to
+            the write_to databases by background threads. Reads of a 
+            collection wait for its pending writes. See flush. Otherwise store
+            waits for the writes, which are still done to the write_to 
+            databases concurrently.
+        interned : str Array or array-like object
+            Low cardinality columns, e.g. ['username', 'module_id', 'verb',
+            'course_id'], whose values are replaced by the course's shared
+            instances in fetched and computed DataFrames, so each distinct
+            value is stored once. See vocabulary. The default leaves the
+            columns as read.
         '''
         self._course_id = course_id
 
@@ -70,10 +126,39 @@ class XData:
             'client must be an instance of Client or a subclass'
         self.client = client
 
+        self.indexes = IndexRegistry() if indexes is None else indexes
+        self.indexes.register_catalog(self.catalog)
+        # Counts of queries that no registered index fully supports keyed by
+        #   (collection_name, fields in the conditions)
+        self.unindexed_queries = {}
+
         self._read_from = read_from
         self._write_to = write_to
         self._cached_collections = {}
-        self._computing = set() # Used to prevent infinite loops
+        self._existence = {} # {(db, collection_name, course_id) -> boolean}
+        self.parallel_probe = parallel_probe
+        self._locations = {} # {(course_id, collection_name) -> db}
+        # (db, collection_name) pairs whose registered indexes were ensured
+        #   before a sorted read
+        self._indexed = set()
+        self._probe_pool = None
+        self.cache = ResultCache(cache_bytes)
+        self.disk_cache = DiskCache(cache_dir) if cache_dir else None
+        self.matrices = MatrixStore(matrix_dir) if matrix_dir else None
+        self.write_behind = write_behind
+        # Writes are keyed by (course_id, collection_name, db)
+        self.writer = WriteBehindQueue(workers = max(1, len(write_to)),
+            logger = self.logger)
+        # Collections being computed by each thread, used to prevent infinite
+        #   loops
+        self._local = threading.local()
+        self.interned = list(interned) if interned else []
+        self._vocabularies = {} # {(course_id, field) -> Vocabulary}
+        self._vocabulary_lock = threading.Lock()
+        # {(course_id, key) -> [lock, value, built, inputs]}
+        self._intermediates = {}
+        self._intermediate_lock = threading.Lock()
+        self._computations = 0 # Running calls of compute, compute_all, ...
 
     @property
     def course_id(self):
@@ -107,16 +192,21 @@ class XData:
         collections : list
             List of Collections
         '''
-        existing = set()
+        fetchable = []
+        found = set()
+        if self.matrices is not None:
+            for collection_name in self.strategies:
+                if self._has_matrix(collection_name):
+                    found.add(collection_name)
+                    fetchable.append(Collection(self, collection_name))
         for db in self._read_from:
             self.client.connect(db)
-            existing.update(self.client.collections())
-
-        fetchable = []
-        for collection_name in existing:
-            collection = Collection(self, collection_name)
-            if collection.exists:
-                fetchable.append(collection)
+            for collection_name in self.client.collections():
+                if collection_name in found:
+                    continue
+                if self._exists_in(db, collection_name):
+                    found.add(collection_name)
+                    fetchable.append(Collection(self, collection_name))
 
         return fetchable
 
@@ -145,12 +235,13 @@ class XData:
 
         Parameters
         ----------
-        data : DataFrame
+        data : DataFrame or SparseFrame
             Data to be stored
         collection_name : str
             Name for the collection to be stored under
         '''
-        data['course_id'] = self.course_id
+        if isinstance(data, DataFrame):
+            data['course_id'] = self.course_id
         self.store(data, collection_name)
 
 
@@ -178,23 +269,32 @@ class XData:
         Clears cached collections
         '''
         self._cached_collections = {}
+        self._existence = {}
+        self._locations = {}
+        self._indexed = set()
+        self._intermediates = {}
+        self.cache.clear()
 
 
-    def get(self, collection_name, conditions = {}, fields = [], limit = None,
-            parser = None, mongo_id = False):
+    def get(self, collection_name, conditions = None, fields = None,
+            limit = None, parser = None, mongo_id = False, chunksize = None,
+            sort = None):
         '''
         Retrieves records pretaining to the course from the first read_from 
         database with data. If no data exists in any of the read_from databases,
         it will be generated from the catalog and saved to the write_to 
-        databases.
+        databases. The results are taken from the generated data in memory 
+        whenever the query can be evaluated by Query.apply, so the data isn't
+        read back from the databases.
 
         Parameters
         ----------
-        collection_name : str
-            Name of the data collection.
+        collection_name : str or Query
+            Name of the data collection or a Query, which is refined by the 
+            other parameters.
         conditions : dict
             A set of constraints for the results from the collection. The
-            default is no constraints
+            default is no constraints. The dict isn't modified.
         fields : str Array or array-like object
             A list of fields to return in the results. The default is all fields
         limit : int
@@ -205,39 +305,51 @@ class XData:
             parsing will be done.
         mongo_id : boolean
             Determines whether or not to include Mongo Object id "_id"
+        chunksize : int
+            If specified, an iterator of DataFrames with at most chunksize
+            records each is returned instead of a single DataFrame.
+        sort : str Array or array-like object
+            Fields to sort the results by in the database, either as names for
+            ascending order or (name, direction) tuples. The default is no
+            sorting.
 
         Returns
         -------
-        df : DataFrame
+        df : DataFrame, SparseFrame or iterator of DataFrames
+            Collections stored as sparse matrices in the MatrixStore are 
+            returned as SparseFrames when the whole collection is requested
         '''
+        query = self._query(collection_name, conditions, fields, limit, sort)
+
         # Try to read data from the list of read_from database
-        df = self.fetch(\
-            collection_name,
-            conditions = conditions,
-            fields = fields,
-            limit = limit,
+        df = self._fetch(query,
             parser = parser,
-            mongo_id = mongo_id)
+            mongo_id = mongo_id,
+            chunksize = chunksize)
 
         # If the requested data didn't exist in any of the databases, XData will
         # try to create it
-        if df.empty:
+        if self._is_empty(df):
             # OPTIMIZE: Make it so the entire collection doesn't need to be in
             #   memory
             # Creates collection in all write_to databases
-            collection = self.compute(collection_name)
+            collection = self.compute(query.collection_name)
 
             # Stores the created collection in the write_to databases
-            self.store(collection, collection_name)
+            self.store(collection, query.collection_name)
+            self._remember(collection, query.collection_name)
 
-            # Tries to fetch the data again.
-            df = self.fetch(\
-                collection_name,
-                conditions = conditions,
-                fields = fields,
-                limit = limit,
+            # Answers the query from the created collection when possible and
+            #   otherwise tries to fetch the data again.
+            df = self._answer(query, collection,
                 parser = parser,
-                mongo_id = mongo_id)
+                mongo_id = mongo_id,
+                chunksize = chunksize)
+            if df is None:
+                df = self._fetch(query,
+                    parser = parser,
+                    mongo_id = mongo_id,
+                    chunksize = chunksize)
 
         return df
 
@@ -255,24 +367,242 @@ class XData:
         Returns
         -------
         df : DataFrame
+
+        Raises
+        ------
+        CyclicDependencyError
+            If computing the collection requires computing itself
         '''
-        
+        computing = self._computing
+        if collection_name in computing:
+            raise CyclicDependencyError(computing + [collection_name])
+
         self.logger.log('Computing {0}'.format(collection_name))
+        computing.append(collection_name)
         try:
-            data = self.catalog[collection_name].create(self)
+            with self._computation():
+                data = self.catalog[collection_name].create(self)
         except KeyError as e:
             if e.message == collection_name:
                 raise MissingStrategyError(collection_name, self.catalog)
             else:
                 raise e
+        finally:
+            computing.pop()
 
         self.logger.log('Created {0}'.format(collection_name))
-        return data
+        return self._intern(data)
+
+    def dependencies(self, collection_names = None):
+        '''
+        Builds the graph of the collections computed with strategies that are
+        needed to compute collection_names, using the inputs declared by the
+        strategies. Inputs without strategies, e.g. tracking_log, are left out.
+
+        Parameters
+        ----------
+        collection_names : str Array or array-like object
+            Names of the data collections. The default is every collection in
+            the catalog.
+
+        Returns
+        -------
+        graph : dict
+            {collection_name -> list of inputs with strategies}
+
+        Raises
+        ------
+        CyclicDependencyError
+            If the collections depend on themselves
+        '''
+        if collection_names is None:
+            collection_names = self.strategies
+        graph = {}
+
+        def visit(collection_name, path):
+            if collection_name in path:
+                cycle = path[path.index(collection_name):]
+                raise CyclicDependencyError(cycle + [collection_name])
+            if collection_name in graph:
+                return
+            if collection_name not in self.catalog:
+                raise MissingStrategyError(collection_name, self.catalog)
+            inputs = [name for name in self.catalog[collection_name].inputs
+                if name in self.catalog]
+            for name in inputs:
+                visit(name, path + [collection_name])
+            graph[collection_name] = inputs
+
+        for collection_name in collection_names:
+            visit(collection_name, [])
+        return graph
+
+    def compute_all(self, collection_names = None, workers = 4,
+            force = False):
+        '''
+        Computes and stores collections along with any missing inputs. Every
+        collection is computed once, after its inputs, and collections that 
+        don't depend on each other are computed concurrently in a thread pool,
+        e.g. derived_time_matrix and derived_person_day_events once 
+        derived_person_object_time is stored.
+
+        Parameters
+        ----------
+        collection_names : str Array or array-like object
+            Names of the data collections. The default is every collection in
+            the catalog.
+        workers : int
+            Number of collections computed at once
+        force : boolean
+            If True, collection_names are computed even if they exist. By 
+            default, only missing collections are computed.
 
-    def store(self, data, collection_name):
+        Returns
+        -------
+        computed : list
+            Names of the computed collections in the order they were stored
+        '''
+        if collection_names is None:
+            collection_names = self.strategies
+        graph = self.dependencies(collection_names)
+
+        # Existing collections aren't computed, so their inputs aren't needed
+        pending = {}
+        def visit(collection_name, required):
+            if collection_name in pending:
+                return
+            if not (required or not self.exists(collection_name)):
+                return
+            pending[collection_name] = set()
+            for name in graph[collection_name]:
+                visit(name, False)
+                if name in pending:
+                    pending[collection_name].add(name)
+        for collection_name in collection_names:
+            visit(collection_name, force)
+
+        computed = []
+        running = set()
+        done = Queue.Queue()
+        pool = ThreadPool(max(1, min(workers, len(pending))))
+        # Intermediate values are shared by all of the collections
+        with self._computation():
+            try:
+                while pending or running:
+                    ready = [name for name, inputs in pending.items() 
+                        if not inputs]
+                    for name in ready:
+                        del pending[name]
+                        running.add(name)
+                        pool.apply_async(self._build, (name, ), 
+                            callback = done.put)
+
+                    name, error = done.get()
+                    running.discard(name)
+                    if error is not None:
+                        raise error[0], error[1], error[2]
+                    computed.append(name)
+                    for inputs in pending.values():
+                        inputs.discard(name)
+            finally:
+                pool.terminate()
+        return computed
+
+    def store(self, data, collection_name, batch_size = None,
+            write_concern = None):
         '''
         Stores a collection of data in the write_to databases under the
-        collection_name
+        collection_name. With write_behind, the data is written in the
+        background and store returns immediately.
+
+        Parameters
+        ----------
+        data : DataFrame or SparseFrame
+            Data to be stored. SparseFrames are stored as they are in the 
+            MatrixStore and as dense documents in the databases.
+        collection_name : str
+            Name for the collection to be stored under
+        batch_size : int
+            Number of documents written at a time. The default is the client's.
+        write_concern : dict
+            Acknowledgement required from the databases for the writes. The 
+            default is the client's.
+        '''
+        self.logger.log("Storing {0}".format(collection_name))
+        self.cache.invalidate(collection_name, self.course_id)
+        self._invalidate_disk(collection_name)
+        self._release_readers(collection_name)
+        if self._is_matrix(collection_name):
+            self.matrices.save(self.course_id, collection_name, data)
+            self.logger.log('{0} saved to {1} ({2} rows)'.format(\
+                collection_name,
+                self.matrices.path(self.course_id, collection_name),
+                len(data)))
+            return
+        data = self._dense(data)
+
+        # Readers find the data in the databases from now on. With write 
+        #   behind, they wait for the pending writes.
+        for db in self._write_to:
+            self._existence[(db, collection_name, self.course_id)] = True
+        self._locations.pop((self.course_id, collection_name), None)
+        for db in self._write_to:
+            self.writer.put((self.course_id, collection_name, db), 
+                self._write, db, data, collection_name, batch_size,
+                write_concern)
+
+        if not self.write_behind:
+            try:
+                self._wait_for(collection_name)
+            except WriteBehindError as e:
+                # A single failed write is raised as is
+                if len(e.errors) == 1:
+                    error = e.errors[0][1]
+                    raise error[0], error[1], error[2]
+                raise
+
+    def flush(self):
+        '''
+        Waits for all of the pending writes of stores
+
+        Raises
+        ------
+        WriteBehindError
+            If any of the writes failed since the last flush
+        '''
+        self.writer.flush()
+
+    def _wait_for(self, collection_name):
+        '''
+        Waits for the pending writes of the course's collection and raises 
+        their errors
+        '''
+        self.writer.flush([(self.course_id, collection_name, db)
+            for db in self._write_to])
+
+    def _write(self, db, data, collection_name, batch_size = None,
+            write_concern = None):
+        '''
+        Writes a collection to a database
+        '''
+        self.client.connect(db)
+        self.logger.log('{0} saving to db.{1}'.format(collection_name, db))
+        stats = self.client.create(data, collection_name,
+            batch_size = batch_size,
+            write_concern = write_concern)
+        self.logger.log('{0} saved to db.{1} ({2} rows, {3:.0f} rows/s)'\
+            .format(collection_name,
+                db,
+                stats['rows'],
+                stats['rows_per_second']))
+        self.client.ensure_indexes(collection_name,
+            self.indexes.get(collection_name, []))
+
+    def update(self, data, collection_name, keys, conditions = None):
+        '''
+        Replaces the course's documents for collection_name in the write_to 
+        databases with data. Documents are matched by keys, so only new or 
+        changed documents are rewritten.
 
         Parameters
         ----------
@@ -280,25 +610,247 @@ class XData:
             Data to be stored
         collection_name : str
             Name for the collection to be stored under
+        keys : str Array or array-like object
+            Fields which uniquely identify a document, e.g. 
+            ['username', 'date']
+        conditions : dict or list of dicts
+            Limits the documents that are replaced. The course_id is always
+            added. With a list, e.g. for batches of users, the documents 
+            matching each conditions are replaced by the rows of data 
+            matching them, so no single query holds all of the conditions.
         '''
-        self.logger.log("Storing {0}".format(collection_name))
+        if isinstance(conditions, list):
+            data = self._dense(data)
+            for scope in conditions:
+                rows = matches(data, scope)
+                if rows is None:
+                    message = 'Conditions {0} can\'t be evaluated on {1}'
+                    raise ValueError(message.format(scope, collection_name))
+                self.update(data[rows], collection_name, keys, scope)
+            return
+
+        conditions = dict(conditions if conditions else {},
+            course_id = self.course_id)
+        self.logger.log("Updating {0}".format(collection_name))
+        self._wait_for(collection_name)
+        self.cache.invalidate(collection_name, self.course_id)
+        self._invalidate_disk(collection_name)
+        self._release_readers(collection_name)
+        if self._is_matrix(collection_name):
+            self._update_matrix(data, collection_name, conditions)
+            return
+        data = self._dense(data)
         for db in self._write_to:
             self.client.connect(db)
-            self.logger.log('{0} saving to db.{1}'.format(collection_name, db))
-            self.client.create(data, collection_name)
-            self.logger.log('{0} saved to db.{1}'.format(collection_name, db))
+            stats = self.client.update(data, collection_name,
+                conditions = conditions,
+                keys = keys)
+            message = '{0} updated in db.{1} ({2} upserted, {3} removed)'
+            self.logger.log(message.format(collection_name,
+                db,
+                stats['upserted'],
+                stats['removed']))
 
-    def fetch(self, collection_name, conditions = {}, fields = [], limit = None,
-            parser = None, mongo_id = False):
-        df = DataFrame()
+    def fetch(self, collection_name, conditions = None, fields = None,
+            limit = None, parser = None, mongo_id = False, chunksize = None,
+            sort = None):
         '''
         Wrapper around the manger's pull method that iterates through the
         read_from databases until it gets results. The course_id is specified as
-        an additional condition to the client pull method.
+        an additional condition to the client pull method. If chunksize is 
+        specified, an iterator of DataFrames is returned instead.
+        '''
+        query = self._query(collection_name, conditions, fields, limit, sort)
+        return self._fetch(query,
+            parser = parser,
+            mongo_id = mongo_id,
+            chunksize = chunksize)
+
+    def matrix(self, collection_name):
+        '''
+        Retrieves a matrix-shaped collection, e.g. derived_time_matrix, as a
+        SparseFrame. Matrices in the MatrixStore are loaded with memory 
+        mapping. Otherwise the collection is retrieved like with get.
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the data collection.
+
+        Returns
+        -------
+        matrix : SparseFrame
+        '''
+        if not self._has_matrix(collection_name):
+            data = self.get(collection_name)
+            if not self._has_matrix(collection_name):
+                return SparseFrame.from_frame(data)
+        return self.matrices.load_sparse(self.course_id, collection_name)
+
+    def refresh(self, collection_names = None):
+        '''
+        Brings collections up to date with the events logged since they were
+        last refreshed. Incremental strategies only process the new events 
+        and upsert the documents they change, e.g. the (username, date) rows 
+        of derived_person_day_time. The time of the latest event processed, 
+        the watermark, is kept per course and collection in the
+        xdata_watermarks collection of the write_to databases. Collections 
+        without a watermark and collections with strategies that aren't 
+        incremental are rebuilt. Inputs with strategies are refreshed before
+        the collections reading them.
+
+        Parameters
+        ----------
+        collection_names : str Array or array-like object
+            Names of the data collections. The default is every collection 
+            with an incremental strategy in the catalog.
+
+        Returns
+        -------
+        watermarks : dict
+            {collection_name -> watermark} for the refreshed collections
         '''
+        if collection_names is None:
+            collection_names = [name for name, strategy in self.catalog.items()
+                if strategy.incremental]
+        graph = self.dependencies(collection_names)
+
+        # Inputs come before the collections reading them
+        order = []
+        def visit(collection_name):
+            if collection_name not in order:
+                for name in graph[collection_name]:
+                    visit(name)
+                order.append(collection_name)
+        for collection_name in collection_names:
+            visit(collection_name)
+
+        watermarks = {}
+        with self._computation():
+            for collection_name in order:
+                watermarks[collection_name] = self._refresh(collection_name)
+        return watermarks
+
+    def watermark(self, collection_name):
+        '''
+        Time of the latest event processed by the last refresh of the course's
+        collection
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the data collection.
+
+        Returns
+        -------
+        watermark : str
+            The watermark from the first write_to database with one or None
+        '''
+        conditions = {'course_id': self.course_id, 
+            'collection_name': collection_name}
+        for db in self._write_to:
+            self.client.connect(db)
+            found = self.client.read(self.watermark_collection,
+                conditions = conditions)
+            if not found.empty:
+                return found['watermark'].iloc[0]
+        return None
+
+    def _refresh(self, collection_name):
+        '''
+        Refreshes a collection with its strategy, see refresh
+        '''
+        strategy = self.catalog[collection_name]
+        since = None
+        if strategy.incremental and self.exists(collection_name):
+            since = self.watermark(collection_name)
+
+        self.logger.log('Refreshing {0} since {1}'.format(collection_name,
+            since))
+        if strategy.incremental:
+            data, conditions, watermark = strategy.increment(self, since)
+        else:
+            data, watermark = self.compute(collection_name), None
+
+        if since is None:
+            # Rebuilt from scratch
+            self.delete(collection_name, self._write_to)
+            self.store(data, collection_name)
+            self._wait_for(collection_name)
+        elif len(data) > 0:
+            self.update(data, collection_name,
+                keys = strategy.keys,
+                conditions = conditions)
+
+        if watermark is not None:
+            self._set_watermark(collection_name, watermark)
+        self.logger.log('Refreshed {0} to {1}'.format(collection_name,
+            watermark))
+        return watermark
+
+    def _set_watermark(self, collection_name, watermark):
+        '''
+        Records the watermark of a refreshed collection in the write_to 
+        databases
+        '''
+        conditions = {'course_id': self.course_id, 
+            'collection_name': collection_name}
+        document = DataFrame([dict(conditions, watermark = watermark)])
+        for db in self._write_to:
+            self.client.connect(db)
+            self.client.update(document, self.watermark_collection,
+                conditions = conditions,
+                keys = ['course_id', 'collection_name'])
+
+    def _fetch(self, query, parser = None, mongo_id = False, chunksize = None):
+        '''
+        Reads the results of a Query from the first read_from database with
+        data
+        '''
+        collection_name = query.collection_name
+        conditions = query.conditions
+        df = DataFrame() if not chunksize else []
         self.logger.log("Attempting to fetch {0}".format(collection_name))
+
+        if self._has_matrix(collection_name):
+            self.logger.log("Found matrix for {0}".format(collection_name))
+            return self._read_matrix(query, parser, mongo_id, chunksize)
+
+        # With parallel probing only the database known to have data is read
+        databases = self._read_from
+        if self.parallel_probe:
+            db = self.locate(collection_name)
+            databases = [db] if db is not None else []
+
+        # Parsed and chunked results aren't cached
+        cacheable = (parser is None) and (not chunksize)
+        in_memory = cacheable and (self.cache.max_bytes > 0)
+        on_disk = cacheable and (self.disk_cache is not None)
+        if in_memory:
+            for db in databases:
+                cached = self.cache.get(db, query, mongo_id)
+                if cached is not None:
+                    self.logger.log("Found cached data in {0} from db.{1}"\
+                        .format(collection_name, db))
+                    return cached
+
+        if on_disk:
+            for db in databases:
+                cached = self._read_disk(db, query, mongo_id)
+                if cached is not None:
+                    self.logger.log("Found data on disk in {0} from db.{1}"\
+                        .format(collection_name, db))
+                    cached = self._intern(cached)
+                    if in_memory and self.cache.put(db, query, cached, 
+                            mongo_id):
+                        cached = cached.copy()
+                    return cached
+
+        self._check_indexes(collection_name, conditions, query.sort)
+        self._wait_for(collection_name)
+
         # Look through the read from database for the desired data
-        for db in self._read_from:
+        for db in databases:
             # Check for data in db
             message = "Looking for data for {0} in {1} from db.{2}".format(\
                 self.course_id,
@@ -308,15 +860,32 @@ class XData:
 
             # Try to fetch data
             self.client.connect(db)
-            conditions['course_id'] = self.course_id
+            if on_disk:
+                # Taken before reading, so data added during the read makes 
+                #   the cached copy stale
+                fingerprint = self.client.fingerprint(collection_name,
+                    {'course_id': self.course_id})
+            # Sorts without an index are done in memory, since mongo can't
+            #   sort a whole course in memory
+            read = query
+            if query.sort and not self._sortable(db, query):
+                read = self._unsorted(query)
             df = self.client.read(collection_name,
                 conditions = conditions,
-                fields = fields,
-                limit = limit,
+                fields = read.fields,
+                limit = read.limit,
                 parser = parser,
-                mongo_id = mongo_id
+                mongo_id = mongo_id,
+                chunksize = chunksize,
+                sort = read.sort
                 )
-            if df.empty:
+            if read is not query:
+                df = self._sort(df, query, chunksize)
+            df = self._intern(df)
+            if chunksize:
+                # The first chunk is pulled to see if the database has data
+                df = self._peek(df)
+            if self._is_empty(df):
                 # If there isn't data, the remaining read_from databases are 
                 #   tried
                 message = "No data for {0} found in {1} from db.{2}".format(\
@@ -327,39 +896,554 @@ class XData:
             else:
                 # If there is data, df is set to that and no further searching
                 #   is required
+                self._existence[(db, collection_name, self.course_id)] = True
                 message = "Found data in {0} from db.{1}".format(\
                     collection_name,
                     db)
                 self.logger.log(message)
+                if on_disk:
+                    self.disk_cache.put(db, self.course_id, query, df,
+                        fingerprint, mongo_id)
+                # The cache keeps the DataFrame, so the caller gets a copy
+                if in_memory and self.cache.put(db, query, df, mongo_id):
+                    df = df.copy()
                 break
         return df
 
-    def delete(self, collection_name, databases, conditions = {}):
-        conditions['course_id'] = self.course_id
+    def delete(self, collection_name, databases, conditions = None):
+        conditions = dict(conditions if conditions else {},
+            course_id = self.course_id)
+        self._wait_for(collection_name)
+        self.cache.invalidate(collection_name, self.course_id)
+        self._invalidate_disk(collection_name)
+        self._release_readers(collection_name)
+        if self._has_matrix(collection_name):
+            self._delete_matrix(collection_name, conditions)
         for db in databases:
             self.client.connect(db)
             self.client.delete(collection_name, conditions)
+            self._existence.pop((db, collection_name, self.course_id), None)
+        self._locations.pop((self.course_id, collection_name), None)
 
-    def _create_collection(self, collection_name):
-        collection = None
-        if collection_name in self._cached_collections:
-            collection = self._cached_collections[collection_name]
+    def exists(self, collection_name, conditions = None):
+        '''
+        Checks whether any of the read_from databases has data for the course
+        in a collection without reading the data. Checks without additional 
+        conditions are cached per database, collection and course.
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the data collection.
+        conditions : dict
+            Additional constraints the data must satisfy. The default is no
+            constraints
+
+        Returns
+        -------
+        exists : boolean
+        '''
+        if (not conditions) and self._has_matrix(collection_name):
+            return True
+        for db in self._read_from:
+            if self._exists_in(db, collection_name, conditions):
+                return True
+        return False
+
+    def locate(self, collection_name):
+        '''
+        Finds the first read_from database with data for the course in a 
+        collection. With parallel_probe, all of the databases are checked at
+        once in a thread pool. The location is remembered for later fetches.
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the data collection.
+
+        Returns
+        -------
+        db : str
+            Name of the database or None if no database has data
+        '''
+        key = (self.course_id, collection_name)
+        if key in self._locations:
+            return self._locations[key]
+
+        if self.parallel_probe and len(self._read_from) > 1:
+            if self._probe_pool is None:
+                self._probe_pool = ThreadPool(len(self._read_from))
+            found = self._probe_pool.map(\
+                lambda db: self._exists_in(db, collection_name),
+                self._read_from)
+            candidates = [db for db, exists in zip(self._read_from, found)
+                if exists]
         else:
-            collection = Collection(self, collection_name)
-            self._cached_collections[collection_name] = collection
-        return collection
+            candidates = (db for db in self._read_from
+                if self._exists_in(db, collection_name))
+
+        # The read_from order is kept, so the first database with data wins
+        for db in candidates:
+            self._locations[key] = db
+            self.logger.log("Located {0} in db.{1}".format(\
+                collection_name,
+                db))
+            return db
+        return None
+
+    def _exists_in(self, db, collection_name, conditions = None):
+        '''
+        Checks whether db has data for the course in a collection
+        '''
+        key = (db, collection_name, self.course_id)
+        if (not conditions) and (key in self._existence):
+            return self._existence[key]
+
+        query = dict(conditions if conditions else {},
+            course_id = self.course_id)
+        self.client.connect(db)
+        exists = self.client.exists(collection_name, query)
+        if not conditions:
+            self._existence[key] = exists
+        return exists
+
+    def ensure_indexes(self, databases = None, collection_names = None):
+        '''
+        Makes sure the registered indexes exist in the databases
+
+        Parameters
+        ----------
+        databases : str Array or array-like object
+            Names of the databases. The default is the read_from databases.
+        collection_names : str Array or array-like object
+            Names of the collections to index. The default is every collection
+            in the index registry.
+        '''
+        databases = self._read_from if databases is None else databases
+        if collection_names is None:
+            collection_names = self.indexes.keys()
+        for db in databases:
+            self.client.connect(db)
+            existing = set(self.client.collections())
+            for collection_name in collection_names:
+                if collection_name in existing:
+                    self.logger.log('Indexing {0} in db.{1}'.format(\
+                        collection_name,
+                        db))
+                    self.client.ensure_indexes(collection_name,
+                        self.indexes.get(collection_name, []))
+
+    def _check_indexes(self, collection_name, conditions, sort = None):
+        '''
+        Records queries that aren't supported by any registered index
+        '''
+        if not self.indexes.supports(collection_name, conditions, sort):
+            key = (collection_name, tuple(sorted(conditions.keys())))
+            self.unindexed_queries[key] = self.unindexed_queries.get(key, 0) + 1
+            message = "No index supports query on {0} for {1}".format(\
+                collection_name,
+                list(key[1]))
+            self.logger.log(message)
+
+    def _sortable(self, db, query):
+        '''
+        Checks whether a registered index supports the sort of a query and
+        makes sure the registered indexes exist in db, which the current 
+        thread is connected to, so collections stored before the indexes 
+        were registered are sorted with them too. The indexes are ensured
+        once per database and collection.
+        '''
+        collection_name = query.collection_name
+        if not self.indexes.supports(collection_name, query.conditions,
+                query.sort):
+            self.logger.log('No index supports sorting {0} by {1}, sorting '\
+                'in memory'.format(collection_name, query.sort))
+            return False
+        key = (db, collection_name)
+        if (key not in self._indexed) and \
+                (collection_name in self.client.collections()):
+            self.logger.log('Indexing {0} in db.{1}'.format(collection_name,
+                db))
+            self.client.ensure_indexes(collection_name,
+                self.indexes.get(collection_name, []))
+            self._indexed.add(key)
+        return True
+
+    def _unsorted(self, query):
+        '''
+        Builds the query that reads the results of a sorted query for sorting
+        in memory, i.e. without its sort and limit but with the sort fields
+        '''
+        fields = query.fields
+        if fields:
+            fields += [key for key, direction in query.sort 
+                if key not in fields]
+        return Query(query.collection_name, query.conditions, fields)
+
+    def _sort(self, data, query, chunksize = None):
+        '''
+        Sorts and limits the results of a query read with _unsorted in memory
+        '''
+        frames = list(data) if chunksize else [data]
+        frames = [df for df in frames if not df.empty]
+        df = pd.concat(frames, ignore_index = True) if frames else DataFrame()
+        df = Query(query.collection_name,
+            limit = query.limit,
+            sort = query.sort).apply(df)
+        if query.fields:
+            df = df.loc[:, [field for field in query.fields if field in df]]
+        if chunksize:
+            # An iterator like the client's, so it can be peeked
+            return iter([df[i:i+chunksize] 
+                for i in xrange(0, len(df), chunksize)])
+        return df
+
+    def _read_disk(self, db, query, mongo_id = False):
+        '''
+        Reads the results of a query from the disk cache if they are fresh
+        '''
+        if self.disk_cache.meta(self.course_id, query, mongo_id) is None:
+            return None
+        self.client.connect(db)
+        fingerprint = self.client.fingerprint(query.collection_name,
+            {'course_id': self.course_id})
+        return self.disk_cache.get(db, self.course_id, query, fingerprint,
+            mongo_id)
+
+    def _invalidate_disk(self, collection_name):
+        '''
+        Removes the course's results for a collection from the disk cache
+        '''
+        if self.disk_cache is not None:
+            self.disk_cache.invalidate(self.course_id, collection_name)
+
+    def vocabulary(self, field):
+        '''
+        Shared dictionary of the course's values of a field, which interns
+        the field in fetched and computed data and encodes its values as 
+        integer codes that are stable for the lifetime of the XData
+
+        Parameters
+        ----------
+        field : str
+            Name of a low cardinality field, e.g. 'username'
+
+        Returns
+        -------
+        vocabulary : Vocabulary
+        '''
+        key = (self.course_id, field)
+        with self._vocabulary_lock:
+            vocabulary = self._vocabularies.get(key)
+            if vocabulary is None:
+                vocabulary = self._vocabularies[key] = Vocabulary()
+        return vocabulary
+
+    def intermediate(self, key, build, inputs = None):
+        '''
+        Gets a value shared by the strategies computing the course's 
+        collections, e.g. events that several collections are aggregated 
+        from. The value is built once per course and key, even when 
+        collections are computed concurrently, and kept until the outermost
+        call of compute, compute_all or refresh returns, it is released, one
+        of its inputs is stored, updated or deleted, or the XData is cleared.
+        So collections computed together by compute_all share the value, 
+        while it doesn't outlive them.
 
+        Parameters
+        ----------
+        key : hashable
+            Identifies the value, e.g. ('time_attribution', max_time)
+        build : callable
+            Called without arguments to build the value if it isn't kept
+        inputs : str Array or array-like object
+            Collections the value is built from. The default drops the value
+            when any of the course's collections is written.
 
+        Returns
+        -------
+        value : object
+        '''
+        with self._intermediate_lock:
+            entry = self._intermediates.get((self.course_id, key))
+            if entry is None:
+                inputs = set(inputs) if inputs is not None else None
+                entry = [threading.Lock(), None, False, inputs]
+                self._intermediates[(self.course_id, key)] = entry
 
+        # Only threads that need the same value wait for it to be built
+        with entry[0]:
+            if not entry[2]:
+                entry[1] = build()
+                entry[2] = True
+        return entry[1]
 
+    def release(self, key):
+        '''
+        Stops keeping the course's intermediate value for a key, see 
+        intermediate
+        '''
+        with self._intermediate_lock:
+            self._intermediates.pop((self.course_id, key), None)
 
+    @contextlib.contextmanager
+    def _computation(self):
+        '''
+        Context of a computation, e.g. compute_all, which drops the 
+        intermediate values once the outermost computation is done, see
+        intermediate
+        '''
+        with self._intermediate_lock:
+            self._computations += 1
+        try:
+            yield
+        finally:
+            with self._intermediate_lock:
+                self._computations -= 1
+                if not self._computations:
+                    self._intermediates = {}
+
+    def _release_readers(self, collection_name):
+        '''
+        Stops keeping the course's intermediate values built from a 
+        collection that is written, so later computations don't use stale
+        data. Values still being built are kept, since their build can be
+        what writes the collection, e.g. when derived_person_object_time is
+        computed on demand.
+        '''
+        with self._intermediate_lock:
+            for key, entry in self._intermediates.items():
+                inputs = entry[3]
+                if (key[0] == self.course_id) and entry[2] and \
+                        ((inputs is None) or (collection_name in inputs)):
+                    del self._intermediates[key]
+
+    def _intern(self, data):
+        '''
+        Interns the interned columns of a DataFrame, a list of DataFrames or
+        an iterator of DataFrames. SparseFrames are returned as is.
+        '''
+        if not self.interned:
+            return data
+        if isinstance(data, DataFrame):
+            for field in self.interned:
+                if (field in data) and (data[field].dtype == object):
+                    data[field] = self.vocabulary(field).intern(data[field])
+            return data
+        if isinstance(data, list):
+            return [self._intern(df) for df in data]
+        if isinstance(data, SparseFrame):
+            return data
+        return itertools.imap(self._intern, data)
 
+    def _is_matrix(self, collection_name):
+        '''
+        Checks whether a collection is stored with the MatrixStore
+        '''
+        strategy = self.catalog.get(collection_name)
+        return (self.matrices is not None) and \
+            getattr(strategy, 'matrix', False)
 
+    def _has_matrix(self, collection_name):
+        '''
+        Checks whether the course's matrix for a collection has been stored
+        '''
+        return self._is_matrix(collection_name) and \
+            self.matrices.contains(self.course_id, collection_name)
 
+    def _read_matrix(self, query, parser = None, mongo_id = False,
+            chunksize = None):
+        '''
+        Answers a query from the course's stored matrix. Without conditions,
+        fields, sort, limit, parser or chunksize the memory mapped matrix is
+        returned as is, i.e. as a SparseFrame if it was stored as one. 
+        Otherwise the matrix is loaded as a DataFrame to answer the query.
+        '''
+        # The stored matrix only has the course's rows
+        residual = self._course_query(query)
+        whole = (residual == Query(query.collection_name)) and \
+            (parser is None) and (not chunksize)
+        df = self.matrices.load(self.course_id, query.collection_name,
+            sparse = whole)
+        if whole:
+            return self._intern(df)
+        if residual != Query(query.collection_name):
+            applied = residual.apply(df)
+            if applied is None:
+                message = 'Conditions {0} can\'t be evaluated on matrix {1}'
+                raise ValueError(message.format(residual.conditions, 
+                    query.collection_name))
+            df = applied
+        if parser is not None:
+            df = parser.parse_batch(df)
+        df = self._intern(df)
+        if chunksize:
+            return [df[i:i+chunksize] for i in xrange(0, len(df), chunksize)]
+        return df
 
-            
+    def _update_matrix(self, data, collection_name, conditions):
+        '''
+        Replaces the rows of the course's stored matrix that match conditions
+        with data
+        '''
+        conditions = dict(conditions)
+        conditions.pop('course_id', None)
+        existing = self.matrices.load(self.course_id, collection_name) \
+            if conditions else None
+        if existing is not None:
+            data = self._dense(data)
+            mask = matches(existing, conditions)
+            if mask is None:
+                message = 'Conditions {0} can\'t be evaluated on matrix {1}'
+                raise ValueError(message.format(conditions, collection_name))
+            data = pd.concat([existing[~mask], data]).fillna(0)
+        self.matrices.save(self.course_id, collection_name, data)
+        self.logger.log('{0} updated in {1}'.format(collection_name,
+            self.matrices.path(self.course_id, collection_name)))
 
+    def _delete_matrix(self, collection_name, conditions):
+        '''
+        Removes the rows of the course's stored matrix that match conditions.
+        Sparse matrices stay sparse.
+        '''
+        conditions = dict(conditions)
+        conditions.pop('course_id', None)
+        if not conditions:
+            self.matrices.delete(self.course_id, collection_name)
+            return
+        existing = self.matrices.load(self.course_id, collection_name,
+            sparse = True)
+        if isinstance(existing, SparseFrame):
+            # Conditions on the row labels don't need the values
+            labels = DataFrame({existing.index: existing.rows})
+            mask = matches(labels, conditions)
+            if mask is None:
+                mask = matches(existing.to_frame(), conditions)
+            if mask is not None:
+                keep = np.flatnonzero(~mask.values)
+                remaining = SparseFrame(existing.matrix[keep],
+                    existing.rows[keep],
+                    existing.columns,
+                    index = existing.index)
+        else:
+            mask = matches(existing, conditions)
+            if mask is not None:
+                remaining = existing[~mask]
+        if mask is None:
+            message = 'Conditions {0} can\'t be evaluated on matrix {1}'
+            raise ValueError(message.format(conditions, collection_name))
+        self.matrices.save(self.course_id, collection_name, remaining)
 
-        
+    def _answer(self, query, data, parser = None, mongo_id = False,
+            chunksize = None):
+        '''
+        Answers a query from a collection computed for the course
 
-        
\ No newline at end of file
+        Returns
+        -------
+        df : DataFrame or list of DataFrames
+            The results or None if the query needs the databases, e.g. for the
+            mongo "_id", a parser or unsupported conditions
+        '''
+        if (parser is not None) or mongo_id:
+            return None
+        df = self._course_query(query).apply(self._dense(data))
+        if df is None:
+            return None
+        if chunksize:
+            return [df[i:i+chunksize] for i in xrange(0, len(df), chunksize)]
+        return df
+
+    def _remember(self, data, collection_name):
+        '''
+        Caches a collection computed for the course as the results of 
+        querying the whole collection from the write_to databases that are
+        also read from
+        '''
+        if self._is_matrix(collection_name) or (self.cache.max_bytes <= 0):
+            return
+        data = self._dense(data)
+        query = self._query(collection_name)
+        for db in self._write_to:
+            if db in self._read_from:
+                self.cache.put(db, query, data)
+
+    def _course_query(self, query):
+        '''
+        Removes the course_id condition from a query for data that only has
+        the course's records
+        '''
+        conditions = query.conditions
+        conditions.pop('course_id', None)
+        return Query(query.collection_name, conditions, query.fields,
+            query.limit, query.sort)
+
+    def _dense(self, data):
+        '''
+        Converts a SparseFrame to a DataFrame of documents for the course
+        '''
+        if isinstance(data, SparseFrame):
+            data = data.to_frame()
+            data['course_id'] = self.course_id
+        return data
+
+    @property
+    def _computing(self):
+        '''
+        Stack of the collections being computed by the current thread
+        '''
+        if not hasattr(self._local, 'computing'):
+            self._local.computing = []
+        return self._local.computing
+
+    def _build(self, collection_name):
+        '''
+        Computes and stores a collection for compute_all. Errors are returned
+        instead of raised, so they can be reraised in the calling thread.
+        '''
+        try:
+            self.store(self.compute(collection_name), collection_name)
+            return collection_name, None
+        except Exception:
+            return collection_name, sys.exc_info()
+
+    def _query(self, collection_name, conditions = None, fields = None,
+            limit = None, sort = None):
+        '''
+        Builds the Query for a request restricted to the course. 
+        collection_name can also be a Query to refine.
+        '''
+        if isinstance(collection_name, Query):
+            query = collection_name.find(conditions, fields, limit, sort)
+        else:
+            query = Query(collection_name, conditions, fields, limit, sort)
+        return query.find({'course_id': self.course_id})
+
+    def _peek(self, chunks):
+        '''
+        Pulls the first DataFrame from an iterator of DataFrames and returns an
+        equivalent iterator. If there is no data, an empty list is returned.
+        '''
+        for first in chunks:
+            if not first.empty:
+                return itertools.chain([first], chunks)
+        return []
+
+    def _is_empty(self, data):
+        '''
+        Checks whether a DataFrame, a SparseFrame or a peeked iterator of 
+        DataFrames is empty
+        '''
+        if isinstance(data, SparseFrame):
+            return len(data) == 0
+        if isinstance(data, DataFrame):
+            return data.empty
+        return isinstance(data, list) and len(data) == 0
+
+    def _create_collection(self, collection_name):
+        query = Query(collection_name)
+        collection = self._cached_collections.get(query)
+        if collection is None:
+            collection = Collection(self, collection_name)
+            self._cached_collections[query] = collection
+        return collection
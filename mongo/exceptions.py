@@ -18,4 +18,23 @@ class MissingStrategyError(Exception):
 
     def __str__(self):
         return "No strategy for creating {0}".format(\
-            self.collection)
\ No newline at end of file
+            self.collection)
+
+class CyclicDependencyError(Exception):
+    def __init__(self, collections):
+        self.collections = collections
+
+    def __str__(self):
+        return "Cyclic dependency between collections: {0}".format(\
+            ' -> '.join(self.collections))
+
+
+class WriteBehindError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+
+    def __str__(self):
+        return "{0} background writes failed: {1}".format(\
+            len(self.errors),
+            '; '.join('{0}: {1!r}'.format(key, error[1])
+                for key, error in self.errors))
@@ -8,6 +8,8 @@ import datetime
 import math
 import ujson as json
 
+from ..munge.vocabulary import pair_codes
+
 class Grader(object):
     
     def __init__(self, xdata):
@@ -334,15 +336,30 @@ class Grader(object):
             Contains every user's grade on each problem module in the course.
             It is indexed by username with columns of module id.
         '''
-        data['correctness'] = data.detail.apply(lambda x: x['correct'])
-
-        high_scores = data.loc[:,['username','module_id','correctness']].\
-            groupby(['username','module_id']).max().reset_index()
-            
-        score_matrix = high_scores.pivot_table(\
-            rows='username',
-            cols='module_id',
-            values = 'correctness').fillna(0)
+        correctness = np.array([detail['correct'] for detail in data.detail],
+            dtype = float)
+
+        # High scores are found by integer codes for (username, module_id)
+        #   pairs instead of grouping and pivoting on the strings
+        codes, usernames, module_ids = pair_codes(data['username'],
+            data['module_id'])
+        high_scores = Series(correctness).groupby(codes).max()
+        high_scores = high_scores[high_scores.index >= 0]
+
+        # Like pivot_table, users and modules without any known correctness
+        #   are left out
+        high_scores = high_scores.dropna()
+        pairs = high_scores.index.values
+        rows = np.unique(pairs // len(module_ids))
+        columns = np.unique(pairs % len(module_ids))
+
+        scores = np.zeros((len(rows), len(columns)))
+        scores[np.searchsorted(rows, pairs // len(module_ids)),
+            np.searchsorted(columns, pairs % len(module_ids))] = \
+            high_scores.values
+        score_matrix = DataFrame(scores,
+            index = pd.Index(usernames[rows], name = 'username'),
+            columns = pd.Index(module_ids[columns], name = 'module_id'))
         return score_matrix
         
     def _from_cwsm(self, data):
@@ -0,0 +1,145 @@
+class IndexRegistry(dict):
+    """
+    Declarative registry of the indexes each collection should have, stored
+    through the dict interface {collection_name -> list of indexes}. Every
+    index is a list of (field, direction) tuples, e.g.
+    [('course_id', 1), ('username', 1), ('time', 1)] for a compound index.
+
+    Since XData always adds the course_id to its queries, indexes should start
+    with course_id in order to be used on databases with multiple courses.
+    """
+
+    def __init__(self, indexes = None):
+        '''
+        Parameters
+        ----------
+        indexes : dict
+            Initial indexes {collection_name -> list of indexes}. The default
+            is raw_indexes.
+        '''
+        indexes = raw_indexes if indexes is None else indexes
+        for collection_name, specs in indexes.items():
+            self.register(collection_name, *specs)
+
+    def register(self, collection_name, *indexes):
+        '''
+        Adds indexes for a collection, ignoring ones that are already
+        registered
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+        indexes : list of (field, direction) tuples
+            Fields can also be given as names for ascending order
+        '''
+        registered = self.setdefault(collection_name, [])
+        for index in indexes:
+            index = [(key, 1) if isinstance(key, basestring) else tuple(key)
+                for key in index]
+            if index not in registered:
+                registered.append(index)
+
+    def register_catalog(self, catalog):
+        '''
+        Adds the indexes declared by every strategy in a CollectionsCatalog
+
+        Parameters
+        ----------
+        catalog : CollectionsCatalog
+        '''
+        for collection_name, strategy in catalog.items():
+            self.register(collection_name, *strategy.indexes)
+
+    def supports(self, collection_name, conditions, sort = None):
+        '''
+        Checks whether a query can be answered with one of the registered
+        indexes the way mongo uses indexes. The fields with equality 
+        conditions have to be a prefix of the index, which has to continue
+        with the sort fields in order, all in the index's directions or all
+        reversed. The fields with other conditions, e.g. ranges or $in, 
+        have to be in the index after the equality prefix. Without a sort, 
+        the index has to start with a field of the conditions. Every
+        collection also has mongo's built-in index on _id.
+
+        Parameters
+        ----------
+        collection_name : str
+            Name of the collection
+        conditions : dict
+            Constraints of the query
+        sort : str Array or array-like object
+            Fields the query is sorted by
+
+        Returns
+        -------
+        supported : boolean
+        '''
+        sort = self._sort_spec(sort)
+        if not (conditions or sort):
+            return True
+
+        equality = set(field for field, value in conditions.items()
+            if not (isinstance(value, dict) or hasattr(value, 'pattern')))
+        others = set(conditions.keys()) - equality
+        for index in self.get(collection_name, []) + [[('_id', 1)]]:
+            keys = [key for key, direction in index]
+            n = len(equality)
+            if set(keys[:n]) != equality:
+                continue
+            if not others.issubset(keys[n:]):
+                continue
+            if not sort:
+                if keys[0] in conditions:
+                    return True
+                continue
+            following = index[n:n+len(sort)]
+            if [key for key, direction in following] != \
+                    [key for key, direction in sort]:
+                continue
+            signs = set(direction * order for (key, direction), (field, order)
+                in zip(following, sort))
+            if len(signs) == 1:
+                return True
+        return False
+
+    def _sort_spec(self, sort):
+        '''
+        Turns a sort specification into a list of (field, direction) tuples
+        '''
+        if not sort:
+            return []
+        if isinstance(sort, basestring):
+            sort = [sort]
+        return [(key, 1) if isinstance(key, basestring) else tuple(key)
+            for key in sort]
+
+# Indexes for the raw collections imported from edX. Derived collections
+#   declare theirs through CollectionStrategy.indexes
+raw_indexes = {
+    'tracking_log': [
+        [('course_id', 1), ('username', 1), ('time', 1)],
+        [('course_id', 1), ('event_type', 1)],
+        [('course_id', 1), ('event_source', 1), ('username', 1),
+            ('time', 1)],
+        # For the first and last _id of a course, see 
+        #   PersonObjectTimeStrategy._create_sharded
+        [('course_id', 1), ('_id', 1)],
+    ],
+    'tracking_logs': [
+        [('course_id', 1), ('username', 1), ('time', 1)],
+        [('course_id', 1), ('event_type', 1)],
+        [('course_id', 1), ('event_source', 1), ('username', 1),
+            ('time', 1)],
+        [('course_id', 1), ('_id', 1)],
+    ],
+    'courseware_studentmodule': [
+        [('course_id', 1), ('module_type', 1)],
+        [('course_id', 1), ('student_id', 1)],
+    ],
+    'person_course': [[('course_id', 1), ('username', 1)]],
+    'course_axis': [[('course_id', 1), ('index', 1)]],
+    'course_structure': [[('course_id', 1), ('module_id', 1)]],
+    'grading_policy': [[('course_id', 1)]],
+    'forum_data': [[('course_id', 1)]],
+}
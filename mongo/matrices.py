@@ -0,0 +1,199 @@
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+from scipy import sparse
+from pandas import DataFrame
+
+from ..munge.names import to_filename
+from ..munge.sparse import SparseFrame
+
+class MatrixStore(object):
+    '''
+    Storage for matrix-shaped collections, e.g. derived_time_matrix, as NumPy
+    arrays instead of one mongo document per row. Each course's matrix is a
+    directory with the values as .npy files and json files with the row
+    and column labels. Dense matrices are stored as a single array and 
+    SparseFrames as the data, indices and indptr arrays of their CSR matrix.
+    Matrices are loaded with memory mapping, so opening one is instant 
+    regardless of its size, and the pages are shared by every process 
+    loading the same matrix.
+
+    Parameters
+    ----------
+    directory : str
+        Directory for the matrix files
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, course_id, collection_name):
+        '''
+        Directory of a course's matrix for a collection
+        '''
+        return os.path.join(self.directory,
+            to_filename(course_id),
+            collection_name)
+
+    def contains(self, course_id, collection_name):
+        '''
+        Checks whether a course's matrix for a collection has been saved
+        '''
+        path = self.path(course_id, collection_name)
+        return os.path.exists(os.path.join(path, 'meta.json'))
+
+    def save(self, course_id, collection_name, data, index = 'username'):
+        '''
+        Saves a matrix-shaped DataFrame or a SparseFrame. Columns of a 
+        DataFrame other than the index and course_id must be numeric and are
+        stored as floats.
+
+        Parameters
+        ----------
+        course_id : str
+            The course_id as specified by edX for the course
+        collection_name : str
+            Name of the data collection.
+        data : DataFrame or SparseFrame
+            Matrix with a row per index value, e.g. a row per username
+        index : str
+            Column with the row labels of a DataFrame. SparseFrames have their
+            own.
+        '''
+        if isinstance(data, SparseFrame):
+            index = data.index
+            rows = list(data.rows)
+            columns = list(data.columns)
+            arrays = {'data': data.matrix.data,
+                'indices': data.matrix.indices,
+                'indptr': data.matrix.indptr}
+            shape = data.shape
+            format = 'csr'
+        else:
+            columns = [column for column in data.columns
+                if column not in (index, 'course_id')]
+            values = np.ascontiguousarray(data[columns].values, dtype = float)
+            rows = list(data[index]) if index in data else list(data.index)
+            arrays = {'values': values}
+            shape = values.shape
+            format = 'dense'
+        meta = {'course_id': course_id,
+            'collection_name': collection_name,
+            'index': index,
+            'format': format,
+            'shape': list(shape)}
+
+        path = self.path(course_id, collection_name)
+        parent = os.path.dirname(path)
+        if not os.path.exists(parent):
+            os.makedirs(parent)
+
+        # The matrix is written to a temporary directory that replaces the old
+        #   one, so readers never see partial matrices
+        tmp = tempfile.mkdtemp(dir = parent)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, name + '.npy'), array)
+            self._dump(rows, tmp, 'rows.json')
+            self._dump(columns, tmp, 'columns.json')
+            self._dump(meta, tmp, 'meta.json')
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors = True)
+            raise
+        self.delete(course_id, collection_name)
+        os.rename(tmp, path)
+
+    def load(self, course_id, collection_name, sparse = False):
+        '''
+        Loads a course's matrix for a collection as a DataFrame. The values
+        of dense matrices are a copy on write memory map of the stored array,
+        so the DataFrame can be changed without changing the stored matrix.
+        Sparse matrices are only converted to dense DataFrames if sparse is
+        False, see load_sparse.
+
+        Parameters
+        ----------
+        course_id : str
+            The course_id as specified by edX for the course
+        collection_name : str
+            Name of the data collection.
+        sparse : boolean
+            Whether sparse matrices are returned as memory mapped SparseFrames
+
+        Returns
+        -------
+        data : DataFrame or SparseFrame
+            The matrix with the row labels in the index column and a course_id
+            column, or None if the matrix hasn't been saved. A SparseFrame if
+            sparse is True and the matrix was saved as one.
+        '''
+        if not self.contains(course_id, collection_name):
+            return None
+        path = self.path(course_id, collection_name)
+        meta = self._load(path, 'meta.json')
+        if (meta['format'] == 'csr') and sparse:
+            return self.load_sparse(course_id, collection_name)
+        if meta['format'] == 'csr':
+            data = self.load_sparse(course_id, collection_name).to_frame()
+        else:
+            columns = self._load(path, 'columns.json')
+            values = self._array(path, 'values')
+            data = DataFrame(values, columns = columns, copy = False)
+            data.insert(0, meta['index'], self._load(path, 'rows.json'))
+        data['course_id'] = course_id
+        return data
+
+    def load_sparse(self, course_id, collection_name):
+        '''
+        Loads a course's matrix for a collection as a SparseFrame. The arrays
+        of sparse matrices are memory mapped like dense ones. Dense matrices 
+        are converted.
+
+        Parameters
+        ----------
+        course_id : str
+            The course_id as specified by edX for the course
+        collection_name : str
+            Name of the data collection.
+
+        Returns
+        -------
+        matrix : SparseFrame
+            The matrix or None if it hasn't been saved
+        '''
+        if not self.contains(course_id, collection_name):
+            return None
+        path = self.path(course_id, collection_name)
+        meta = self._load(path, 'meta.json')
+        rows = self._load(path, 'rows.json')
+        columns = self._load(path, 'columns.json')
+        if meta['format'] == 'csr':
+            arrays = [self._array(path, name)
+                for name in ('data', 'indices', 'indptr')]
+            matrix = sparse.csr_matrix(tuple(arrays),
+                shape = tuple(meta['shape']),
+                copy = False)
+        else:
+            matrix = sparse.csr_matrix(self._array(path, 'values'))
+        return SparseFrame(matrix, rows, columns, index = meta['index'])
+
+    def delete(self, course_id, collection_name):
+        '''
+        Removes a course's matrix for a collection
+        '''
+        path = self.path(course_id, collection_name)
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors = True)
+
+    def _array(self, path, name):
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode = 'c')
+
+    def _dump(self, value, path, name):
+        with open(os.path.join(path, name), 'w') as f:
+            json.dump(value, f)
+
+    def _load(self, path, name):
+        with open(os.path.join(path, name)) as f:
+            return json.load(f)
@@ -1,2 +1,3 @@
 from .parser import Parser
-from .person_object_time import POTLogParser
\ No newline at end of file
+from .person_object_time import POTLogParser
+from .verb_classifier import VerbClassifier
\ No newline at end of file
@@ -1,4 +1,5 @@
 import abc
+from pandas import DataFrame
 
 class Parser(object):
     '''
@@ -13,4 +14,30 @@ class Parser(object):
         '''
         Parse individual records from the database
         '''
-        pass
\ No newline at end of file
+        pass
+
+    def parse_batch(self, data):
+        '''
+        Parses a batch of records from the database. Parsers that can work on
+        whole columns at once should override this. By default, every record
+        is parsed with parse and records parsed to None are dropped.
+
+        Parameters
+        ----------
+        data : DataFrame
+            Records from the database with a column per field
+
+        Returns
+        -------
+        parsed : DataFrame
+        '''
+        columns = [str(column) for column in data.columns]
+        parsed = []
+        for values in zip(*[data[column].values for column in data.columns]):
+            # Missing fields are left out like in the database
+            doc = dict((column, value) for column, value in zip(columns, values)
+                if not (isinstance(value, float) and value != value))
+            doc = self.parse(doc)
+            if doc:
+                parsed.append(doc)
+        return DataFrame.from_records(parsed)
\ No newline at end of file
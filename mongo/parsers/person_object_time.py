@@ -1,7 +1,12 @@
 import numpy as np
+import pandas as pd
+from pandas import Series, DataFrame
 
 from xtools.mongo.parsers import Parser
-from .log_patterns import verb_patterns
+from .verb_classifier import VerbClassifier
+
+# Shared by all parsers, so event types are only classified once
+classifier = VerbClassifier()
 
 # FIX: This doesn't need to be a class. Change it to a function.
 class POTLogParser(Parser):
@@ -27,15 +32,10 @@ class POTLogParser(Parser):
         except KeyError as e:
             return None
 
-        verb = None
-
         # Extracting the patterns for event_types out of this function clarifies
         #   the code and allows for easy additions and modifications to the
         #   patterns.
-        for pattern in verb_patterns:
-            if pattern['regex'].search(event_type):
-                verb = pattern['verb']
-                break
+        verb = classifier.classify(event_type)
 
         # If the verb wasn't found in our patterns, we ignore it.
         if not verb:
@@ -55,21 +55,82 @@ class POTLogParser(Parser):
         #   'correct' and 'partially-correct' parts
         if (verb == 'problem_save') | (verb == 'problem_check'):
             if doc['event_source'] == 'server':
-                correct_map = doc['event']['correct_map']
-                total = 0.0
-                correct = 0.0
-                for key, val in correct_map.iteritems():
-                    total += 1.
-                    if val['correctness'] == 'correct':
-                        correct += 1.
-                    elif val['correctness'] == 'partially-correct':
-                        correct += 0.5
-                if total > 0:
-                    correct = correct / total
-                    activity['detail'] = {'correct': correct}
+                detail = self._detail(doc['event'])
+                if isinstance(detail, dict):
+                    activity['detail'] = detail
 
         for k, v in activity.items():
             try: activity[k] = v.encode('utf8', 'replace')
             except Exception: pass # NoneType
         return activity
 
+    def parse_batch(self, data):
+        '''
+        Parses a batch of log items at once. Verbs are classified once per 
+        distinct event_type and the other fields are taken as whole columns,
+        so strings are left as they come from the database.
+
+        Parameters
+        ----------
+        data : DataFrame
+            Log items with event_type, event_source, username, time and
+            optionally module_id and event columns
+
+        Returns
+        -------
+        activities : DataFrame
+            Parsed log items with username, verb, time, module_id, source and
+            detail columns, see parse
+        '''
+        # Some logs in 6.002x Spring_2013 didn't have event_type
+        if data.empty or ('event_type' not in data):
+            return DataFrame()
+
+        codes, event_types = pd.factorize(data['event_type'].values)
+        verbs = np.array([classifier.classify(event_type)
+            for event_type in event_types] + [None], dtype = object)
+        # Missing event_types have a code of -1, which picks the final None
+        verb = verbs[codes]
+
+        # If the verb wasn't found in our patterns, we ignore it.
+        found = pd.notnull(verb)
+        data = data[found]
+        verb = verb[found]
+        if data.empty:
+            return DataFrame()
+
+        server = (data['event_source'] == 'server').values
+        activities = DataFrame({'username': data['username'].values,
+            'verb': verb,
+            'time': data['time'].values,
+            'module_id': data['module_id'].values if 'module_id' in data \
+                else np.NaN,
+            'source': np.where(server, 0, 1)},
+            columns = ['username', 'verb', 'time', 'module_id', 'source'])
+
+        # Only graded server events have details, see parse
+        graded = server & ((verb == 'problem_save') | (verb == 'problem_check'))
+        if graded.any():
+            events = data['event'].values[graded]
+            activities['detail'] = np.NaN
+            activities.loc[graded, 'detail'] = Series([self._detail(event)
+                for event in events], index = activities.index[graded])
+        return activities
+
+    def _detail(self, event):
+        '''
+        Fraction of the parts of a graded problem that are correct
+        '''
+        correct_map = event['correct_map']
+        total = 0.0
+        correct = 0.0
+        for key, val in correct_map.iteritems():
+            total += 1.
+            if val['correctness'] == 'correct':
+                correct += 1.
+            elif val['correctness'] == 'partially-correct':
+                correct += 0.5
+        if total > 0:
+            return {'correct': correct / total}
+        return np.NaN
+
@@ -0,0 +1,93 @@
+import re
+
+from .log_patterns import verb_patterns
+
+# Patterns that only match a single literal string, e.g. "^play_video$"
+_exact = re.compile(r'^\^([^\\.^$*+?{}\[\]|()]*)\$$')
+
+class VerbClassifier(object):
+    '''
+    Classifies event types with a list of verb patterns. The verb of the
+    first pattern that matches an event type is used, like searching the
+    patterns one at a time, but with a single lookup for the patterns that
+    match one literal string and a single combined regular expression for
+    the others. Results are memoized per event type.
+
+    Parameters
+    ----------
+    patterns : list of dicts
+        Patterns with 'verb' and 'regex' keys in order of precedence. The
+        default is log_patterns.verb_patterns.
+    cache_size : int
+        Maximum number of memoized event types. The memo is cleared once it
+        is full.
+
+    Examples
+    --------
+    >>> classifier = VerbClassifier()
+    >>> classifier.classify('play_video')
+    'video_play'
+    >>> classifier.classify('/courses/HarvardX/CB22x/2013_Spring/wiki/')
+    'wiki_view'
+    '''
+    def __init__(self, patterns = None, cache_size = 100000):
+        patterns = verb_patterns if patterns is None else patterns
+        self.patterns = patterns
+        self.cache_size = cache_size
+        self._memo = {}
+
+        # {event_type -> index of the first pattern for it}
+        self._exact = {}
+        # Each pattern becomes a named group that can match anywhere in the
+        #   string, so re.match takes the first pattern in the alternation that
+        #   a search would find
+        groups = []
+        for i, pattern in enumerate(patterns):
+            regex = pattern['regex']
+            literal = _exact.match(regex.pattern)
+            if literal and not regex.flags & ~re.UNICODE:
+                self._exact.setdefault(literal.group(1), i)
+            else:
+                groups.append((i,
+                    '(?P<p{0}>.*?(?:{1}))'.format(i, regex.pattern)))
+
+        # Literal matches only need to be checked against the patterns before
+        #   them, so there is a combined expression for each of them
+        self._combined = {}
+        for i in set(self._exact.values()) | set([len(patterns)]):
+            before = [group for j, group in groups if j < i]
+            self._combined[i] = re.compile('|'.join(before)) \
+                if before else None
+
+    def classify(self, event_type):
+        '''
+        Finds the verb for an event type
+
+        Parameters
+        ----------
+        event_type : str
+            event_type of a log event
+
+        Returns
+        -------
+        verb : str
+            The verb of the first matching pattern or None if no pattern
+            matches
+        '''
+        try:
+            return self._memo[event_type]
+        except KeyError:
+            pass
+
+        index = self._exact.get(event_type)
+        combined = self._combined[len(self.patterns) if index is None 
+            else index]
+        match = combined.match(event_type) if combined is not None else None
+        if match is not None:
+            index = int(match.lastgroup[1:])
+        verb = self.patterns[index]['verb'] if index is not None else None
+
+        if len(self._memo) >= self.cache_size:
+            self._memo.clear()
+        self._memo[event_type] = verb
+        return verb
@@ -0,0 +1,325 @@
+import numpy as np
+import pandas as pd
+from pandas import Series
+
+class Query(object):
+    '''
+    Query is an immutable and hashable description of a request for data from
+    a collection. Since it can't be changed once created, it can be passed
+    around and used as a cache key without defensive copies. Methods that
+    refine a query return a new Query.
+
+    Parameters
+    ----------
+    collection_name : str
+        Name of the data collection.
+    conditions : dict
+        A set of constraints for the results from the collection. The
+        default is no constraints
+    fields : str Array or array-like object
+        A list of fields to return in the results. The default is all fields
+    limit : int
+        Number of results to return. The default is all results.
+    sort : str Array or array-like object
+        Fields to sort the results by, either as names for ascending order or
+        (name, direction) tuples. The default is no sorting.
+
+    Examples
+    --------
+    >>> query = Query('derived_person_object_time', {'source': 1})
+    >>> query = query.find({'course_id': 'HarvardX/CB22x/2013_Spring'})
+    >>> query.conditions
+    {'source': 1, 'course_id': 'HarvardX/CB22x/2013_Spring'}
+    '''
+    __slots__ = ('_collection_name', '_conditions', '_fields', '_limit',
+        '_sort', '_hash')
+
+    def __init__(self, collection_name, conditions = None, fields = None,
+            limit = None, sort = None):
+        conditions = {} if conditions is None else conditions
+        object.__setattr__(self, '_collection_name', collection_name)
+        object.__setattr__(self, '_conditions', _freeze(conditions))
+        object.__setattr__(self, '_fields', tuple(fields) if fields else ())
+        object.__setattr__(self, '_limit', limit if limit else None)
+        object.__setattr__(self, '_sort', _sort_spec(sort))
+        object.__setattr__(self, '_hash', hash(self._key()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Query objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Query objects are immutable')
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, Query) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'Query({0!r}, conditions={1!r}, fields={2!r}, limit={3!r}, '\
+            'sort={4!r})'.format(self.collection_name,
+                self.conditions,
+                self.fields,
+                self.limit,
+                self.sort)
+
+    def __getstate__(self):
+        return (self.collection_name, self.conditions, self.fields,
+            self.limit, self.sort)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def collection_name(self):
+        return self._collection_name
+
+    @property
+    def conditions(self):
+        '''
+        A new dict of the conditions, which can be changed freely
+        '''
+        return _thaw(self._conditions)
+
+    @property
+    def fields(self):
+        return list(self._fields)
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def sort(self):
+        return list(self._sort) if self._sort else None
+
+    def find(self, conditions = None, fields = None, limit = None,
+            sort = None):
+        '''
+        Creates a refined query
+
+        Parameters
+        ----------
+        conditions : dict
+            A set of constraints that are added to the conditions of this
+            query. Constraints on the same field replace the current ones.
+        fields : str Array or array-like object
+            A list of fields to return in the results. The default is the
+            fields of this query.
+        limit : int
+            Number of results to return. The default is the limit of this
+            query.
+        sort : str Array or array-like object
+            Fields to sort the results by. The default is the sort of this
+            query.
+
+        Returns
+        -------
+        query : Query
+        '''
+        new_conditions = self.conditions
+        new_conditions.update(conditions if conditions else {})
+        return Query(self.collection_name,
+            conditions = new_conditions,
+            fields = fields if fields else self._fields,
+            limit = limit if limit else self._limit,
+            sort = sort if sort else self._sort)
+
+    def apply(self, data):
+        '''
+        Answers the query from a DataFrame in memory instead of the database
+
+        Parameters
+        ----------
+        data : DataFrame
+            Records of the collection, which must include the fields used in
+            the conditions
+
+        Returns
+        -------
+        df : DataFrame
+            The records matching the query or None if the conditions use
+            operators that can't be evaluated in memory
+        '''
+        mask = matches(data, self.conditions)
+        if mask is None:
+            return None
+        df = data[mask]
+
+        if self._sort:
+            order = np.arange(len(df))
+            # Stable sorts from the last key to the first sort by all keys
+            for key, direction in reversed(self._sort):
+                if key not in df:
+                    continue
+                # Null values have a code of -1, so they come first in 
+                #   ascending order like in mongo
+                codes, uniques = pd.factorize(df[key].values[order],
+                    sort = True)
+                ranks = codes + 1
+                ranks = ranks if direction > 0 else -ranks
+                order = order[np.argsort(ranks, kind = 'mergesort')]
+            df = df.take(order)
+
+        # Like in mongo, the results can be sorted by fields they don't have
+        if self._fields:
+            df = df.loc[:, [field for field in self._fields if field in df]]
+
+        if self._limit:
+            df = df[:self._limit]
+
+        return df.reset_index(drop = True)
+
+    def covers(self, other):
+        '''
+        Checks whether the results of this query are a superset of the results
+        of another query, so the other query can be answered from them with
+        apply
+
+        Parameters
+        ----------
+        other : Query
+
+        Returns
+        -------
+        covers : boolean
+        '''
+        if (other.collection_name != self.collection_name) or self._limit:
+            return False
+
+        conditions = dict(self._conditions)
+        other_conditions = dict(other._conditions)
+        for key, value in conditions.iteritems():
+            if other_conditions.get(key, _missing) != value:
+                return False
+
+        if self._fields:
+            extra = [key for key in other_conditions if key not in conditions]
+            sort = [key for key, direction in other._sort]
+            needed = set(other._fields) | set(extra) | set(sort)
+            if not (other._fields and needed.issubset(self._fields)):
+                return False
+
+        return True
+
+    def residual(self, other):
+        '''
+        Creates the query that turns the results of this query into the 
+        results of other, which this query must cover
+
+        Parameters
+        ----------
+        other : Query
+
+        Returns
+        -------
+        query : Query
+            Query with the conditions of other that aren't in this query
+        '''
+        conditions = dict(self._conditions)
+        extra = dict((key, _thaw(value)) for key, value in other._conditions
+            if key not in conditions)
+        return Query(other.collection_name, extra, other._fields, other._limit,
+            other._sort)
+
+    def _key(self):
+        return (self._collection_name, self._conditions, self._fields,
+            self._limit, self._sort)
+
+class _FrozenDict(tuple):
+    '''
+    Sorted tuple of the (key, value) pairs of a dict
+    '''
+    pass
+
+class _FrozenList(tuple):
+    '''
+    Tuple of the items of a list
+    '''
+    pass
+
+def _freeze(value):
+    '''
+    Recursively turns dicts and lists into hashable tuples
+    '''
+    if isinstance(value, dict):
+        return _FrozenDict(sorted((key, _freeze(item))
+            for key, item in value.iteritems()))
+    elif isinstance(value, (list, tuple, set)):
+        return _FrozenList(_freeze(item) for item in value)
+    return value
+
+def _thaw(value):
+    '''
+    Recursively turns values frozen by _freeze back into dicts and lists
+    '''
+    if isinstance(value, _FrozenDict):
+        return dict((key, _thaw(item)) for key, item in value)
+    elif isinstance(value, _FrozenList):
+        return [_thaw(item) for item in value]
+    return value
+
+def _sort_spec(sort):
+    '''
+    Turns a sort specification of field names and/or (field, direction) tuples
+    into a tuple of (field, direction) tuples
+    '''
+    if not sort:
+        return ()
+    if isinstance(sort, basestring):
+        sort = [sort]
+    return tuple((key, 1) if isinstance(key, basestring) else tuple(key)
+        for key in sort)
+
+_missing = object()
+
+# Comparison operators that can be evaluated in memory by matches
+_operators = {
+    '$gt': lambda column, value: column > value,
+    '$gte': lambda column, value: column >= value,
+    '$lt': lambda column, value: column < value,
+    '$lte': lambda column, value: column <= value,
+    '$ne': lambda column, value: column != value,
+    '$in': lambda column, value: column.isin(value),
+    '$nin': lambda column, value: ~column.isin(value),
+}
+
+def matches(data, conditions):
+    '''
+    Evaluates mongo conditions against a DataFrame. Equality and the 
+    comparison operators in _operators are supported.
+
+    Parameters
+    ----------
+    data : DataFrame
+    conditions : dict
+        Mongo style conditions on the columns of data
+
+    Returns
+    -------
+    mask : Series
+        Boolean Series of the rows matching the conditions, or None if the
+        conditions can't be evaluated in memory
+    '''
+    mask = Series(True, index = data.index)
+    for key, value in conditions.iteritems():
+        if key not in data:
+            return None
+        column = data[key]
+        if isinstance(value, dict):
+            for operator, operand in value.iteritems():
+                if operator not in _operators:
+                    return None
+                mask &= _operators[operator](column, operand)
+        elif value is None:
+            mask &= column.isnull()
+        elif isinstance(value, (list, tuple)) or hasattr(value, 'pattern'):
+            # Array and regular expression matching aren't supported
+            return None
+        else:
+            mask &= (column == value)
+    return mask
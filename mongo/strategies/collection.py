@@ -14,6 +14,51 @@ class CollectionStrategy(object):
         """
         pass
 
+    @property
+    def indexes(self):
+        """
+        Indexes the collection generated by this strategy should have. Each
+        index is a list of (field, direction) tuples. XData makes sure they 
+        exist after storing the collection.
+        """
+        return [[('course_id', 1)]]
+
+    @property
+    def inputs(self):
+        """
+        Names of the collections read by create. XData computes missing 
+        inputs with strategies before this collection, so they must not 
+        depend on this collection.
+        """
+        return []
+
+    @property
+    def incremental(self):
+        """
+        Whether the strategy implements increment, so XData.refresh only
+        processes the events logged since the last refresh
+        """
+        return False
+
+    @property
+    def keys(self):
+        """
+        Fields which uniquely identify the documents of the collection, e.g.
+        ['username', 'date'], used to upsert the documents changed by 
+        increment. If None, all documents matching the conditions returned
+        by increment are replaced.
+        """
+        return None
+
+    @property
+    def matrix(self):
+        """
+        Whether the collection is a numeric matrix with a row per username,
+        which XData can store as an array with a MatrixStore instead of a 
+        document per row
+        """
+        return False
+
     @abc.abstractmethod
     def create(self, context):
         """
@@ -30,4 +75,35 @@ class CollectionStrategy(object):
         -------
         data : DataFrame
         """
-        pass
\ No newline at end of file
+        pass
+
+    def increment(self, context, since = None):
+        """
+        Computes the documents of the collection that change once the events
+        logged after a watermark are processed. incremental is the only switch
+        XData.refresh checks; this default recomputes the whole collection
+        with create, so strategies that aren't incremental need not override
+        it.
+
+        Parameters
+        ----------
+        context : XData
+            Provides methods for getting any data needed to create the 
+            collection defined by this strategy as well as any additional 
+            constraints
+        since : str
+            Time of the latest event processed by the last refresh. If None, 
+            the whole collection is computed.
+
+        Returns
+        -------
+        data : DataFrame
+            Documents replacing the course's documents matching conditions
+        conditions : dict or list of dicts
+            Documents that are replaced by data. With a list, e.g. for 
+            batches of users, the documents matching each conditions are 
+            replaced by the rows of data matching them.
+        watermark : str
+            Time of the latest event processed, None if unknown
+        """
+        return self.create(context), {}, None
\ No newline at end of file
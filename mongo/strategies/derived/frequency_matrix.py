@@ -7,13 +7,36 @@ import re
 from pandas import Series, DataFrame
 
 from ..collection import CollectionStrategy
+from ....munge.sparse import SparseFrame
 
 class FrequencyMatrixStrategy(CollectionStrategy):
 
+    def __init__(self, sparse = False):
+        '''
+        Parameters
+        ----------
+        sparse : boolean
+            If True, create returns a SparseFrame of usernames by module_ids 
+            instead of a dense DataFrame
+        '''
+        self.sparse = sparse
+
     @property
     def name(self):
         return 'derived_frequency_matrix'
 
+    @property
+    def indexes(self):
+        return [[('course_id', 1), ('username', 1)]]
+
+    @property
+    def inputs(self):
+        return ['derived_person_object_time']
+
+    @property
+    def matrix(self):
+        return True
+
     def create(self, context):
         '''
         Create a matrix of browser event counts for every module_id in a course
@@ -28,7 +51,7 @@ class FrequencyMatrixStrategy(CollectionStrategy):
 
         Returns
         -------
-        data : DataFrame
+        data : DataFrame or SparseFrame
 
             Columns
             -------
@@ -41,12 +64,16 @@ class FrequencyMatrixStrategy(CollectionStrategy):
             conditions = {'source': 1},
             fields = ['username','module_id'])
 
-        freq_matrix = self.from_data(data).reset_index()
+        freq_matrix = self.from_data(data, sparse = self.sparse)
+        if self.sparse:
+            return freq_matrix
+
+        freq_matrix = freq_matrix.reset_index()
         freq_matrix['course_id'] = context.course_id
 
         return freq_matrix
 
-    def from_data(self, data):
+    def from_data(self, data, sparse = False):
         '''
         Create a matrix of browser event counts for every module_id in a course
         for every user
@@ -55,10 +82,13 @@ class FrequencyMatrixStrategy(CollectionStrategy):
         ----------
         data : DataFrame
             username and module id from derived_person_object_time
+        sparse : boolean
+            Whether to return a SparseFrame, which only keeps the module_ids
+            each user has events for
 
         Returns
         -------
-        freq_matrix : DataFrame
+        freq_matrix : DataFrame or SparseFrame
 
             Columns
             -------
@@ -67,6 +97,10 @@ class FrequencyMatrixStrategy(CollectionStrategy):
             module_id* : int
                 Browser event count for the username
         '''
+        if sparse:
+            return SparseFrame.from_records(data['username'],
+                data['module_id'])
+
         freq_matrix = data.pivot_table(rows = 'username',
            cols = 'module_id',
            aggfunc = len).fillna(0)
@@ -0,0 +1,77 @@
+import pandas as pd
+from pandas import DataFrame
+
+def latest_time(context, collection_name = 'derived_person_object_time'):
+    '''
+    Finds the time of the course's latest event in a collection
+
+    Parameters
+    ----------
+    context : XData
+    collection_name : str
+        Name of a collection with a time field
+
+    Returns
+    -------
+    time : str
+        Timestamp string of the latest event or None if there are no events
+    '''
+    latest = context.fetch(collection_name,
+        fields = ['time'],
+        sort = [('time', -1)],
+        limit = 1)
+    return None if latest.empty else latest['time'].iloc[0]
+
+def person_days(context, since, conditions = None, fields = None,
+        batch_size = 10000):
+    '''
+    Finds the derived_person_object_time records needed to recompute the
+    (username, date) pairs with events after since. The records of the users
+    with new events from the date of since on are read, so every affected
+    pair is complete, including events before since on the same day. Users
+    are read and replaced in batches, so the $in conditions of a large 
+    backlog stay below mongo's 16 MB document limit.
+
+    Parameters
+    ----------
+    context : XData
+    since : str
+        Time of the latest event processed by the last refresh
+    conditions : dict
+        Additional constraints for the records, e.g. {'source': 1}
+    fields : str Array or array-like object
+        Fields of the records. username and time are needed.
+    batch_size : int
+        Number of users in each $in condition
+
+    Returns
+    -------
+    pot : DataFrame
+        Records of the affected pairs. Empty if there are no new events.
+    scope : list of dicts
+        Conditions for the username and date of the documents that are
+        replaced by aggregations of pot, one per batch of users
+    watermark : str
+        Time of the latest new event or since if there are none
+    '''
+    conditions = dict(conditions if conditions else {})
+    new = context.fetch('derived_person_object_time',
+        conditions = dict(conditions, time = {'$gt': since}),
+        fields = ['username', 'time'])
+    if new.empty:
+        return DataFrame(), None, since
+
+    users = new['username'].unique().tolist()
+    date = since[:10] # '%Y-%m-%d'
+    pots = []
+    scope = []
+    for start in xrange(0, len(users), batch_size):
+        batch = users[start:start+batch_size]
+        pots.append(context.fetch('derived_person_object_time',
+            conditions = dict(conditions,
+                username = {'$in': batch},
+                time = {'$gte': date}),
+            fields = fields))
+        scope.append({'username': {'$in': batch}, 'date': {'$gte': date}})
+    pot = pd.concat(pots, ignore_index = True)
+    return pot, scope, new['time'].max()
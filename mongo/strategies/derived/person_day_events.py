@@ -7,6 +7,7 @@ import pandas as pd
 from pandas import Series, DataFrame
 
 from ..collection import CollectionStrategy
+from .increments import latest_time, person_days
 
 class PersonDayEventsStrategy(CollectionStrategy):
 
@@ -14,6 +15,22 @@ class PersonDayEventsStrategy(CollectionStrategy):
     def name(self):
         return 'derived_person_day_events'
 
+    @property
+    def indexes(self):
+        return [[('course_id', 1), ('username', 1), ('date', 1)]]
+
+    @property
+    def inputs(self):
+        return ['derived_person_object_time']
+
+    @property
+    def incremental(self):
+        return True
+
+    @property
+    def keys(self):
+        return ['username', 'date']
+
     def create(self, context):
         '''
         Creates a DataFrame of daily events counts for users in a course
@@ -46,6 +63,63 @@ class PersonDayEventsStrategy(CollectionStrategy):
         pot = context.get('derived_person_object_time',
             fields = ['username','verb','time'])
 
+        person_day = self.from_data(pot)
+        person_day["course_id"] = context.course_id
+
+        return person_day
+
+    def increment(self, context, since = None):
+        '''
+        Recomputes the daily event counts of the users and dates with events
+        after since
+
+        Parameters
+        ----------
+        context : XData
+            Provides methods for getting any data needed to create the 
+            collection defined by this strategy as well as any additional 
+            constraints
+        since : str
+            Time of the latest derived_person_object_time event processed by
+            the last refresh. If None, the whole collection is created.
+
+        Returns
+        -------
+        data : DataFrame
+            Daily event counts, see create
+        conditions : list of dicts
+            Users and dates replaced by data, in batches of users
+        watermark : str
+            Time of the latest event processed
+        '''
+        if since is None:
+            # Taken first, so events logged while creating are processed again
+            #   instead of never
+            watermark = latest_time(context)
+            return self.create(context), {}, watermark
+
+        pot, conditions, watermark = person_days(context, since,
+            fields = ['username','verb','time'])
+        if pot.empty:
+            return DataFrame(), conditions, watermark
+        person_day = self.from_data(pot)
+        person_day["course_id"] = context.course_id
+        return person_day, conditions, watermark
+
+    def from_data(self, pot):
+        '''
+        Creates a DataFrame of daily events counts for users
+
+        Parameters
+        ----------
+        pot : DataFrame
+            username, verb and time fields from derived_person_object_time
+
+        Returns
+        -------
+        data : DataFrame
+            Daily event counts without the course_id, see create
+        '''
         # The time field in person_object_time is a str, so we can quickly 
         #   slice off the date. This is much faster than converting all times 
         #   to datetime object
@@ -58,6 +132,5 @@ class PersonDayEventsStrategy(CollectionStrategy):
 
         person_day['nevents'] = person_day.sum(axis = 1)
         person_day.reset_index(inplace = True)
-        person_day["course_id"] = context.course_id
 
         return person_day
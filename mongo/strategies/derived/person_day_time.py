@@ -7,13 +7,30 @@ import pandas as pd
 from pandas import Series, DataFrame
 
 from ..collection import CollectionStrategy
-from ....munge import time as t
+from .time_attribution import TimeAttribution, time_attribution
+from .increments import latest_time, person_days
 
 class PersonDayTimeStrategy(CollectionStrategy):
     
     @property
     def name(self):
         return 'derived_person_day_time'
+
+    @property
+    def indexes(self):
+        return [[('course_id', 1), ('username', 1), ('date', 1)]]
+
+    @property
+    def inputs(self):
+        return ['derived_person_object_time']
+
+    @property
+    def incremental(self):
+        return True
+
+    @property
+    def keys(self):
+        return ['username', 'date']
     
     def create(self, context, max_time = 30*60, min_time = 0):
         '''
@@ -39,19 +56,66 @@ class PersonDayTimeStrategy(CollectionStrategy):
             time_spent : float
                 Seconds of total time spent
         '''
-        # Only want browser events, i.e. source = 1, since server events 
-        #   don't indicate user time spent
-        pot = context.get('derived_person_object_time',
-            conditions = {'source': 1},
-            fields = ['time', 'username'])
-        
-        person_day_time = self.from_data(pot)
+        # The browser events are shared with derived_time_matrix and 
+        #   derived_person_module, so they are only read and sorted once
+        attribution = time_attribution(context,
+            max_time = max_time,
+            min_time = min_time)
+        person_day_time = attribution.person_day_time()
 
         person_day_time['course_id'] = context.course_id
 
         return person_day_time
 
-    def from_data(self, data):
+    def increment(self, context, since = None, max_time = 30*60,
+            min_time = 0):
+        '''
+        Recomputes the daily time spent by the users on the dates with 
+        browser events after since
+
+        Parameters
+        ----------
+        context : XData
+            Provides methods for getting any data needed to create the 
+            collection defined by this strategy as well as any additional 
+            constraints
+        since : str
+            Time of the latest derived_person_object_time event processed by
+            the last refresh. If None, the whole collection is created.
+        max_time : int
+            Max number of seconds for any duration, like for create
+        min_time : int
+            Min number of seconds for any duration, like for create
+
+        Returns
+        -------
+        data : DataFrame
+            Daily time spent, see create
+        conditions : list of dicts
+            Users and dates replaced by data, in batches of users
+        watermark : str
+            Time of the latest event processed
+        '''
+        if since is None:
+            # Taken first, so events logged while creating are processed again
+            #   instead of never
+            watermark = latest_time(context)
+            data = self.create(context, max_time = max_time, 
+                min_time = min_time)
+            return data, {}, watermark
+
+        pot, conditions, watermark = person_days(context, since,
+            conditions = {'source': 1},
+            fields = ['time', 'username'])
+        if pot.empty:
+            return DataFrame(), conditions, watermark
+        person_day_time = self.from_data(pot,
+            max_time = max_time,
+            min_time = min_time)
+        person_day_time['course_id'] = context.course_id
+        return person_day_time, conditions, watermark
+
+    def from_data(self, data, max_time = 30*60, min_time = 0):
         '''
         Creates a DataFrame of daily time spent by users in a course
 
@@ -60,6 +124,12 @@ class PersonDayTimeStrategy(CollectionStrategy):
         data : DataFrame
             time and username fields from derived_person_object_time
 
+        max_time : int
+            Max number of seconds for any duration
+
+        min_time : int
+            Min number of seconds for any duration
+
         Returns
         -------
         data : DataFrame
@@ -73,14 +143,7 @@ class PersonDayTimeStrategy(CollectionStrategy):
             time_spent : float
                 Seconds of total time spent
         '''
-        # The time field in person_object_time is a str, so we can quickly slice
-        #   off the date. This is much faster than converting all times to
-        #   datetime object
-        data['date'] = data['time'].apply(lambda x: x[:10])
-        data['time'] = data.time.apply(t.to_time)
-
-        grouped = data.groupby(['username','date'])
-        person_day_time = grouped.apply(t.total_time_spent)
-        person_day_time.name = 'time_spent'
-        person_day_time = person_day_time.reset_index()
-        return person_day_time
\ No newline at end of file
+        attribution = TimeAttribution(data,
+            max_time = max_time,
+            min_time = min_time)
+        return attribution.person_day_time()
@@ -7,7 +7,7 @@ import re
 from pandas import Series, DataFrame
 
 from ..collection import CollectionStrategy
-from xtools.munge import time as t
+from .time_attribution import TimeAttribution, time_attribution
 
 class PersonModuleStrategy(CollectionStrategy):
 
@@ -15,6 +15,14 @@ class PersonModuleStrategy(CollectionStrategy):
     def name(self):
         return 'derived_person_module'
 
+    @property
+    def indexes(self):
+        return [[('course_id', 1), ('username', 1), ('module_id', 1)]]
+
+    @property
+    def inputs(self):
+        return ['derived_person_object_time']
+
     def create(self, context, max_time = 30*60, min_time = 0):
         '''
         Creates a DataFrame for the number of interactions and time spent by
@@ -50,21 +58,18 @@ class PersonModuleStrategy(CollectionStrategy):
             freq : int
                 Number of times the user interacted with the module
         '''
-        # Only want browser events, i.e. source = 1, since server events 
-        #   don't indicate user time spent
-        data = context.get('tracking_logs',
-            conditions = {'event_source': 'browser'},
-            fields = ['time', 'username','module_id'])
-
-        # The heavy lifting of this function was separated into 'from_data' in
-        #   order to allow use of this processing on subsets of the
-        #   person_object_time data 
-        person_module = self.from_data(data)
+        # The browser events are shared with derived_time_matrix and 
+        #   derived_person_day_time, so they are only read and sorted once
+        attribution = time_attribution(context,
+            max_time = max_time,
+            min_time = min_time)
+        person_module = attribution.person_module()
 
         person_module['course_id'] = context.course_id
         return person_module
 
-    def from_data(self, data, max_time = 30*60, min_time = 0):
+    def from_data(self, data, max_time = 30*60, min_time = 0,
+            presorted = False):
         '''
         Creates a DataFrame for the number of interactions and time spent by
         every user on each module in a course.
@@ -80,6 +85,10 @@ class PersonModuleStrategy(CollectionStrategy):
         min_time : int
             Min number of seconds for any duration
 
+        presorted : boolean
+            Whether data is already sorted by username and time, e.g. by mongo.
+            The order is verified and data is only sorted if it isn't.
+
         Returns
         -------
         person_module : DataFrame
@@ -97,45 +106,11 @@ class PersonModuleStrategy(CollectionStrategy):
             freq : int
                 Number of times the user interacted with the module
         '''
-        # Creates a series for the number of times that users interacted with
-        #   the course modules which can easily be added to person_module later
-        freq_data = data.loc[:,['username', 'module_id']]
-        mod_freqs = freq_data.groupby(['username', 'module_id']).agg(len)
-
-        # Due to inconsistencies in the logs pd.to_datetime didn't always work
-        data['time'] = data['time'].apply(t.to_time)
-
-        data = data.sort(['username','time']).reset_index()
-
-        # Calling 'diff(-1)' on the time series creates a new series which is
-        #   the time from the next event to the current one i.e. 
-        #   current_time - next_time. Since the time stamps are in ascending
-        #   order, this new series contains negative timedeltas, so the -1 makes
-        #   the timedeltas positive
-        data['time_spent'] = data.time.diff(-1)*-1
-
-        # The time_spent in the last event for each user is invalid, because
-        #   it is the time from the user's last event to the next user's first 
-        #   event. To give a reasonable estimate of time these last events
-        #   need to be removed.
-        last_events = data.groupby('username').last()
-        data = data[False == data['index'].isin(last_events['index'])]
-
-        # Large gaps in time can appear in the logs when user goes away from the
-        #   keyboard or logs off. To account for this, an upper limit can be set
-        #   to remove such events.
-        max_time = np.timedelta64(max_time, 's')
-        limited = data[data['time_spent'] < max_time].loc[:,
-            ['username','module_id', 'time_spent']]
-
-
-        person_module = limited.groupby(['username', 'module_id']).agg(sum)
-        person_module['freq'] = mod_freqs
-
-        # Summing the timedeltas outputs nanoseconds which isn't human
-        #   readable, so dividing by 10^9 turns this sum into seconds
-        person_module['time_spent'] = person_module['time_spent'] / 10.**9
-        person_module.reset_index(inplace = True) # removes multi-index
-
-        return person_module
-             
+        # The heavy lifting is shared with the other time strategies in 
+        #   TimeAttribution, which finds the time spent on each event as the
+        #   time until the user's next event
+        attribution = TimeAttribution(data,
+            max_time = max_time,
+            min_time = min_time,
+            presorted = presorted)
+        return attribution.person_module()
@@ -1,12 +1,49 @@
+import multiprocessing
+import pandas as pd
+from pandas import DataFrame
+from bson.objectid import ObjectId
+
 from xtools.mongo.parsers import POTLogParser
+from xtools.mongo.clients.mongo_client import MongoClient
 from ..collection import CollectionStrategy
 
 class PersonObjectTimeStrategy(CollectionStrategy):
-    
+
+    def __init__(self, processes = None, shards_per_process = 4):
+        '''
+        Parameters
+        ----------
+        processes : int
+            If more than 1, create splits the course's tracking logs into 
+            shards by _id range and parses them in a pool of processes, each
+            with its own mongo connection. Only used when the context reads
+            with a MongoClient. The default parses the logs in one process.
+        shards_per_process : int
+            Number of shards for each process. Extra shards keep the 
+            processes busy when the shards differ in size.
+        '''
+        self.processes = processes if processes else 1
+        self.shards_per_process = shards_per_process
+
     @property
     def name(self):
         return 'derived_person_object_time'
 
+    @property
+    def indexes(self):
+        return [[('course_id', 1), ('username', 1), ('time', 1)],
+            [('course_id', 1), ('source', 1), ('username', 1), ('time', 1)],
+            [('course_id', 1), ('verb', 1)],
+            [('course_id', 1), ('time', 1)]]
+
+    @property
+    def inputs(self):
+        return ['tracking_log']
+
+    @property
+    def incremental(self):
+        return True
+
     def create(self, context):
         '''
         Creates a DataFrame that distills the most important information from
@@ -38,7 +75,136 @@ class PersonObjectTimeStrategy(CollectionStrategy):
             detail : str
                 Important details for the event
         '''
-        parser = POTLogParser()
-        data = context.get('tracking_log', parser=parser)
+        sharded = (self.processes > 1) and \
+            isinstance(context.client, MongoClient)
+        if sharded:
+            data = self._create_sharded(context)
+        else:
+            parser = POTLogParser()
+            data = context.get('tracking_log', parser=parser)
         data['course_id'] = context.course_id
-        return data
\ No newline at end of file
+        return data
+
+    def _create_sharded(self, context):
+        '''
+        Parses the course's tracking logs in shards in a pool of processes
+        '''
+        db = context.locate('tracking_log')
+        if db is None:
+            return DataFrame()
+
+        first = context.fetch('tracking_log', fields = ['_id'],
+            sort = [('_id', 1)], limit = 1, mongo_id = True)
+        last = context.fetch('tracking_log', fields = ['_id'],
+            sort = [('_id', -1)], limit = 1, mongo_id = True)
+        shards = id_ranges(first['_id'].iloc[0], last['_id'].iloc[0],
+            self.processes * self.shards_per_process)
+        tasks = [(db, dict(shard, course_id = context.course_id),
+            context.client.pull_size) for shard in shards]
+        context.logger.log('Parsing tracking_log in {0} shards with {1} '\
+            'processes'.format(len(tasks), self.processes))
+
+        pool = multiprocessing.Pool(min(self.processes, len(tasks)))
+        try:
+            # imap keeps the shards in _id order
+            frames = [frame for frame in pool.imap(parse_shard, tasks)
+                if not frame.empty]
+        finally:
+            pool.close()
+            pool.join()
+        if len(frames) == 0:
+            return DataFrame()
+        return pd.concat(frames, ignore_index = True)
+
+    def increment(self, context, since = None):
+        '''
+        Creates the records for the tracking log events after since, which 
+        are added to the collection. Events logged late with a time before
+        since aren't processed.
+
+        Parameters
+        ----------
+        context : XData
+            Provides methods for getting any data needed to create the 
+            collection defined by this strategy as well as any additional 
+            constraints
+        since : str
+            Time of the latest event processed by the last refresh. If None,
+            the whole collection is created.
+
+        Returns
+        -------
+        data : DataFrame
+            New records, see create
+        conditions : dict
+            Records after since, which are replaced by data
+        watermark : str
+            Time of the latest event in data
+        '''
+        if since is None:
+            data = self.create(context)
+            conditions = {}
+        else:
+            conditions = {'time': {'$gt': since}}
+            data = context.fetch('tracking_log',
+                conditions = conditions,
+                parser = POTLogParser())
+            if not data.empty:
+                data['course_id'] = context.course_id
+        watermark = data['time'].max() if not data.empty else since
+        return data, conditions, watermark
+
+def id_ranges(first, last, n):
+    '''
+    Splits the ObjectIds from first to last into n ranges by their 
+    generation time. ObjectIds only have a resolution of a second, so there
+    can be fewer ranges.
+
+    Parameters
+    ----------
+    first : ObjectId
+        Smallest _id
+    last : ObjectId
+        Largest _id
+    n : int
+        Number of ranges
+
+    Returns
+    -------
+    conditions : list of dicts
+        Conditions on _id for each range, which cover every _id from first
+        to last
+    '''
+    start = first.generation_time
+    span = last.generation_time - start
+    boundaries = [first]
+    for i in xrange(1, n):
+        boundary = ObjectId.from_datetime(start + span * i / n)
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    ranges = [{'_id': {'$gte': lower, '$lt': upper}}
+        for lower, upper in zip(boundaries[:-1], boundaries[1:])]
+    ranges.append({'_id': {'$gte': boundaries[-1], '$lte': last}})
+    return ranges
+
+def parse_shard(task):
+    '''
+    Parses a shard of the tracking logs in a pool process. MongoClients 
+    connect again in each process, so every process has its own connection.
+
+    Parameters
+    ----------
+    task : tuple
+        (db, conditions, pull_size) of the shard
+
+    Returns
+    -------
+    data : DataFrame
+        Parsed log items, see POTLogParser
+    '''
+    db, conditions, pull_size = task
+    client = MongoClient(pull_size = pull_size)
+    client.connect(db)
+    return client.read('tracking_log',
+        conditions = conditions,
+        parser = POTLogParser())
@@ -0,0 +1,328 @@
+import itertools
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ....munge import time as t
+from ....munge.sparse import SparseFrame
+from ....munge.vocabulary import pair_codes
+from ....munge.memory import estimate_nbytes
+from ....munge.external_sort import ExternalSorter
+
+class TimeAttribution(object):
+    '''
+    Time spent by the users of a course on each module and each day, which
+    derived_time_matrix, derived_person_module and derived_person_day_time
+    are aggregated from. The browser events are converted, sorted by user
+    and time and sessionized once for all three collections. Presorted 
+    events are attributed a chunk of users at a time as they are read, and
+    other events that exceed max_bytes are sorted on disk with an 
+    ExternalSorter first, so they never need to fit in memory.
+
+    Parameters
+    ----------
+    data : DataFrame or iterator of DataFrames
+        time, username and optionally module_id fields from
+        derived_person_object_time
+    max_time : int
+        Max number of seconds for any duration
+    min_time : int
+        Min number of seconds for any duration
+    presorted : boolean
+        Whether data is already sorted by username and time, e.g. by mongo.
+        The order is verified and data is only sorted if it isn't, except
+        that chunks of events that aren't sorted by username raise a 
+        ValueError.
+    max_bytes : int
+        Memory budget for the events
+
+    Attributes
+    ----------
+    malformed : int
+        Number of events skipped because their timestamps couldn't be parsed
+    examples : list of str
+        Some of the malformed timestamps
+    '''
+    # Collections aggregated from the events
+    collections = ['derived_time_matrix',
+        'derived_person_module',
+        'derived_person_day_time']
+
+    def __init__(self, data, max_time = 30*60, min_time = 0,
+            presorted = False, max_bytes = 2**30):
+        self.max_time = max_time
+        self.min_time = min_time
+        self.malformed = 0
+        self.examples = []
+
+        modules = []
+        days = []
+        for chunk, ordered in self._chunks(data, presorted, max_bytes):
+            module_times, day_times = self._attribute(chunk, ordered)
+            if module_times is not None:
+                modules.append(module_times)
+            days.append(day_times)
+
+        # The chunks have different users, so their aggregations are only
+        #   concatenated
+        self.modules = pd.concat(modules, ignore_index = True) if modules \
+            else DataFrame(columns = ['username', 'module_id', 'time_spent',
+                'freq'])
+        self.days = pd.concat(days, ignore_index = True) if days \
+            else DataFrame(columns = ['username', 'date', 'time_spent'])
+
+    def time_matrix(self, sparse = False):
+        '''
+        Seconds every user spent on every module_id, see TimeMatrixStrategy
+
+        Parameters
+        ----------
+        sparse : boolean
+            Whether to return a SparseFrame, which only keeps the module_ids
+            each user spent time on
+
+        Returns
+        -------
+        data : DataFrame or SparseFrame
+            Indexed by username with a column per module_id
+        '''
+        modules = self.modules
+        if sparse:
+            return SparseFrame.from_records(modules['username'],
+                modules['module_id'],
+                modules['time_spent'].values)
+        if modules.empty:
+            return DataFrame()
+
+        # Every (username, module_id) pair is in modules once
+        codes, usernames, module_ids = pair_codes(modules['username'],
+            modules['module_id'])
+        totals = np.zeros(len(usernames) * len(module_ids))
+        totals[codes] = modules['time_spent'].values
+        return DataFrame(totals.reshape((len(usernames), len(module_ids))),
+            index = pd.Index(usernames, name = 'username'),
+            columns = pd.Index(module_ids, name = 'module_id'))
+
+    def person_module(self):
+        '''
+        Time spent and number of interactions of every user on each module,
+        see PersonModuleStrategy
+
+        Returns
+        -------
+        person_module : DataFrame
+            username, module_id, time_spent and freq columns
+        '''
+        return self.modules.copy()
+
+    def person_day_time(self):
+        '''
+        Seconds every user spent on the course each day, see
+        PersonDayTimeStrategy
+
+        Returns
+        -------
+        person_day_time : DataFrame
+            username, date and time_spent columns
+        '''
+        return self.days.copy()
+
+    def _chunks(self, data, presorted, max_bytes):
+        '''
+        Generator of (events, presorted) tuples, where each user's events are
+        in a single DataFrame. Presorted chunks of events are cut into whole
+        users as they are read, see _grouped. Other events are only sorted 
+        externally if they don't fit in max_bytes.
+        '''
+        if isinstance(data, DataFrame):
+            yield data, presorted
+            return
+
+        chunks = iter(data)
+        if presorted:
+            for chunk in self._grouped(chunks):
+                yield chunk, True
+            return
+
+        held = []
+        nbytes = 0
+        for chunk in chunks:
+            held.append(chunk)
+            nbytes += estimate_nbytes(chunk)
+            if nbytes > max_bytes:
+                break
+        else:
+            if held:
+                yield pd.concat(held, ignore_index = True), presorted
+            return
+
+        sorter = ExternalSorter(['username', 'time'], max_bytes = max_bytes)
+        try:
+            for chunk in itertools.chain(held, chunks):
+                sorter.add(chunk)
+            held = None
+            for chunk in sorter.chunks():
+                yield chunk, True
+        finally:
+            sorter.close()
+
+    def _grouped(self, chunks):
+        '''
+        Generator of DataFrames with the events of whole users from chunks of
+        events sorted by username, e.g. read from mongo. The events of the 
+        last user of a chunk are carried into the next one, so only about a
+        chunk is in memory at a time. Events without a username are dropped
+        like ExternalSorter does.
+
+        Raises
+        ------
+        ValueError
+            If the events aren't sorted by username
+        '''
+        carried = None
+        for chunk in chunks:
+            chunk = chunk[chunk['username'].notnull()]
+            if chunk.empty:
+                continue
+            if carried is not None:
+                chunk = pd.concat([carried, chunk], ignore_index = True)
+            usernames = chunk['username'].values
+            if (usernames[1:] < usernames[:-1]).any():
+                raise ValueError('Presorted events aren\'t sorted by username')
+            cut = np.searchsorted(usernames, usernames[-1], side = 'left')
+            if cut > 0:
+                yield chunk.iloc[:cut]
+            carried = chunk.iloc[cut:]
+        if carried is not None:
+            yield carried
+
+    def _attribute(self, data, presorted):
+        '''
+        Aggregates the time spent in events with all of their users' events
+
+        Returns
+        -------
+        modules : DataFrame
+            Time spent on every (username, module_id) pair with time spent or
+            None if there are no module_ids
+        days : DataFrame
+            Time spent on every (username, date) pair with events
+        '''
+        if data.empty:
+            data = DataFrame(columns = ['username', 'module_id', 'time'])
+        columns = [column for column in ['username', 'module_id', 'time']
+            if column in data]
+        data = data.loc[:, columns]
+
+        # (username, module_id) pairs are encoded as integers and the number
+        #   of times that users interacted with the course modules is counted
+        #   for every pair, including events with malformed timestamps
+        if 'module_id' in data:
+            codes, usernames, module_ids = pair_codes(data['username'],
+                data['module_id'])
+            frequencies = np.bincount(codes[codes >= 0],
+                minlength = len(usernames) * len(module_ids))
+            data['pair'] = codes
+
+        # The time field in person_object_time is a str, so we can quickly
+        #   slice off the date
+        data['date'] = data['time'].str[:10]
+        data['time'], malformed = t.to_datetimes(data['time'], malformed = True)
+        self.malformed += len(malformed)
+        self.examples.extend(malformed[:5 - len(self.examples)].tolist())
+        data = data[data['time'].notnull()]
+
+        # Seconds until each user's next event, without the last events and
+        #   gaps outside of [min_time, max_time)
+        events = t.sessionize(data,
+            max_time = self.max_time,
+            min_time = self.min_time,
+            presorted = presorted)
+
+        # Daily time spent only counts durations until an event on the same
+        #   date, like sessionizing by username and date
+        dates = events['date'].values
+        same_day = np.zeros(len(events), dtype = bool)
+        same_day[:-1] = dates[1:] == dates[:-1]
+        day_durations = events['duration'].where(same_day)
+
+        day_codes, day_usernames, day_dates = pair_codes(events['username'],
+            dates)
+        valid = day_codes >= 0
+        day_times = np.bincount(day_codes[valid],
+            weights = day_durations.fillna(0).values[valid],
+            minlength = len(day_usernames) * len(day_dates))
+        # Every (username, date) pair with events is kept, in order
+        pairs = np.unique(day_codes[valid])
+        days = DataFrame({\
+            'username': day_usernames[pairs // len(day_dates)],
+            'date': day_dates[pairs % len(day_dates)],
+            'time_spent': day_times[pairs]},
+            columns = ['username', 'date', 'time_spent'])
+
+        if 'module_id' not in data:
+            return None, days
+
+        limited = events[events['duration'].notnull() & (events['pair'] >= 0)]
+        pairs = limited['pair'].values
+        module_times = np.bincount(pairs,
+            weights = limited['duration'].values,
+            minlength = len(frequencies))
+        # Only pairs with time spent are kept, in order of username and
+        #   module_id
+        pairs = np.unique(pairs)
+        modules = DataFrame({\
+            'username': usernames[pairs // len(module_ids)],
+            'module_id': module_ids[pairs % len(module_ids)],
+            'time_spent': module_times[pairs],
+            'freq': frequencies[pairs]},
+            columns = ['username', 'module_id', 'time_spent', 'freq'])
+        return modules, days
+
+def time_attribution(context, max_time = 30*60, min_time = 0,
+        max_bytes = 2**30, chunksize = 100000):
+    '''
+    Gets the course's TimeAttribution for computing a collection. It is
+    kept on the context, so the browser events are only read and sorted
+    once for all of TimeAttribution.collections computed together, e.g. by
+    compute_all, see XData.intermediate.
+
+    Parameters
+    ----------
+    context : XData
+    max_time : int
+        Max number of seconds for any duration
+    min_time : int
+        Min number of seconds for any duration
+    max_bytes : int
+        Memory budget for the events, above which they are sorted on disk
+    chunksize : int
+        Number of events read at a time
+
+    Returns
+    -------
+    attribution : TimeAttribution
+    '''
+    def build():
+        # Only want browser events, i.e. source = 1, since server events
+        #   don't indicate user time spent
+        data = context.get('derived_person_object_time',
+            conditions = {'source': 1},
+            fields = ['time', 'username', 'module_id'],
+            sort = ['username', 'time'],
+            chunksize = chunksize)
+        attribution = TimeAttribution(data,
+            max_time = max_time,
+            min_time = min_time,
+            presorted = True,
+            max_bytes = max_bytes)
+        if attribution.malformed:
+            message = 'Skipped {0} browser events with malformed timestamps '\
+                'in derived_person_object_time, e.g. {1}'
+            context.logger.log(message.format(attribution.malformed,
+                attribution.examples))
+        return attribution
+
+    key = ('time_attribution', max_time, min_time)
+    return context.intermediate(key, build,
+        inputs = ['derived_person_object_time'])
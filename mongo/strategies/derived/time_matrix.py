@@ -8,14 +8,36 @@ from pandas import Series, DataFrame
 
 
 from ..collection import CollectionStrategy
-from ....munge import time as t
+from .time_attribution import TimeAttribution, time_attribution
 
 class TimeMatrixStrategy(CollectionStrategy):
 
+    def __init__(self, sparse = False):
+        '''
+        Parameters
+        ----------
+        sparse : boolean
+            If True, create returns a SparseFrame of usernames by module_ids 
+            instead of a dense DataFrame
+        '''
+        self.sparse = sparse
+
     @property
     def name(self):
         return 'derived_time_matrix'
 
+    @property
+    def indexes(self):
+        return [[('course_id', 1), ('username', 1)]]
+
+    @property
+    def inputs(self):
+        return ['derived_person_object_time']
+
+    @property
+    def matrix(self):
+        return True
+
     def create(self, context, max_time = 30*60, min_time = 0):
         '''
         Create a matrix of time for every module_id in a course
@@ -36,7 +58,7 @@ class TimeMatrixStrategy(CollectionStrategy):
 
         Returns
         -------
-        data : DataFrame
+        data : DataFrame or SparseFrame
 
             Columns
             -------
@@ -45,20 +67,22 @@ class TimeMatrixStrategy(CollectionStrategy):
             module_id* : float
                 seconds of time spent on the module_id
         '''
-        data = context.get('derived_person_object_time',
-            conditions = {'source': 1},
-            fields = ['time', 'username','module_id'])
-
-        time_matrix = self.from_data(\
-            data,
+        # The browser events are shared with derived_person_module and 
+        #   derived_person_day_time, so they are only read and sorted once
+        attribution = time_attribution(context,
             max_time = max_time,
-            min_time = min_time).reset_index()
+            min_time = min_time)
+        time_matrix = attribution.time_matrix(sparse = self.sparse)
+        if self.sparse:
+            return time_matrix
 
+        time_matrix = time_matrix.reset_index()
         time_matrix['course_id'] = context.course_id
 
         return time_matrix
 
-    def from_data(self, data, max_time = 30*60, min_time = 0):
+    def from_data(self, data, max_time = 30*60, min_time = 0,
+            presorted = False, sparse = False):
         '''
         Create a matrix of time for every module_id in a course
         and every user
@@ -74,9 +98,17 @@ class TimeMatrixStrategy(CollectionStrategy):
         min_time : int
             Min number of seconds for any duration
 
+        presorted : boolean
+            Whether data is already sorted by username and time, e.g. by mongo.
+            The order is verified and data is only sorted if it isn't.
+
+        sparse : boolean
+            Whether to return a SparseFrame, which only keeps the module_ids
+            each user spent time on
+
         Returns
         -------
-        data : DataFrame
+        data : DataFrame or SparseFrame
 
             Columns
             -------
@@ -86,33 +118,8 @@ class TimeMatrixStrategy(CollectionStrategy):
                 seconds of time spent on the module_id
         '''
 
-        # Convert to Datetime
-        data['time'] = data['time'].apply(t.to_time)
-
-        # Sort & Diff
-        data = data.sort(['username','time']).reset_index()
-        data['duration'] = data.time.diff(-1)*-1
-
-        # Remove Last Events
-        last_events = data.groupby('username').last()
-        data = data[False == data['index'].isin(last_events['index'])]
-
-        max_time = np.timedelta64(max_time, 's')
-        min_time = np.timedelta64(min_time, 's')
-        limited = data[data['duration'] < max_time].loc[:,
-            ['username','module_id', 'duration']]
-        # limited = data.loc[:,['username','module_id', 'duration']]
-        # limited.ix[limited.duration > max_time, 'duration'] = max_time
-        # limited.ix[limited.duration < min_time, 'duration'] = min_time
-
-        if not limited.empty:
-            time_matrix = limited.pivot_table(rows = 'username',
-                cols = 'module_id',
-                values = 'duration',
-                aggfunc = sum).fillna(0)
-
-            # Turn nanoseconds to seconds
-            time_matrix = time_matrix / 10.**9
-            return time_matrix
-        else:
-            return DataFrame()
\ No newline at end of file
+        attribution = TimeAttribution(data,
+            max_time = max_time,
+            min_time = min_time,
+            presorted = presorted)
+        return attribution.time_matrix(sparse = sparse)
@@ -0,0 +1,172 @@
+import sys
+import atexit
+import weakref
+import threading
+import Queue
+from collections import deque
+
+from .exceptions import WriteBehindError
+
+class WriteBehindQueue(object):
+    '''
+    Runs writes in background worker threads, so callers can continue while
+    data is written. Writes are queued under keys, e.g.
+    (course_id, collection_name, db). Writes with different keys run
+    concurrently and writes with the same key run one after another in the
+    order they were queued.
+
+    Errors don't stop the workers. They are kept until flush, which waits for
+    the writes and raises a WriteBehindError with the errors. Queued writes
+    are finished before the interpreter exits.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker threads
+    logger : Logger
+        Records failed writes. The default is no logging.
+
+    Examples
+    --------
+    >>> writer = WriteBehindQueue(workers = 2)
+    >>> writer.put(('course', 'collection', 'db'), client_write, data)
+    >>> writer.flush()
+    '''
+    def __init__(self, workers = 4, logger = None):
+        self.workers = workers
+        self.logger = logger
+        self.errors = [] # [(key, exc_info)]
+        self._threads = []
+        self._ready = Queue.Queue() # Keys with writes and no running write
+        self._waiting = {} # {key -> deque of (function, args, kwargs)}
+        self._condition = threading.Condition()
+
+        # Only a weak reference is kept, so the queue can still be collected
+        reference = weakref.ref(self)
+        atexit.register(lambda: reference() and reference().close())
+
+    def __len__(self):
+        '''
+        Number of queued and running writes
+        '''
+        with self._condition:
+            return sum(len(writes) for writes in self._waiting.values())
+
+    def put(self, key, function, *args, **kwargs):
+        '''
+        Queues a write
+
+        Parameters
+        ----------
+        key : hashable
+            Writes with the same key run in order
+        function : callable
+            Does the write with args and kwargs
+        '''
+        with self._condition:
+            self._start()
+            writes = self._waiting.get(key)
+            if writes is None:
+                writes = self._waiting[key] = deque()
+                self._ready.put(key)
+            writes.append((function, args, kwargs))
+
+    def pending(self, keys = None):
+        '''
+        Checks whether there are queued or running writes
+
+        Parameters
+        ----------
+        keys : list
+            Keys of the writes to check. The default is every write.
+
+        Returns
+        -------
+        pending : boolean
+        '''
+        with self._condition:
+            return self._pending(keys)
+
+    def flush(self, keys = None):
+        '''
+        Waits for writes to finish and raises their errors
+
+        Parameters
+        ----------
+        keys : list
+            Keys of the writes to wait for. The default is every write.
+
+        Raises
+        ------
+        WriteBehindError
+            If any of the writes failed. The errors are only raised once.
+        '''
+        with self._condition:
+            while self._pending(keys):
+                self._condition.wait()
+            errors = [error for error in self.errors
+                if (keys is None) or (error[0] in keys)]
+            self.errors = [error for error in self.errors
+                if error not in errors]
+        if errors:
+            raise WriteBehindError(errors)
+
+    def close(self):
+        '''
+        Waits for the queued writes and stops the worker threads. Errors are
+        logged but not raised. Writes queued later start new workers.
+        '''
+        with self._condition:
+            while self._pending(None):
+                self._condition.wait()
+            threads, self._threads = self._threads, []
+            for thread in threads:
+                self._ready.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _pending(self, keys):
+        if keys is None:
+            return len(self._waiting) > 0
+        return any(key in self._waiting for key in keys)
+
+    def _start(self):
+        '''
+        Starts the worker threads the first time writes are queued
+        '''
+        if self._threads:
+            return
+        for i in xrange(self.workers):
+            thread = threading.Thread(target = self._work,
+                name = 'WriteBehindQueue-{0}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                return
+            with self._condition:
+                function, args, kwargs = self._waiting[key][0]
+            try:
+                function(*args, **kwargs)
+            except Exception:
+                error = sys.exc_info()
+                if self.logger is not None:
+                    self.logger.log('Write to {0} failed: {1}'.format(key,
+                        error[1]))
+                with self._condition:
+                    self.errors.append((key, error))
+
+            # The write is only removed once it is done, so the key stays
+            #   pending until then
+            with self._condition:
+                writes = self._waiting[key]
+                writes.popleft()
+                if writes:
+                    self._ready.put(key)
+                else:
+                    del self._waiting[key]
+                self._condition.notify_all()
@@ -0,0 +1,188 @@
+import os
+import shutil
+import tempfile
+import cPickle as pickle
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from .memory import estimate_nbytes
+
+class ExternalSorter(object):
+    '''
+    Sorts records that don't fit in memory, e.g. a course's events by
+    ['username', 'time']. Records are added in chunks and kept in memory
+    until they exceed max_bytes. Then they are sorted and spilled to disk
+    as a run. The runs are merged while the sorted records are read, so
+    only a block of each run is in memory at a time. Records are read in
+    chunks that never split a group, i.e. the records with the same value
+    of the first by column, so each chunk can be processed on its own.
+
+    Parameters
+    ----------
+    by : str or list of str
+        Columns to sort by. The first one identifies groups.
+    max_bytes : int
+        Memory budget for the records that haven't been spilled
+    directory : str
+        Directory for the runs. The default is the system's temporary
+        directory.
+    block_size : int
+        Approximate number of records per block of a run and per chunk read
+
+    Examples
+    --------
+    >>> sorter = ExternalSorter(['username', 'time'], max_bytes = 2**28)
+    >>> for chunk in xdata.get('derived_person_object_time', chunksize = 10000):
+    ...     sorter.add(chunk)
+    >>> for chunk in sorter.chunks():
+    ...     process(chunk)
+    >>> sorter.close()
+    '''
+    def __init__(self, by, max_bytes = 2**30, directory = None,
+            block_size = 100000):
+        self.by = [by] if isinstance(by, basestring) else list(by)
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.runs = [] # Paths of the spilled runs
+        self.nbytes = 0
+        self._directory = directory
+        self._tmp = None
+        self._buffer = []
+
+    def __len__(self):
+        '''
+        Number of records held in memory
+        '''
+        return sum(len(data) for data in self._buffer)
+
+    @property
+    def spilled(self):
+        '''
+        Whether any records have been spilled to disk
+        '''
+        return len(self.runs) > 0
+
+    def add(self, data):
+        '''
+        Adds records, spilling the records in memory if they exceed max_bytes.
+        Records with a missing group are dropped.
+
+        Parameters
+        ----------
+        data : DataFrame
+            Records with the by columns
+        '''
+        data = data[data[self.by[0]].notnull()]
+        if data.empty:
+            return
+        self._buffer.append(data)
+        self.nbytes += estimate_nbytes(data)
+        if self.nbytes > self.max_bytes:
+            self._spill()
+
+    def chunks(self):
+        '''
+        Generator of the sorted records in DataFrames of whole groups
+
+        Returns
+        -------
+        chunks : iterator of DataFrames
+        '''
+        if not self.spilled:
+            for block in self._blocks(self._sorted()):
+                yield block
+            return
+
+        self._spill()
+        readers = [self._read(path) for path in self.runs]
+        blocks = [next(reader, None) for reader in readers]
+        group = self.by[0]
+        while any(block is not None for block in blocks):
+            # Groups up to the smallest last group of the current blocks are
+            #   complete, since the runs' blocks don't split groups
+            bound = min(block[group].values[-1] for block in blocks
+                if block is not None)
+            parts = []
+            for i, block in enumerate(blocks):
+                if block is None:
+                    continue
+                cut = np.searchsorted(block[group].values, bound,
+                    side = 'right')
+                if cut > 0:
+                    parts.append(block.iloc[:cut])
+                if cut < len(block):
+                    blocks[i] = block.iloc[cut:]
+                else:
+                    blocks[i] = next(readers[i], None)
+            yield pd.concat(parts).sort(self.by)
+
+    def groups(self):
+        '''
+        Generator of the sorted records of each group
+
+        Returns
+        -------
+        groups : iterator of (key, DataFrame) tuples
+        '''
+        for chunk in self.chunks():
+            for key, data in chunk.groupby(self.by[0], sort = False):
+                yield key, data
+
+    def close(self):
+        '''
+        Removes the spilled runs and the records held in memory
+        '''
+        if self._tmp is not None:
+            shutil.rmtree(self._tmp, ignore_errors = True)
+            self._tmp = None
+        self.runs = []
+        self._buffer = []
+        self.nbytes = 0
+
+    def _sorted(self):
+        if len(self._buffer) == 0:
+            return DataFrame()
+        data = pd.concat(self._buffer, ignore_index = True)
+        self._buffer = []
+        self.nbytes = 0
+        return data.sort(self.by)
+
+    def _spill(self):
+        '''
+        Writes the records in memory to disk as a sorted run
+        '''
+        data = self._sorted()
+        if data.empty:
+            return
+        if self._tmp is None:
+            self._tmp = tempfile.mkdtemp(prefix = 'xtools-sort-',
+                dir = self._directory)
+        path = os.path.join(self._tmp, 'run-{0}.pkl'.format(len(self.runs)))
+        with open(path, 'wb') as f:
+            for block in self._blocks(data):
+                pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+
+    def _blocks(self, data):
+        '''
+        Splits sorted records into blocks of about block_size records that
+        end at the end of a group
+        '''
+        keys = data[self.by[0]].values if not data.empty else []
+        start = 0
+        while start < len(keys):
+            end = min(start + self.block_size, len(keys))
+            # The block is extended to the end of its last group
+            end = np.searchsorted(keys, keys[end - 1], side = 'right')
+            yield data.iloc[start:end]
+            start = end
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
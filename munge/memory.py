@@ -0,0 +1,28 @@
+import sys
+
+import numpy as np
+
+def estimate_nbytes(data, sample_size = 100):
+    '''
+    Estimates the memory used by a DataFrame. The size of python objects in
+    object columns is estimated from a sample of the column.
+
+    Parameters
+    ----------
+    data : DataFrame
+    sample_size : int
+        Number of values sampled from each object column
+
+    Returns
+    -------
+    nbytes : int
+    '''
+    nbytes = data.index.values.nbytes
+    for i in xrange(data.shape[1]):
+        values = data.iloc[:, i].values
+        nbytes += values.nbytes
+        if values.dtype == object and len(values) > 0:
+            sample = values[:sample_size]
+            average = np.mean([sys.getsizeof(value) for value in sample])
+            nbytes += int(average * len(values))
+    return nbytes
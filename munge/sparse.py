@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from pandas import DataFrame
+
+class SparseFrame(object):
+    '''
+    Sparse matrix with labeled rows and columns, e.g. usernames by
+    module_ids. Only the non zero cells are kept in a scipy.sparse CSR matrix,
+    so memory scales with the number of interactions instead of rows times
+    columns.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        Values of the matrix. It is converted to CSR.
+    rows : array-like
+        Labels of the rows
+    columns : array-like
+        Labels of the columns
+    index : str
+        Name of the row labels, which is the column they are put in by
+        to_frame
+
+    Examples
+    --------
+    >>> events = DataFrame({'username': ['a', 'a', 'b'],
+    ...     'module_id': ['x', 'y', 'x']})
+    >>> counts = SparseFrame.from_records(events.username, events.module_id)
+    >>> counts.to_frame()
+      username  x  y
+    0        a  1  1
+    1        b  1  0
+    '''
+    def __init__(self, matrix, rows, columns, index = 'username'):
+        self.matrix = sparse.csr_matrix(matrix)
+        self.rows = pd.Index(rows)
+        self.columns = pd.Index(columns)
+        self.index = index
+        assert self.matrix.shape == (len(self.rows), len(self.columns)), \
+            'matrix shape must match the number of rows and columns'
+
+    @classmethod
+    def from_records(cls, rows, columns, values = None, index = 'username'):
+        '''
+        Builds a matrix from one record per interaction. Values for the same
+        row and column are summed.
+
+        Parameters
+        ----------
+        rows : array-like
+            Row label of each record, e.g. the username
+        columns : array-like
+            Column label of each record, e.g. the module_id
+        values : array-like
+            Value of each record. The default is 1 for every record, which
+            counts the records.
+        index : str
+            Name of the row labels
+
+        Returns
+        -------
+        matrix : SparseFrame
+        '''
+        row_codes, row_labels = pd.factorize(np.asarray(rows), sort = True)
+        column_codes, column_labels = pd.factorize(np.asarray(columns),
+            sort = True)
+        if values is None:
+            values = np.ones(len(row_codes), dtype = int)
+        values = np.asarray(values)
+
+        # Records with missing labels have a code of -1
+        valid = (row_codes >= 0) & (column_codes >= 0)
+        matrix = sparse.coo_matrix(
+            (values[valid], (row_codes[valid], column_codes[valid])),
+            shape = (len(row_labels), len(column_labels))).tocsr()
+        matrix.sum_duplicates()
+        return cls(matrix, row_labels, column_labels, index = index)
+
+    @classmethod
+    def from_frame(cls, data, index = 'username'):
+        '''
+        Builds a sparse matrix from a dense DataFrame with the row labels in
+        the index column. Columns other than index and course_id are values.
+
+        Parameters
+        ----------
+        data : DataFrame
+        index : str
+            Column with the row labels
+
+        Returns
+        -------
+        matrix : SparseFrame
+        '''
+        columns = [column for column in data.columns
+            if column not in (index, 'course_id')]
+        rows = data[index] if index in data else data.index
+        return cls(sparse.csr_matrix(data[columns].values.astype(float)),
+            rows,
+            columns,
+            index = index)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nnz(self):
+        '''
+        Number of stored (non zero) values
+        '''
+        return self.matrix.nnz
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __repr__(self):
+        return '<SparseFrame {0}x{1} with {2} stored values>'.format(\
+            self.shape[0],
+            self.shape[1],
+            self.nnz)
+
+    def to_frame(self):
+        '''
+        Converts the matrix to a dense DataFrame with the row labels in the
+        index column
+
+        Returns
+        -------
+        data : DataFrame
+        '''
+        data = DataFrame(self.matrix.toarray(), columns = self.columns)
+        data.insert(0, self.index, self.rows)
+        return data
@@ -35,6 +35,62 @@ def to_time(time):
         time = time[:-1]
     return np.datetime64(time)
 
+def to_datetimes(times, malformed = False):
+    '''
+    Turns a column of timestamp strings from the tracking logs into
+    datetime64[ns] values at once. Like to_time, the trailing 'd' of some
+    MITx/8.02x/Spring_2013 timestamps is removed. Timestamps that can't be
+    parsed become NaT instead of raising an error.
+
+    Parameters
+    ----------
+    times : Series or array-like
+        Timestamps of log events
+    malformed : boolean
+        Whether to also return the timestamps that couldn't be parsed
+
+    Returns
+    -------
+    times : Series
+        datetime64[ns] Series with the index of times. Missing and malformed
+        timestamps are NaT.
+    malformed : Series
+        Only if malformed is True. The timestamps that couldn't be parsed,
+        indexed by their rows.
+    '''
+    times = times if isinstance(times, Series) else Series(times)
+    if times.dtype.kind == 'M':
+        converted = times
+    else:
+        # Only strings have the trailing 'd' removed, so datetimes pass through
+        cleaned = times.copy()
+        try:
+            trailing = times.str.endswith('d').fillna(False).astype(bool)
+        except AttributeError:
+            # There are no strings, e.g. for datetimes read from mongo
+            trailing = None
+        if (trailing is not None) and trailing.any():
+            cleaned[trailing] = times[trailing].str[:-1]
+
+        # Timestamps with UTC offsets are converted to UTC like np.datetime64
+        #   does, so they can be mixed with timestamps without offsets
+        converted = pd.to_datetime(cleaned, coerce = True, utc = True)
+
+        # pandas applies the last offset it parsed to the following 
+        #   timestamps without one, so those are parsed again on their own
+        if trailing is not None:
+            offsets = cleaned.str.contains(r'(?:Z|[+-]\d\d:?\d\d)$',
+                na = False)
+            naive = ~offsets & cleaned.notnull()
+            if offsets.any() and naive.any():
+                converted[naive] = pd.to_datetime(cleaned[naive],
+                    coerce = True, utc = True)
+
+    if not malformed:
+        return converted
+    bad = converted.isnull() & times.notnull()
+    return converted, times[bad]
+
 def total_time_spent(group):
     '''
     Calculates the total time spent from a group of person_object_time
@@ -54,4 +110,129 @@ def total_time_spent(group):
     durations = data.diff(-1)*-1
     max_time = np.timedelta64(30*60, 's')
     total_time = durations[durations < max_time].sum()
-    return float(total_time) / 10.**9
\ No newline at end of file
+    return float(total_time) / 10.**9
+
+def is_sorted(data, by = 'username', time = 'time'):
+    '''
+    Checks that records are grouped by one or more columns and in 
+    chronological order within each group, e.g. after sorting by 
+    ['username', 'time'] in mongo. Since timestamp strings are sorted 
+    lexicographically by mongo, the order needs to be verified after 
+    converting them to datetimes.
+
+    Parameters
+    ----------
+    data : DataFrame
+        Records with by and time columns
+    by : str or list of str
+        Name of the column or columns the records are grouped by
+    time : str
+        Name of the datetime column
+
+    Returns
+    -------
+    ordered : boolean
+    '''
+    by = [by] if isinstance(by, basestring) else list(by)
+    if len(data) < 2:
+        return True
+    # The groups have to be in ascending order of the first column that
+    #   differs between consecutive records
+    same = np.ones(len(data) - 1, dtype = bool)
+    ascending = np.zeros(len(data) - 1, dtype = bool)
+    for column in by:
+        keys = data[column].values
+        ascending |= same & (keys[1:] > keys[:-1])
+        same &= keys[1:] == keys[:-1]
+    ascending |= same
+    times = data[time].values
+    chronological = (times[1:] >= times[:-1]) | ~same
+    return bool(ascending.all() and chronological.all())
+
+def sessionize(data, by = 'username', time = 'time', max_time = 30*60,
+        min_time = 0, session_ids = False, presorted = False):
+    '''
+    Finds the time spent on each event as the time until the group's next
+    event, e.g. until the user's next click, for all groups at once. The 
+    records are sorted by group and time, and group boundaries are found
+    by comparing consecutive records, so no function is called per group.
+    The last event of each group has no duration, and gaps of max_time or 
+    more, e.g. when a user walks away from the keyboard, end a session 
+    and don't count as time spent.
+
+    Parameters
+    ----------
+    data : DataFrame
+        Records with by and datetime64 time columns
+    by : str or list of str
+        Column or columns identifying groups, e.g. ['username', 'date']
+    time : str
+        Name of the datetime column
+    max_time : int
+        Seconds at which a gap between events ends a session. Durations are
+        less than max_time.
+    min_time : int
+        Minimum number of seconds for a duration. Shorter gaps don't end a
+        session but have no duration.
+    session_ids : boolean
+        Whether to number the sessions of all groups in a session column
+    presorted : boolean
+        Whether data is already sorted by by and time, e.g. by mongo. The 
+        order is verified and data is only sorted if it isn't.
+
+    Returns
+    -------
+    data : DataFrame
+        The records sorted by by and time with a new index and a duration
+        column of seconds, which is NaN for events without a duration, and
+        optionally an integer session column
+
+    Examples
+    --------
+    >>> events = DataFrame({'username': ['a', 'a', 'a', 'b'],
+    ...     'time': to_datetimes(['2013-02-11T10:00:00', '2013-02-11T10:00:30',
+    ...         '2013-02-11T12:00:00', '2013-02-11T10:00:00'])})
+    >>> sessionize(events, session_ids = True)
+                     time username  duration  session
+    0 2013-02-11 10:00:00        a      30.0        0
+    1 2013-02-11 10:00:30        a       NaN        0
+    2 2013-02-11 12:00:00        a       NaN        1
+    3 2013-02-11 10:00:00        b       NaN        2
+    '''
+    by = [by] if isinstance(by, basestring) else list(by)
+    if not (presorted and is_sorted(data, by, time)):
+        data = data.sort(by + [time])
+    data = data.reset_index(drop = True)
+
+    n = len(data)
+    if n == 0:
+        data['duration'] = Series(dtype = float)
+        if session_ids:
+            data['session'] = Series(dtype = int)
+        return data
+
+    # Consecutive records of the same group, e.g. the same user
+    same = np.ones(n - 1, dtype = bool)
+    for column in by:
+        keys = data[column].values
+        same &= keys[1:] == keys[:-1]
+
+    times = data[time].values.astype('datetime64[ns]')
+    gaps = times[1:] - times[:-1]
+    known = pd.notnull(gaps)
+    seconds = np.where(known, gaps.astype('timedelta64[ns]').view('i8'), 0)\
+        / 10.**9
+
+    # Gaps within a session
+    continued = same & known & (seconds < max_time)
+    durations = np.empty(n)
+    durations.fill(np.NaN)
+    durations[:-1] = np.where(continued & (seconds >= min_time), seconds,
+        np.NaN)
+    data['duration'] = durations
+
+    if session_ids:
+        starts = np.ones(n, dtype = bool)
+        starts[1:] = ~continued
+        data['session'] = np.cumsum(starts) - 1
+    return data
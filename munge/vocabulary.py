@@ -0,0 +1,148 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+class Vocabulary(object):
+    '''
+    Shared dictionary of the distinct values of a low cardinality column,
+    e.g. usernames or module_ids. Each value gets an integer code the first
+    time it is seen, which it keeps. Columns can be encoded to codes for
+    grouping and decoded back, and interning a column replaces its strings
+    with the vocabulary's instances, so every distinct value is only stored
+    once no matter how many rows repeat it.
+
+    Parameters
+    ----------
+    values : array-like
+        Initial values
+
+    Examples
+    --------
+    >>> vocabulary = Vocabulary()
+    >>> vocabulary.encode(['b', 'a', 'b', None])
+    array([ 0,  1,  0, -1])
+    >>> vocabulary.decode([1, 0, -1])
+    array(['a', 'b', nan], dtype=object)
+    '''
+    def __init__(self, values = None):
+        self.values = []
+        self._codes = {} # {value -> code}
+        self._lock = threading.Lock()
+        if values is not None:
+            self.encode(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, value):
+        return value in self._codes
+
+    def encode(self, values):
+        '''
+        Finds the codes of values, adding the values that are new
+
+        Parameters
+        ----------
+        values : array-like
+
+        Returns
+        -------
+        codes : int array
+            Code of each value. Missing values have a code of -1.
+        '''
+        # Only the distinct values are looked up
+        codes, uniques = pd.factorize(np.asarray(values, dtype = object))
+        with self._lock:
+            lookup = np.array([self._add(value) for value in uniques] + [-1],
+                dtype = int)
+        # Missing values have a factorized code of -1, which picks the final -1
+        return lookup[codes]
+
+    def decode(self, codes):
+        '''
+        Finds the values of codes
+
+        Parameters
+        ----------
+        codes : int array-like
+
+        Returns
+        -------
+        values : object array
+            Value of each code. Codes of -1 are NaN.
+        '''
+        with self._lock:
+            labels = np.empty(len(self.values) + 1, dtype = object)
+            labels[:-1] = self.values
+        labels[-1] = np.NaN
+        return labels[np.asarray(codes, dtype = int)]
+
+    def intern(self, values):
+        '''
+        Replaces values with the vocabulary's instances of them
+
+        Parameters
+        ----------
+        values : Series or array-like
+
+        Returns
+        -------
+        values : Series or object array
+            Equal values, which share their objects. A Series keeps its index.
+        '''
+        interned = self.decode(self.encode(values))
+        if isinstance(values, pd.Series):
+            return pd.Series(interned, index = values.index, name = values.name)
+        return interned
+
+    def _add(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+def pair_codes(rows, columns):
+    '''
+    Encodes pairs of labels, e.g. (username, module_id), as single integers,
+    so groups of pairs can be found with integer operations like
+    np.bincount instead of grouping on strings
+
+    Parameters
+    ----------
+    rows : array-like
+        First label of each pair
+    columns : array-like
+        Second label of each pair
+
+    Returns
+    -------
+    codes : int array
+        row code * number of column labels + column code for each pair, or
+        -1 if either label is missing
+    row_labels : array
+        Sorted distinct first labels of the complete pairs
+    column_labels : array
+        Sorted distinct second labels of the complete pairs
+
+    Examples
+    --------
+    >>> codes, users, modules = pair_codes(['b', 'a', 'b'], ['x', 'y', 'x'])
+    >>> codes
+    array([2, 1, 2])
+    >>> users[codes // len(modules)], modules[codes % len(modules)]
+    (array(['b', 'a', 'b'], dtype=object), array(['x', 'y', 'x'], dtype=object))
+    '''
+    rows = np.asarray(rows, dtype = object)
+    columns = np.asarray(columns, dtype = object)
+
+    # Like groupby, labels are only kept if they are in a complete pair
+    complete = pd.notnull(rows) & pd.notnull(columns)
+    row_codes, row_labels = pd.factorize(rows[complete], sort = True)
+    column_codes, column_labels = pd.factorize(columns[complete], sort = True)
+    codes = np.empty(len(rows), dtype = np.int64)
+    codes.fill(-1)
+    codes[complete] = row_codes.astype(np.int64) * len(column_labels) + \
+        column_codes
+    return codes, row_labels, column_labels
@@ -0,0 +1,76 @@
+import pandas as pd
+from pandas import DataFrame
+
+from ..mongo.clients.client import Client
+from ..mongo.query import Query, matches
+
+class MemoryClient(Client):
+    '''
+    Client keeping every collection as a DataFrame in memory, so XData can be
+    tested without a mongo server. Queries are answered with Query.apply.
+    '''
+    def __init__(self):
+        self.databases = {} # {db -> {collection_name -> DataFrame}}
+        self.db = None
+
+    def connect(self, db):
+        self.db = db
+
+    def collections(self):
+        return [collection_name for collection_name, data
+            in self.databases.get(self.db, {}).items() if not data.empty]
+
+    def drop_collection(self, collection_name):
+        self.databases.get(self.db, {}).pop(collection_name, None)
+
+    def create(self, data, collection_name, batch_size = None,
+            write_concern = None):
+        collections = self.databases.setdefault(self.db, {})
+        existing = collections.get(collection_name, DataFrame())
+        collections[collection_name] = pd.concat([existing, data],
+            ignore_index = True)
+        return {'rows': len(data), 'seconds': 0., 'rows_per_second': 0.}
+
+    def read(self, collection_name, conditions = {}, fields = [], limit = 0,
+            parser = None, mongo_id = False, chunksize = None, sort = None):
+        data = self.databases.get(self.db, {}).get(collection_name,
+            DataFrame())
+        df = Query(collection_name, conditions, fields, limit,
+            sort).apply(data) if not data.empty else None
+        if df is None:
+            df = DataFrame()
+        if chunksize:
+            return iter([df[i:i+chunksize]
+                for i in xrange(0, len(df), chunksize)])
+        return df
+
+    def update(self, data, collection_name, conditions = {}, keys = None):
+        removed = self._remove(collection_name, conditions)
+        self.create(data, collection_name)
+        return {'upserted': len(data), 'removed': removed, 'unchanged': 0}
+
+    def delete(self, collection_name, conditions = {}):
+        self._remove(collection_name, conditions)
+
+    def exists(self, collection_name, conditions = {}):
+        data = self.databases.get(self.db, {}).get(collection_name)
+        if data is None or data.empty:
+            return False
+        mask = matches(data, conditions)
+        return bool(mask is not None and mask.any())
+
+    def fingerprint(self, collection_name, conditions = {}):
+        data = self.databases.get(self.db, {}).get(collection_name,
+            DataFrame())
+        return {'count': len(data)}
+
+    def ensure_indexes(self, collection_name, indexes):
+        pass
+
+    def _remove(self, collection_name, conditions):
+        data = self.databases.get(self.db, {}).get(collection_name)
+        if data is None or data.empty:
+            return 0
+        mask = matches(data, conditions)
+        self.databases[self.db][collection_name] = data[~mask]
+        return int(mask.sum())
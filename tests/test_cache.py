@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ..mongo.cache import ResultCache, DiskCache
+from ..mongo.query import Query
+from ..munge.memory import estimate_nbytes
+
+def frame(n):
+    return DataFrame({'username': ['u{0}'.format(i % 3) for i in range(n)],
+        'value': np.arange(n, dtype = float)})
+
+def test_hits_return_copies():
+    cache = ResultCache()
+    query = Query('derived_person_day_time', {'course_id': 'c'})
+    cache.put('db', query, frame(5))
+    df = cache.get('db', query)
+    df['value'] = 0
+    assert cache.get('db', query)['value'].tolist() == range(5)
+    assert cache.get('other', query) is None
+    assert cache.get('db', query, mongo_id = True) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+def test_least_recently_used_results_are_evicted():
+    nbytes = estimate_nbytes(frame(100))
+    cache = ResultCache(max_bytes = 2 * nbytes)
+    queries = [Query('c', {'course_id': i}) for i in range(3)]
+    cache.put('db', queries[0], frame(100))
+    cache.put('db', queries[1], frame(100))
+    # Using the first result makes the second the least recently used
+    assert cache.get('db', queries[0]) is not None
+    cache.put('db', queries[2], frame(100))
+    assert ('db', queries[0], False) in cache
+    assert ('db', queries[1], False) not in cache
+    assert ('db', queries[2], False) in cache
+    assert cache.nbytes <= cache.max_bytes
+
+def test_results_bigger_than_the_budget_arent_cached():
+    cache = ResultCache(max_bytes = 10)
+    assert not cache.put('db', Query('c'), frame(100))
+    assert len(cache) == 0
+
+def test_narrower_queries_are_answered_from_broader_results():
+    cache = ResultCache()
+    cache.put('db', Query('c', {'course_id': 'x'}), frame(6))
+    df = cache.get('db', Query('c', {'course_id': 'x', 'username': 'u1'},
+        ['value']))
+    assert df.columns.tolist() == ['value']
+    assert df['value'].tolist() == [1., 4.]
+    # Regular expressions can't be evaluated in memory
+    assert cache.get('db', Query('c', {'course_id': 'x',
+        'username': {'$regex': 'u'}})) is None
+
+def test_invalidate_by_collection_and_course():
+    cache = ResultCache()
+    cache.put('db', Query('a', {'course_id': 'x'}), frame(1))
+    cache.put('db', Query('a', {'course_id': 'y'}), frame(1))
+    cache.put('db', Query('b', {'course_id': 'x'}), frame(1))
+    cache.invalidate('a', 'x')
+    assert len(cache) == 2
+    cache.invalidate(course_id = 'x')
+    assert len(cache) == 1
+    cache.invalidate()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+def test_disk_cache_round_trip(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    query = Query('derived_person_object_time', {'source': 1})
+    data = DataFrame({'username': ['a', None],
+        'time': pd.to_datetime(['2013-02-11', None]),
+        'detail': [{'correct': 1.}, np.NaN],
+        'source': [1, 1]},
+        columns = ['username', 'time', 'detail', 'source'])
+    assert cache.put('db', 'MITx/6.002x/2013', query, data, {'count': 2})
+
+    df = cache.get('db', 'MITx/6.002x/2013', query, {'count': 2})
+    assert df.columns.tolist() == data.columns.tolist()
+    assert df.dtypes.tolist() == data.dtypes.tolist()
+    assert df['username'].tolist() == ['a', None]
+    assert df['detail'][0] == {'correct': 1.}
+    assert df['time'].isnull().tolist() == [False, True]
+
+    # Stale or foreign results aren't used
+    assert cache.get('db', 'MITx/6.002x/2013', query, {'count': 3}) is None
+    assert cache.get('other', 'MITx/6.002x/2013', query, {'count': 2}) is None
+    assert cache.get('db', 'MITx/6.002x/2013', query, {'count': 2},
+        mongo_id = True) is None
+
+    cache.invalidate('MITx/6.002x/2013', 'derived_person_object_time')
+    assert cache.meta('MITx/6.002x/2013', query) is None
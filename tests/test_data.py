@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ..mongo.data import XData
+from ..mongo.catalogs.collections_catalog import CollectionsCatalog
+from ..mongo.strategies.collection import CollectionStrategy
+from ..munge.logger import ArrayLogger
+from .memory_client import MemoryClient
+
+class CountingClient(MemoryClient):
+    '''
+    MemoryClient recording the collections that are read
+    '''
+    def __init__(self):
+        MemoryClient.__init__(self)
+        self.reads = []
+
+    def read(self, collection_name, *args, **kwargs):
+        self.reads.append(collection_name)
+        return MemoryClient.read(self, collection_name, *args, **kwargs)
+
+class ScoresStrategy(CollectionStrategy):
+
+    def __init__(self):
+        self.created = 0
+
+    @property
+    def name(self):
+        return 'derived_scores'
+
+    def create(self, context):
+        self.created += 1
+        return DataFrame({'username': ['a', 'b', 'c'],
+            'score': [1., 2., 3.],
+            'course_id': context.course_id})
+
+class ScoresCatalog(CollectionsCatalog):
+
+    def __init__(self):
+        self['derived_scores'] = ScoresStrategy()
+
+def xdata(client = None):
+    return XData('c', ['db'], ['db'],
+        client = client if client is not None else CountingClient(),
+        logger = ArrayLogger(),
+        catalog = ScoresCatalog())
+
+def test_get_answers_from_the_computed_collection():
+    x = xdata()
+    df = x.get('derived_scores', {'score': {'$gte': 2}}, ['username'],
+        sort = [('score', -1)])
+    assert df.columns.tolist() == ['username']
+    assert df['username'].tolist() == ['c', 'b']
+    assert x.catalog['derived_scores'].created == 1
+
+    # Only the read finding that the collection is missing went to the 
+    #   database, and the collection has been stored
+    assert x.client.reads == ['derived_scores']
+    x.client.connect('db')
+    assert len(x.client.read('derived_scores')) == 3
+
+def test_get_reads_stored_collections():
+    x = xdata()
+    x.get('derived_scores')
+    df = xdata(x.client).get('derived_scores', {'username': 'a'})
+    assert df['score'].tolist() == [1.]
+    assert x.catalog['derived_scores'].created == 1
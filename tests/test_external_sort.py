@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ..munge.external_sort import ExternalSorter
+
+def records(n, seed = 0):
+    random = np.random.RandomState(seed)
+    return DataFrame({\
+        'username': random.choice(list('abcdefghij'), n),
+        'time': random.randint(0, 1000, n),
+        'value': np.arange(n)})
+
+def test_sorts_in_memory_without_spilling():
+    sorter = ExternalSorter(['username', 'time'])
+    data = records(50)
+    sorter.add(data[:20])
+    sorter.add(data[20:])
+    assert not sorter.spilled
+    assert len(sorter) == 50
+    sorted_data = pd.concat(list(sorter.chunks()))
+    expected = data.sort(['username', 'time'])
+    assert sorted_data['value'].tolist() == expected['value'].tolist()
+    sorter.close()
+
+def test_merges_several_spilled_runs():
+    data = records(500)
+    sorter = ExternalSorter(['username', 'time'], max_bytes = 1000,
+        block_size = 7)
+    for start in xrange(0, len(data), 40):
+        sorter.add(data[start:start + 40])
+    assert len(sorter.runs) > 2
+    directory = sorter._tmp
+
+    chunks = list(sorter.chunks())
+    # Chunks don't split users and are in order
+    usernames = [chunk['username'].unique().tolist() for chunk in chunks]
+    assert sum(usernames, []) == sorted(set(data['username']))
+    merged = pd.concat(chunks)
+    assert merged[['username', 'time']].values.tolist() == \
+        data.sort(['username', 'time'])[['username', 'time']].values.tolist()
+    assert sorted(merged['value']) == range(len(data))
+
+    sorter.close()
+    assert not os.path.exists(directory)
+
+def test_groups_drop_missing_usernames():
+    data = records(30)
+    data.loc[[3, 7], 'username'] = None
+    sorter = ExternalSorter('username', max_bytes = 100, block_size = 4)
+    sorter.add(data)
+    sorter.add(records(30, seed = 1))
+    groups = list(sorter.groups())
+    assert [key for key, _ in groups] == sorted(set(key for key, _ in groups))
+    assert sum(len(group) for _, group in groups) == 58
+    sorter.close()
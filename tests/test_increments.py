@@ -0,0 +1,92 @@
+from pandas import DataFrame
+
+from ..mongo.data import XData
+from ..mongo.catalogs.collections_catalog import CollectionsCatalog
+from ..mongo.strategies.derived.increments import latest_time, person_days
+from ..mongo.strategies.derived.person_day_time import PersonDayTimeStrategy
+from ..munge.logger import ArrayLogger
+from .memory_client import MemoryClient
+
+class DayCatalog(CollectionsCatalog):
+
+    def __init__(self):
+        self['derived_person_day_time'] = PersonDayTimeStrategy()
+
+def log(client, rows):
+    '''
+    Stores browser events in derived_person_object_time
+    '''
+    data = DataFrame(rows, columns = ['username', 'time'])
+    data['source'] = 1
+    data['course_id'] = 'c'
+    client.connect('db')
+    client.create(data, 'derived_person_object_time')
+
+def xdata(client):
+    return XData('c', ['db'], ['db'],
+        client = client,
+        logger = ArrayLogger(),
+        catalog = DayCatalog())
+
+def day_times(client):
+    client.connect('db')
+    data = client.read('derived_person_day_time',
+        sort = [('username', 1), ('date', 1)])
+    return [(r['username'], r['date'], r['time_spent'])
+        for _, r in data.iterrows()]
+
+def test_person_days_batches_users():
+    client = MemoryClient()
+    log(client, [['a', '2013-02-10T10:00:00'],
+        ['a', '2013-02-11T10:00:00'],
+        ['b', '2013-02-11T09:00:00'],
+        ['b', '2013-02-11T11:00:00'],
+        ['c', '2013-02-11T10:30:00'],
+        ['d', '2013-02-11T12:00:00']])
+    x = xdata(client)
+    assert latest_time(x) == '2013-02-11T12:00:00'
+
+    pot, scope, watermark = person_days(x, '2013-02-11T10:00:00',
+        fields = ['username', 'time'], batch_size = 2)
+    assert watermark == '2013-02-11T12:00:00'
+    # The users with new events are read from the date of since on,
+    #   including b's event before since
+    assert sorted(pot[['username', 'time']].values.tolist()) == \
+        [['b', '2013-02-11T09:00:00'], ['b', '2013-02-11T11:00:00'],
+         ['c', '2013-02-11T10:30:00'], ['d', '2013-02-11T12:00:00']]
+    assert [sorted(conditions['username']['$in']) for conditions in scope] \
+        == [['b', 'c'], ['d']]
+    assert all(conditions['date'] == {'$gte': '2013-02-11'}
+        for conditions in scope)
+
+    pot, scope, watermark = person_days(x, '2013-02-11T12:00:00')
+    assert pot.empty and scope is None
+    assert watermark == '2013-02-11T12:00:00'
+
+def test_refresh_only_recomputes_new_days():
+    client = MemoryClient()
+    log(client, [['a', '2013-02-10T10:00:00'],
+        ['a', '2013-02-10T10:00:30'],
+        ['a', '2013-02-11T10:00:00'],
+        ['a', '2013-02-11T10:00:10'],
+        ['b', '2013-02-11T09:00:00'],
+        ['b', '2013-02-11T09:00:20']])
+    x = xdata(client)
+    assert x.refresh(['derived_person_day_time']) == \
+        {'derived_person_day_time': '2013-02-11T10:00:10'}
+    assert day_times(client) == [('a', '2013-02-10', 30.),
+        ('a', '2013-02-11', 10.),
+        ('b', '2013-02-11', 20.)]
+
+    log(client, [['a', '2013-02-11T10:01:10'],
+        ['c', '2013-02-12T08:00:00'],
+        ['c', '2013-02-12T08:00:05']])
+    assert x.refresh(['derived_person_day_time']) == \
+        {'derived_person_day_time': '2013-02-12T08:00:05'}
+    # a's day is recomputed with its earlier events, and b's day and a's
+    #   previous day are kept
+    assert day_times(client) == [('a', '2013-02-10', 30.),
+        ('a', '2013-02-11', 70.),
+        ('b', '2013-02-11', 20.),
+        ('c', '2013-02-12', 5.)]
+    assert x.watermark('derived_person_day_time') == '2013-02-12T08:00:05'
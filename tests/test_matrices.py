@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ..mongo.data import XData
+from ..mongo.matrices import MatrixStore
+from ..munge.logger import ArrayLogger
+from ..munge.sparse import SparseFrame
+from .memory_client import MemoryClient
+
+def time_matrix():
+    return DataFrame({'username': ['a', 'b', 'c'],
+        'x': [1., 0., 3.],
+        'y': [0., 2., 0.],
+        'course_id': 'c'},
+        columns = ['username', 'x', 'y', 'course_id'])
+
+def test_dense_round_trip(tmpdir):
+    store = MatrixStore(str(tmpdir))
+    assert store.load('MITx/6.002x/2013', 'derived_time_matrix') is None
+    store.save('MITx/6.002x/2013', 'derived_time_matrix', time_matrix())
+    assert store.contains('MITx/6.002x/2013', 'derived_time_matrix')
+
+    data = store.load('MITx/6.002x/2013', 'derived_time_matrix')
+    assert data.columns.tolist() == ['username', 'x', 'y', 'course_id']
+    assert data['username'].tolist() == ['a', 'b', 'c']
+    assert data[['x', 'y']].values.tolist() == [[1, 0], [0, 2], [3, 0]]
+    assert (data['course_id'] == 'MITx/6.002x/2013').all()
+
+    # The values are copy on write
+    data['x'] = 10.
+    data = store.load('MITx/6.002x/2013', 'derived_time_matrix')
+    assert data['x'].tolist() == [1., 0., 3.]
+
+    store.delete('MITx/6.002x/2013', 'derived_time_matrix')
+    assert not store.contains('MITx/6.002x/2013', 'derived_time_matrix')
+
+def test_sparse_round_trip(tmpdir):
+    store = MatrixStore(str(tmpdir))
+    matrix = SparseFrame.from_frame(time_matrix())
+    store.save('c', 'derived_time_matrix', matrix)
+
+    loaded = store.load('c', 'derived_time_matrix', sparse = True)
+    assert isinstance(loaded, SparseFrame)
+    assert loaded.rows.tolist() == ['a', 'b', 'c']
+    assert loaded.columns.tolist() == ['x', 'y']
+    assert loaded.nnz == 3
+    assert (loaded.matrix.toarray() == matrix.matrix.toarray()).all()
+
+    dense = store.load('c', 'derived_time_matrix')
+    assert dense[['x', 'y']].values.tolist() == [[1, 0], [0, 2], [3, 0]]
+
+def xdata(tmpdir):
+    client = MemoryClient()
+    return XData('c', ['db'], ['db'],
+        client = client,
+        logger = ArrayLogger(),
+        matrix_dir = str(tmpdir))
+
+def test_delete_only_removes_matching_rows(tmpdir):
+    x = xdata(tmpdir)
+    x.matrices.save('c', 'derived_time_matrix', time_matrix())
+    x.delete('derived_time_matrix', ['db'],
+        {'username': {'$in': ['a', 'c']}})
+    data = x.matrices.load('c', 'derived_time_matrix')
+    assert data['username'].tolist() == ['b']
+
+    x.matrices.save('c', 'derived_time_matrix',
+        SparseFrame.from_frame(time_matrix()))
+    x.delete('derived_time_matrix', ['db'], {'username': 'b'})
+    data = x.matrices.load('c', 'derived_time_matrix', sparse = True)
+    assert data.rows.tolist() == ['a', 'c']
+    assert data.matrix.toarray().tolist() == [[1, 0], [3, 0]]
+
+def test_delete_refuses_conditions_it_cant_evaluate(tmpdir):
+    x = xdata(tmpdir)
+    x.matrices.save('c', 'derived_time_matrix', time_matrix())
+    try:
+        x.delete('derived_time_matrix', ['db'],
+            {'username': {'$regex': '^a'}})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Matrix deleted with unsupported conditions')
+    assert len(x.matrices.load('c', 'derived_time_matrix')) == 3
@@ -0,0 +1,87 @@
+import inspect
+
+import pytest
+import pandas as pd
+from pandas import DataFrame
+
+from ..mongo.clients.mongo_client import MongoClient
+
+mongomock = pytest.importorskip('mongomock')
+
+@pytest.fixture
+def client(monkeypatch):
+    '''
+    MongoClient on an in-memory mongomock server
+    '''
+    Collection = mongomock.collection.Collection
+    if 'fields' not in inspect.getargspec(Collection.find).args:
+        # Newer mongomock only has pymongo 3's projection
+        find = Collection.find
+        def find_fields(self, *args, **kwargs):
+            if 'fields' in kwargs:
+                kwargs['projection'] = kwargs.pop('fields')
+            return find(self, *args, **kwargs)
+        monkeypatch.setattr(Collection, 'find', find_fields)
+    server = mongomock.MongoClient()
+    monkeypatch.setattr(MongoClient, '_pool', classmethod(lambda cls: server))
+    monkeypatch.setattr(MongoClient, '_databases', {})
+    client = MongoClient(batch_size = 2)
+    client.connect('test')
+    return client
+
+def day_time(rows, course_id = None):
+    data = DataFrame(rows, columns = ['username', 'date', 'time_spent'])
+    if course_id is not None:
+        data['course_id'] = course_id
+    return data
+
+def documents(client):
+    collection = client._mdb.derived_person_day_time
+    found = collection.find({}, fields = {'_id': False})
+    return sorted((doc['course_id'], doc['username'], doc['date'],
+        doc['time_spent']) for doc in found)
+
+def test_keyed_update_only_rewrites_changes(client):
+    client.create(day_time([['a', '2013-02-11', 1.],
+            ['a', '2013-02-12', 2.],
+            ['b', '2013-02-11', 3.],
+            ['c', '2013-02-11', 4.]], 'x'),
+        'derived_person_day_time')
+    client.create(day_time([['a', '2013-02-11', 5.]], 'y'),
+        'derived_person_day_time')
+
+    # a's second day is gone, b's day changed, c has no rows and d is new
+    stats = client.update(day_time([['a', '2013-02-11', 1.],
+            ['b', '2013-02-11', 6.],
+            ['d', '2013-02-13', 7.]]),
+        'derived_person_day_time',
+        conditions = {'course_id': 'x'},
+        keys = ['username', 'date'])
+    assert stats == {'upserted': 2, 'removed': 2, 'unchanged': 1}
+
+    # The course_id of the conditions is kept in the upserted documents and
+    #   other courses are left alone
+    assert documents(client) == [('x', 'a', '2013-02-11', 1.),
+        ('x', 'b', '2013-02-11', 6.),
+        ('x', 'd', '2013-02-13', 7.),
+        ('y', 'a', '2013-02-11', 5.)]
+
+def test_keyed_update_within_a_batch_of_users(client):
+    client.create(day_time([['a', '2013-02-11', 1.],
+            ['b', '2013-02-11', 2.],
+            ['c', '2013-02-11', 3.]], 'x'),
+        'derived_person_day_time')
+    client.update(day_time([['a', '2013-02-12', 4.]]),
+        'derived_person_day_time',
+        conditions = {'course_id': 'x', 'username': {'$in': ['a', 'b']}},
+        keys = ['username', 'date'])
+    assert documents(client) == [('x', 'a', '2013-02-12', 4.),
+        ('x', 'c', '2013-02-11', 3.)]
+
+def test_datetimes_are_stored_as_epoch_milliseconds(client):
+    data = DataFrame({'username': ['a', 'b'],
+        'time': pd.to_datetime(['1970-01-01 00:00:01.5', None])})
+    client.create(data, 'events')
+    found = list(client._mdb.events.find({}, fields = {'_id': False}))
+    assert sorted(found) == sorted([{'username': 'a', 'time': 1500},
+        {'username': 'b', 'time': None}])
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ..mongo.query import Query, matches
+
+def events():
+    return DataFrame({'username': ['a', 'b', 'a', None],
+        'source': [1, 0, 1, 1],
+        'time': ['2013-02-11', '2013-02-12', '2013-02-10', '2013-02-13']})
+
+def test_query_is_hashable_and_immutable():
+    query = Query('tracking_log', {'username': 'a', 'time': {'$gt': 'x'}})
+    same = Query('tracking_log', {'time': {'$gt': 'x'}, 'username': 'a'})
+    assert query == same
+    assert hash(query) == hash(same)
+    assert len(set([query, same])) == 1
+
+    conditions = query.conditions
+    conditions['source'] = 1
+    assert 'source' not in query.conditions
+    try:
+        query.limit = 5
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError('Query can be changed')
+
+def test_find_refines_a_new_query():
+    query = Query('tracking_log', {'username': 'a'}, ['time'])
+    refined = query.find({'source': 1}, limit = 10)
+    assert refined.conditions == {'username': 'a', 'source': 1}
+    assert refined.fields == ['time']
+    assert refined.limit == 10
+    assert query.conditions == {'username': 'a'}
+    assert query.limit is None
+
+def test_matches_equality_operators_and_nulls():
+    data = events()
+    mask = matches(data, {'source': 1, 'time': {'$gte': '2013-02-11'}})
+    assert mask.tolist() == [True, False, False, True]
+    mask = matches(data, {'username': {'$in': ['b']}})
+    assert mask.tolist() == [False, True, False, False]
+    mask = matches(data, {'username': None})
+    assert mask.tolist() == [False, False, False, True]
+
+def test_matches_gives_up_on_what_it_cant_evaluate():
+    data = events()
+    assert matches(data, {'module_id': 'x'}) is None
+    assert matches(data, {'time': {'$regex': '^2013'}}) is None
+    assert matches(data, {'username': ['a', 'b']}) is None
+
+def test_covers_broader_queries():
+    broad = Query('tracking_log', {'course_id': 'c'})
+    narrow = Query('tracking_log', {'course_id': 'c', 'username': 'a'},
+        ['time'])
+    assert broad.covers(narrow)
+    assert not narrow.covers(broad)
+    assert not broad.covers(Query('tracking_logs', {'course_id': 'c'}))
+    assert not Query('tracking_log', {'course_id': 'd'}).covers(narrow)
+    # Limited results may be missing records of other queries
+    assert not broad.find(limit = 10).covers(narrow)
+
+def test_covers_needs_the_fields_of_the_residual():
+    projected = Query('tracking_log', {'course_id': 'c'}, ['time'])
+    assert not projected.covers(Query('tracking_log', {'course_id': 'c'}))
+    assert not projected.covers(Query('tracking_log',
+        {'course_id': 'c', 'username': 'a'}, ['time']))
+    assert projected.covers(Query('tracking_log', {'course_id': 'c'},
+        ['time'], sort = ['time']))
+
+def test_residual_answers_the_narrower_query():
+    broad = Query('tracking_log', {'source': 1})
+    narrow = Query('tracking_log', {'source': 1, 'username': 'a'},
+        ['time'], sort = ['time'])
+    residual = broad.residual(narrow)
+    assert residual.conditions == {'username': 'a'}
+
+    data = events()
+    results = residual.apply(data[matches(data, broad.conditions)])
+    assert results.columns.tolist() == ['time']
+    assert results['time'].tolist() == ['2013-02-10', '2013-02-11']
+
+def test_apply_sorts_like_mongo():
+    data = events()
+    results = Query('tracking_log', sort = [('username', -1),
+        ('time', 1)]).apply(data)
+    assert results['time'].tolist() == ['2013-02-12', '2013-02-10',
+        '2013-02-11', '2013-02-13']
+    results = Query('tracking_log', sort = ['username'], limit = 2).apply(data)
+    assert results['username'].tolist()[0] is None
+    assert len(results) == 2
+
+def test_apply_sorts_by_fields_that_arent_returned():
+    results = Query('tracking_log', fields = ['username'],
+        sort = ['time']).apply(events())
+    assert results.columns.tolist() == ['username']
+    assert results['username'].tolist() == ['a', 'a', 'b', None]
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ..munge.sparse import SparseFrame
+
+def test_from_records_sums_duplicates_and_skips_missing_labels():
+    matrix = SparseFrame.from_records(['b', 'a', 'b', 'a', None],
+        ['x', 'y', 'x', None, 'x'],
+        [1., 2., 3., 4., 5.])
+    assert matrix.rows.tolist() == ['a', 'b']
+    assert matrix.columns.tolist() == ['x', 'y']
+    assert matrix.shape == (2, 2)
+    assert matrix.nnz == 2
+    assert matrix.matrix.toarray().tolist() == [[0, 2], [4, 0]]
+
+def test_from_records_counts_without_values():
+    matrix = SparseFrame.from_records(['a', 'a', 'b'], ['x', 'y', 'x'])
+    assert matrix.to_frame().values.tolist() == [['a', 1, 1], ['b', 1, 0]]
+
+def test_frame_round_trip():
+    data = DataFrame({'username': ['a', 'b'],
+        'x': [0., 1.5],
+        'y': [2., 0.],
+        'course_id': 'c'},
+        columns = ['username', 'x', 'y', 'course_id'])
+    matrix = SparseFrame.from_frame(data)
+    assert len(matrix) == 2
+    assert matrix.nnz == 2
+
+    frame = matrix.to_frame()
+    assert frame.columns.tolist() == ['username', 'x', 'y']
+    assert frame.values.tolist() == [['a', 0., 2.], ['b', 1.5, 0.]]
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from pandas import Series, DataFrame
+
+from ..munge.time import to_datetimes, is_sorted, sessionize
+
+def events(rows):
+    data = DataFrame(rows, columns = ['username', 'time'])
+    data['time'] = to_datetimes(data['time'])
+    return data
+
+def durations(data):
+    return [None if np.isnan(d) else d for d in data['duration']]
+
+def test_to_datetimes_removes_trailing_d():
+    times = to_datetimes(['2013-02-11T10:00:00d', '2013-02-11T10:00:30'])
+    assert times.tolist() == [pd.Timestamp('2013-02-11 10:00:00'),
+        pd.Timestamp('2013-02-11 10:00:30')]
+
+def test_to_datetimes_returns_malformed():
+    times, malformed = to_datetimes(Series(['2013-02-11T10:00:00', 'never',
+        None], index = [3, 4, 5]), malformed = True)
+    assert times.index.tolist() == [3, 4, 5]
+    assert times.isnull().tolist() == [False, True, True]
+    assert malformed.to_dict() == {4: 'never'}
+
+def test_to_datetimes_mixes_offsets_and_naive_timestamps():
+    times = to_datetimes(['2013-02-11T10:00:00', '2013-02-11T10:00:00+02:00',
+        '2013-02-11T10:00:00'])
+    # Timestamps with offsets are converted to UTC, naive ones are kept
+    assert times.tolist() == [pd.Timestamp('2013-02-11 10:00:00'),
+        pd.Timestamp('2013-02-11 08:00:00'),
+        pd.Timestamp('2013-02-11 10:00:00')]
+
+def test_is_sorted():
+    data = events([['a', '2013-02-11T10:00:00'], ['a', '2013-02-11T10:00:30'],
+        ['b', '2013-02-11T09:00:00']])
+    assert is_sorted(data)
+    assert not is_sorted(data.iloc[[2, 0, 1]])
+    assert not is_sorted(data.iloc[[1, 0, 2]])
+
+def test_sessionize_durations_and_sessions():
+    data = events([['b', '2013-02-11T10:00:00'],
+        ['a', '2013-02-11T12:00:00'],
+        ['a', '2013-02-11T10:00:30'],
+        ['a', '2013-02-11T10:00:00'],
+        ['a', '2013-02-11T10:00:31']])
+    result = sessionize(data, session_ids = True)
+    assert result['username'].tolist() == ['a', 'a', 'a', 'a', 'b']
+    # The gap of more than max_time ends a's first session, and the last
+    #   events of the users have no duration
+    assert durations(result) == [30., 1., None, None, None]
+    assert result['session'].tolist() == [0, 0, 0, 1, 2]
+
+def test_sessionize_min_time_keeps_the_session():
+    data = events([['a', '2013-02-11T10:00:00'],
+        ['a', '2013-02-11T10:00:01'],
+        ['a', '2013-02-11T10:00:31']])
+    result = sessionize(data, min_time = 5, session_ids = True,
+        presorted = True)
+    assert durations(result) == [None, 30., None]
+    assert result['session'].tolist() == [0, 0, 0]
+
+def test_sessionize_by_several_columns():
+    data = events([['a', '2013-02-11T23:59:00'],
+        ['a', '2013-02-12T00:00:30']])
+    data['date'] = ['2013-02-11', '2013-02-12']
+    assert durations(sessionize(data)) == [90., None]
+    assert durations(sessionize(data, by = ['username', 'date'])) == \
+        [None, None]
+
+def test_sessionize_empty():
+    result = sessionize(events([['a', '2013-02-11T10:00:00']])[:0],
+        session_ids = True)
+    assert result.empty
+    assert 'duration' in result and 'session' in result
@@ -0,0 +1,120 @@
+import pytest
+from pandas import DataFrame
+
+from ..mongo.data import XData
+from ..mongo.catalogs.collections_catalog import CollectionsCatalog
+from ..mongo.strategies.derived.time_attribution import TimeAttribution
+from ..mongo.strategies.derived.time_matrix import TimeMatrixStrategy
+from ..mongo.strategies.derived.person_module import PersonModuleStrategy
+from ..mongo.strategies.derived.person_day_time import PersonDayTimeStrategy
+from ..munge.logger import ArrayLogger
+from .test_data import CountingClient
+
+# Browser events of derived_person_object_time, not in order
+EVENTS = [['b', '2013-02-11T09:00:10', 'm2'],
+    ['a', '2013-02-11T10:00:30', 'm2'],
+    ['a', '2013-02-11T10:00:00', 'm1'],
+    ['a', '2013-02-11T12:00:00', 'm2'],
+    ['a', '2013-02-11T10:01:30', 'm1'],
+    ['a', '2013-02-12T00:00:30', 'm2'],
+    ['a', '2013-02-11T23:59:00', 'm1'],
+    ['b', '2013-02-11T09:00:00', 'm2']]
+
+# Time spent computed by hand like the original per-user strategies: gaps of
+#   max_time or more aren't counted, and daily time only counts the gaps
+#   between events on the same date
+TIME_MATRIX = {'m1': {'a': 120., 'b': 0.}, 'm2': {'a': 60., 'b': 10.}}
+PERSON_MODULE = [('a', 'm1', 120., 3), ('a', 'm2', 60., 3),
+    ('b', 'm2', 10., 2)]
+PERSON_DAY_TIME = [('a', '2013-02-11', 90.), ('a', '2013-02-12', 0.),
+    ('b', '2013-02-11', 10.)]
+
+def events(rows = EVENTS):
+    return DataFrame(rows, columns = ['username', 'time', 'module_id'])
+
+def person_module(data):
+    return [(r['username'], r['module_id'], r['time_spent'], r['freq'])
+        for _, r in data.iterrows()]
+
+def person_day_time(data):
+    return [(r['username'], r['date'], r['time_spent'])
+        for _, r in data.iterrows()]
+
+def test_strategies_match_hand_computed_times():
+    assert TimeMatrixStrategy().from_data(events()).to_dict() == TIME_MATRIX
+    sparse = TimeMatrixStrategy().from_data(events(), sparse = True)
+    assert sparse.to_frame().set_index('username').fillna(0).to_dict() == \
+        TIME_MATRIX
+    assert person_module(PersonModuleStrategy().from_data(events())) == \
+        PERSON_MODULE
+    assert person_day_time(PersonDayTimeStrategy().from_data(events())) == \
+        PERSON_DAY_TIME
+
+def test_min_and_max_time():
+    attribution = TimeAttribution(events(), max_time = 60, min_time = 20)
+    # Gaps of 30 seconds count, 10 seconds don't, and the gaps of 60 seconds
+    #   or more end sessions
+    assert person_module(attribution.person_module()) == [('a', 'm1', 30., 3)]
+
+def test_malformed_timestamps_are_skipped():
+    attribution = TimeAttribution(events(EVENTS + [['b', 'never', 'm1']]))
+    assert attribution.malformed == 1
+    assert attribution.examples == ['never']
+    # The interaction is still counted
+    assert person_module(attribution.person_module()) == PERSON_MODULE
+    assert attribution.time_matrix().to_dict() == TIME_MATRIX
+
+def chunked(data, size = 3):
+    return (data[start:start + size] for start in xrange(0, len(data), size))
+
+def test_chunks_match_a_frame():
+    ordered = events().sort(['username', 'time'])
+    # Presorted chunks are attributed a few users at a time, and other chunks
+    #   that exceed max_bytes are sorted on disk
+    for data, presorted in [(chunked(ordered), True),
+            (chunked(ordered, size = 1), True),
+            (chunked(events()), False)]:
+        attribution = TimeAttribution(data,
+            presorted = presorted,
+            max_bytes = 100)
+        assert attribution.time_matrix().to_dict() == TIME_MATRIX
+        assert person_module(attribution.person_module()) == PERSON_MODULE
+        assert person_day_time(attribution.person_day_time()) == \
+            PERSON_DAY_TIME
+
+def test_presorted_chunks_out_of_order():
+    with pytest.raises(ValueError):
+        TimeAttribution(chunked(events()), presorted = True)
+
+class TimeCatalog(CollectionsCatalog):
+
+    def __init__(self):
+        for strategy in [TimeMatrixStrategy(), PersonModuleStrategy(),
+                PersonDayTimeStrategy()]:
+            self[strategy.name] = strategy
+
+def test_compute_all_reads_the_events_once():
+    client = CountingClient()
+    client.connect('db')
+    pot = events()
+    pot['source'] = 1
+    pot['course_id'] = 'c'
+    client.create(pot, 'derived_person_object_time')
+
+    x = XData('c', ['db'], ['db'],
+        client = client,
+        logger = ArrayLogger(),
+        catalog = TimeCatalog())
+    x.compute_all()
+    assert client.reads.count('derived_person_object_time') == 1
+
+    # The attribution isn't kept once the collections are computed
+    assert x._intermediates == {}
+
+    client.connect('db')
+    time_matrix = client.read('derived_time_matrix').set_index('username')
+    assert time_matrix[['m1', 'm2']].to_dict() == TIME_MATRIX
+    assert person_module(client.read('derived_person_module',
+        sort = [('username', 1), ('module_id', 1)])) == PERSON_MODULE
+    assert person_day_time(client.read('derived_person_day_time',
+        sort = [('username', 1), ('date', 1)])) == PERSON_DAY_TIME
@@ -0,0 +1,46 @@
+import threading
+
+from ..mongo.writer import WriteBehindQueue
+from ..mongo.exceptions import WriteBehindError
+
+def test_writes_with_a_key_run_in_order():
+    writer = WriteBehindQueue(workers = 3)
+    written = []
+    for i in range(20):
+        writer.put(i % 2, written.append, i)
+    writer.flush()
+    assert [i for i in written if i % 2 == 0] == range(0, 20, 2)
+    assert [i for i in written if i % 2 == 1] == range(1, 20, 2)
+    assert not writer.pending()
+    writer.close()
+
+def test_flush_raises_errors_once_every_write_is_done():
+    writer = WriteBehindQueue(workers = 2)
+    written = []
+    def fail(i):
+        raise IOError('write {0} failed'.format(i))
+    writer.put('a', fail, 0)
+    writer.put('a', written.append, 1)
+    writer.put('b', fail, 2)
+    writer.put('b', written.append, 3)
+    try:
+        writer.flush()
+    except WriteBehindError as e:
+        assert len(e.errors) == 2
+    else:
+        raise AssertionError('Failed writes weren\'t raised')
+    assert sorted(written) == [1, 3]
+    # Errors are only raised once
+    writer.flush()
+    writer.close()
+
+def test_flush_only_waits_for_keys():
+    writer = WriteBehindQueue(workers = 2)
+    release = threading.Event()
+    writer.put('slow', release.wait)
+    writer.put('fast', lambda: None)
+    writer.flush(['fast'])
+    assert writer.pending(['slow'])
+    release.set()
+    writer.flush()
+    writer.close()